@@ -2,8 +2,9 @@ from flask import Flask, request, jsonify
 from flask_cors import CORS  # Import CORS
 import os
 from dotenv import load_dotenv
-import requests
 from datetime import datetime
+import upstream
+from directory import DirectoryCache
 
 load_dotenv()
 app = Flask(__name__)
@@ -16,6 +17,9 @@ def healthcheck():
 
 employee_url = os.getenv("EMPLOYEE_URL")
 wfhRequest_url = os.getenv("WFHREQUESTS_URL")
+employee_directory = DirectoryCache(employee_url + "/" if employee_url else None)
+# Longest span /attendance/range answers in one call, the same as /wfhRequests/range upstream
+MAX_RANGE_DAYS = 92
 
 
 @app.route("/attendance/", methods=["GET"])
@@ -35,9 +39,43 @@ def get_attendance_by_date():
         }
         return output_data, 400
 
-    # Fetch WFH requests for the specified date
-    wfhRequests = requests.get(wfhRequest_url + '/date/' + date)
-    wfhRequests_details = wfhRequests.json()
+    dept = request.args.get('dept')
+    summary = request.args.get('summary')
+    reporting_manager = request.args.get('reporting_manager')
+    if (reporting_manager and not reporting_manager.isdigit()) or summary not in (None, 'counts'):
+        output_data = {
+            "status_code": 400,
+            "message": "reporting_manager must be a staff ID and summary, if given, must be 'counts'.",
+            "data": None
+        }
+        return output_data, 400
+    reporting_manager = int(reporting_manager) if reporting_manager else None
+
+    # Only approved entries are shown, and a department filter is applied upstream as well
+    wfh_params = {"status": "Approved"}
+    if dept:
+        wfh_params["dept"] = dept
+
+    # The WFH requests for the date are fetched while the directory cache revalidates, if it is due to
+    directory_future = upstream.submit(employee_directory.get)
+    try:
+        if reporting_manager is not None:
+            # A team is defined by the directory, so its WFH query waits for the (normally cached) directory
+            team = [staff_id for staff_id, employee in directory_future.result().items()
+                    if employee.get('reporting_manager') == reporting_manager]
+            wfh_params["requester_ids"] = ",".join(str(staff_id) for staff_id in sorted(team))
+        wfh_future = upstream.submit(upstream.get_json, wfhRequest_url + '/date/' + date, wfh_params)
+        wfhRequests_details = wfh_future.result()
+        directory = directory_future.result()
+    except upstream.UpstreamError as e:
+        return upstream_unavailable(e)
+
+    # The cached directory is filtered in process rather than fetched again per filter
+    directory = {
+        staff_id: employee for staff_id, employee in directory.items()
+        if (not dept or employee['dept'] == dept)
+        and (reporting_manager is None or employee.get('reporting_manager') == reporting_manager)
+    }
 
     # Initialize a set to store unique requester_ids for approved entries
     approved_requester_ids = set()
@@ -60,39 +98,36 @@ def get_attendance_by_date():
                         'workingFromHome': True
                     })
 
-    # Convert the set to a list if needed
-    approved_requester_ids_list = list(approved_requester_ids)
+    employee_details = resolve_employees(approved_requester_ids, directory)
 
     # Incorporate employee details into approved entries
-    for requester_id in approved_requester_ids_list:
-        employee_details = get_employee_details(requester_id)
-
-        if employee_details:
-            # Update employee details in the attendance details
-            for attendance in attendance_details:
-                if attendance['requester_id'] == requester_id:
-                    attendance["employee_name"] = employee_details.get('name')
-                    attendance["dept"] = employee_details.get('dept')
-
-    # Fetch all employees
-    all_employees_response = requests.get(employee_url + "/")
-    all_employees_data = all_employees_response.json()
-
-    if all_employees_data['status_code'] == 200:
-        for employee in all_employees_data['data']:
-            staff_id = employee['staff_id']
-            # Add all employees with their working status
-            if staff_id not in approved_requester_ids:
-                attendance_details.append({
-                    "request_id": None,
-                    "requester_id": staff_id,
-                    "employee_name": f"{employee['staff_fname']} {employee['staff_lname']}",
-                    "dept": employee["dept"],
-                    'workingFromHome': False,  # Not in approved list
-                    "date": None,  # Not applicable for regular employees
-                    "duration": None,
-                    "reason": None
-                })
+    for attendance in attendance_details:
+        details = employee_details.get(attendance['requester_id'])
+        if details:
+            attendance["employee_name"] = details.get('name')
+            attendance["dept"] = details.get('dept')
+
+    for staff_id, employee in directory.items():
+        # Add all employees with their working status
+        if staff_id not in approved_requester_ids:
+            attendance_details.append({
+                "request_id": None,
+                "requester_id": staff_id,
+                "employee_name": f"{employee['staff_fname']} {employee['staff_lname']}",
+                "dept": employee["dept"],
+                'workingFromHome': False,  # Not in approved list
+                "date": None,  # Not applicable for regular employees
+                "duration": None,
+                "reason": None
+            })
+
+    if summary == 'counts':
+        output_data = {
+            "status_code": 200,
+            "message": "Attendance counts",
+            "data": attendance_counts(attendance_details)
+        }
+        return output_data, 200
 
     output_data = {
         "status_code": 200,
@@ -102,27 +137,134 @@ def get_attendance_by_date():
     return output_data, 200
 
 
+def attendance_counts(attendance_details):
+    """Head counts working from home and in the office, overall and per department."""
+    working_from_home = {record['requester_id'] for record in attendance_details if record['workingFromHome']}
+    departments = {}
+    for record in attendance_details:
+        counts = departments.setdefault(record['dept'] or '', {"working_from_home": 0, "in_office": 0})
+        counts["working_from_home" if record['workingFromHome'] else "in_office"] += 1
+    return {
+        "total": len({record['requester_id'] for record in attendance_details}),
+        "working_from_home": len(working_from_home),
+        "in_office": sum(not record['workingFromHome'] for record in attendance_details),
+        "by_dept": departments
+    }
+
+
 
 
     
 
-def get_employee_details(staff_id):
+@app.route("/attendance/range", methods=["GET"])
+def get_attendance_by_range():
     try:
-        response = requests.get(employee_url + "/", params={"staff_id": staff_id})
-        response_data = response.json() 
-        
+        start = datetime.strptime(request.args.get('start') or '', "%Y-%m-%d").date()
+        end = datetime.strptime(request.args.get('end') or '', "%Y-%m-%d").date()
+    except ValueError:
+        output_data = {
+            "status_code": 400,
+            "message": "Invalid date format. Please use YYYY-MM-DD for start and end.",
+            "data": None
+        }
+        return output_data, 400
+
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        output_data = {
+            "status_code": 400,
+            "message": f"end must not be before start, and the range cannot exceed {MAX_RANGE_DAYS} days.",
+            "data": None
+        }
+        return output_data, 400
+
+    # One range query for the approved entries of every day, alongside the directory lookup
+    wfh_future = upstream.submit(upstream.get, wfhRequest_url + '/range',
+                                 {"start": start.isoformat(), "end": end.isoformat(), "status": "Approved"})
+    directory_future = upstream.submit(employee_directory.get)
+    try:
+        wfh_response = wfh_future.result()
+        wfh_range = upstream.json_body(wfh_response)
+        # A range the wfhRequests service rejects is the caller's error, not an outage, so it is passed through
+        if 400 <= wfh_response.status_code < 500:
+            return wfh_range, wfh_response.status_code
+        directory = directory_future.result()
+    except upstream.UpstreamError as e:
+        return upstream_unavailable(e)
+    if wfh_response.status_code != 200 or wfh_range.get('status_code') != 200:
+        return upstream_unavailable(f"GET {wfhRequest_url}/range returned {wfh_response.status_code}")
+
+    # Each day lists its WFH entries and the staff_ids in the office; names and departments are given once in employees
+    days = {}
+    requester_ids = set()
+    for day, entries in wfh_range['data'].items():
+        wfh = [{
+            "request_id": entry['request_id'],
+            "requester_id": entry['requester_id'],
+            "duration": entry['duration'],
+            "reason": entry['reason'],
+        } for entry in entries]
+        wfh_ids = {record['requester_id'] for record in wfh}
+        requester_ids |= wfh_ids
+        days[day] = {
+            "wfh": wfh,
+            "office": [staff_id for staff_id in directory if staff_id not in wfh_ids],
+        }
+
+    employees = {staff_id: employee_summary(employee) for staff_id, employee in directory.items()}
+    employees.update(resolve_employees(requester_ids - directory.keys(), directory))
+
+    output_data = {
+        "status_code": 200,
+        "message": "Attendance details by date range",
+        "data": {
+            "employees": employees,
+            "days": days
+        }
+    }
+    return output_data, 200
+
+
+def upstream_unavailable(error):
+    print(f"Upstream call failed: {error}")
+    output_data = {
+        "status_code": 502,
+        "message": "An upstream service is unavailable, please retry.",
+        "data": None
+    }
+    return output_data, 502
+
+
+def employee_summary(employee):
+    return {
+        "name": f"{employee['staff_fname']} {employee['staff_lname']}",
+        "dept": employee["dept"]
+    }
+
+
+def resolve_employees(staff_ids, directory):
+    """Name and department for each staff_id, from the directory or, for any it lacks, one batch call."""
+    employee_details = {staff_id: employee_summary(directory[staff_id]) for staff_id in staff_ids if staff_id in directory}
+    employee_details.update(get_employees_details(set(staff_ids) - directory.keys()))
+    return employee_details
+
+
+def get_employees_details(staff_ids):
+    """Name and department for each staff_id, fetched with one /employees/batch call."""
+    if not staff_ids:
+        return {}
+    try:
+        response_data = upstream.post_json(employee_url + "/batch", {"staff_ids": sorted(staff_ids)})
+
         if response_data['status_code'] == 200:
-            if response_data['data']:
-                employee = response_data['data'][0]
-                
-                return {
-                    "name": f"{employee['staff_fname']} {employee['staff_lname']}",
-                    "dept": employee["dept"]
-                }
-        return None
+            return {employee['staff_id']: employee_summary(employee) for employee in response_data['data']}
+        return {}
     except Exception as e:
-        print(f"Error fetching employee details for staff_id {staff_id}: {e}")
-        return None
+        print(f"Error fetching employee details for staff_ids {sorted(staff_ids)}: {e}")
+        return {}
+
+
+def get_employee_details(staff_id):
+    return get_employees_details({staff_id}).get(staff_id)
 
     
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""Measure GET /attendance/ latency against local stub upstreams.
+
+Run from backend/attendance:
+
+    python -m benchmarks.latency_benchmark [rounds]
+
+A stub HTTP server stands in for the wfhRequests and employee services and
+delays each response by a fixed amount. With the upstream calls made
+concurrently, the end-to-end latency should track the slowest upstream
+rather than the sum of both.
+"""
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds each stubbed upstream takes to answer
+DELAYS = {"/wfhRequests/date/": 0.08, "/employees/": 0.05}
+STAFF_COUNT = 550
+WFH_COUNT = 300
+
+
+def stub_response(path):
+    if path.startswith("/wfhRequests/date/"):
+        return {"status_code": 200, "data": [
+            {"requester_id": staff_id, "entries": [
+                {"request_id": staff_id, "status": "Approved", "duration": "Full Day", "reason": "", "entry_date": path[-10:]}
+            ]}
+            for staff_id in range(1, WFH_COUNT + 1)
+        ]}
+    return {"status_code": 200, "data": [
+        {"staff_id": staff_id, "staff_fname": "Staff", "staff_lname": str(staff_id), "dept": "Sales"}
+        for staff_id in range(1, STAFF_COUNT + 1)
+    ]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        time.sleep(next(delay for prefix, delay in DELAYS.items() if path.startswith(prefix)))
+        body = json.dumps(stub_response(path)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(rounds):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    os.environ["WFHREQUESTS_URL"] = f"{base_url}/wfhRequests"
+    os.environ["EMPLOYEE_URL"] = f"{base_url}/employees"
+
+    # Imported after the stub URLs are in the environment
+    from app import app
+
+    client = app.test_client()
+    try:
+        latencies = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            response = client.get("/attendance/?date=2024-10-30")
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                raise SystemExit(f"GET failed with {response.status_code}: {response.get_data(as_text=True)}")
+    finally:
+        server.shutdown()
+
+    p95 = statistics.quantiles(latencies, n=20)[-1] if rounds > 1 else latencies[0]
+    print(f"{rounds} rounds, upstream delays {', '.join(f'{path} {delay * 1000:.0f}ms' for path, delay in DELAYS.items())}")
+    print(f"{'median':>10}{'p95':>10}{'max(up)':>10}{'sum(up)':>10}")
+    print(f"{statistics.median(latencies) * 1000:>8.1f}ms{p95 * 1000:>8.1f}ms"
+          f"{max(DELAYS.values()) * 1000:>8.0f}ms{sum(DELAYS.values()) * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
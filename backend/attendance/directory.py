@@ -0,0 +1,67 @@
+"""In-process cache of the employee directory.
+
+The directory changes rarely, so attendance keeps the last copy it fetched
+from the employee service. Within DIRECTORY_TTL_SECONDS it is served without
+any upstream call. After that it is revalidated with If-None-Match, and a
+304 keeps the cached copy for another TTL without transferring it again.
+If revalidation fails, the stale copy is still served until it is
+DIRECTORY_MAX_STALE_SECONDS old; past that the failure is raised.
+"""
+import os
+import threading
+import time
+
+import upstream
+
+TTL_SECONDS = float(os.getenv("DIRECTORY_TTL_SECONDS", 300))
+MAX_STALE_SECONDS = float(os.getenv("DIRECTORY_MAX_STALE_SECONDS", 3600))
+
+
+class DirectoryCache:
+    def __init__(self, url, ttl=TTL_SECONDS, max_stale=MAX_STALE_SECONDS, clock=time.monotonic):
+        self.url = url
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.clock = clock
+        self._employees = None
+        self._etag = None
+        # When the cached copy was last fetched or confirmed unchanged
+        self._validated_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Map staff_id to employee record, fetching or revalidating only when the TTL has passed."""
+        if self._fresh():
+            return self._employees
+        # One thread revalidates; the others wait and then reuse its result
+        with self._lock:
+            if self._fresh():
+                return self._employees
+            try:
+                self._revalidate()
+            except upstream.UpstreamError:
+                if self._employees is None or self.clock() - self._validated_at > self.max_stale:
+                    raise
+                print(f"Serving the cached employee directory after a failed revalidation of {self.url}")
+            return self._employees
+
+    def invalidate(self):
+        with self._lock:
+            self._employees = self._etag = self._validated_at = None
+
+    def _fresh(self):
+        return self._employees is not None and self.clock() - self._validated_at < self.ttl
+
+    def _revalidate(self):
+        headers = {"If-None-Match": self._etag} if self._etag and self._employees is not None else None
+        response = upstream.get(self.url, headers=headers)
+        if response.status_code == 304:
+            self._validated_at = self.clock()
+            return
+
+        data = upstream.json_body(response)
+        if response.status_code != 200 or data.get('status_code') != 200:
+            raise upstream.UpstreamError(f"GET {self.url} returned {response.status_code}")
+        self._employees = {employee['staff_id']: employee for employee in data['data']}
+        self._etag = response.headers.get("ETag")
+        self._validated_at = self.clock()
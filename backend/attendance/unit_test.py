@@ -1,5 +1,9 @@
 import unittest
+from unittest.mock import patch, MagicMock
+import requests
 from app import app, get_employee_details
+from directory import DirectoryCache
+import upstream
 import json
 import logging
 
@@ -121,5 +125,208 @@ class AttendanceServiceTestCase(unittest.TestCase):
         self.assertTrue(employee_details["name"])
         self.assertTrue(employee_details["dept"])
 
+    def mock_upstreams(self, mock_request, responses):
+        def respond(method, url, **kwargs):
+            body = responses[(method, url)]
+            if isinstance(body, Exception):
+                raise body
+            # A (status, body) pair stands for a response other than 200
+            status_code, body = body if isinstance(body, tuple) else (200, body)
+            return MagicMock(status_code=status_code, headers={}, json=MagicMock(return_value=body))
+        mock_request.side_effect = respond
+
+    @patch('app.employee_url', 'http://employee/employees')
+    @patch('app.employee_directory', DirectoryCache('http://employee/employees/'))
+    @patch('app.wfhRequest_url', 'http://wfhrequests/wfhRequests')
+    @patch('upstream.session.request')
+    def test_requesters_resolved_without_per_person_calls(self, mock_request):
+        wfh_requests = [
+            {"requester_id": staff_id, "entries": [
+                {"request_id": staff_id, "status": "Approved", "duration": "Full Day", "reason": "", "entry_date": "2024-10-30"}
+            ]}
+            for staff_id in range(1, 301)
+        ]
+        directory = [
+            {"staff_id": staff_id, "staff_fname": "Staff", "staff_lname": str(staff_id), "dept": "Sales"}
+            for staff_id in range(1, 300)
+        ]
+        self.mock_upstreams(mock_request, {
+            ("GET", "http://wfhrequests/wfhRequests/date/2024-10-30"): {"data": wfh_requests},
+            ("GET", "http://employee/employees/"): {"status_code": 200, "data": directory},
+            ("POST", "http://employee/employees/batch"): {"status_code": 200, "data": [
+                {"staff_id": 300, "staff_fname": "New", "staff_lname": "Joiner", "dept": "IT"}
+            ]},
+        })
+
+        response = self.app.get('/attendance/?date=2024-10-30')
+
+        data = json.loads(response.data)['data']
+        self.assertEqual(len(data), 300)
+        self.assertTrue(all(record['employee_name'] for record in data))
+        # The directory covers all but one requester, who is looked up in a single batch call
+        self.assertEqual(mock_request.call_count, 3)
+        batch_call, = [call for call in mock_request.call_args_list if call.args[0] == "POST"]
+        self.assertEqual(batch_call.kwargs['json'], {"staff_ids": [300]})
+        # Every upstream call is bounded
+        self.assertTrue(all(call.kwargs['timeout'] for call in mock_request.call_args_list))
+
+    @patch('app.employee_url', 'http://employee/employees')
+    @patch('app.employee_directory', DirectoryCache('http://employee/employees/'))
+    @patch('app.wfhRequest_url', 'http://wfhrequests/wfhRequests')
+    @patch('upstream.session.request')
+    def test_unreachable_upstream_returns_bad_gateway(self, mock_request):
+        self.mock_upstreams(mock_request, {
+            ("GET", "http://wfhrequests/wfhRequests/date/2024-10-30"): {"data": []},
+            ("GET", "http://employee/employees/"): requests.Timeout("read timed out"),
+        })
+
+        response = self.app.get('/attendance/?date=2024-10-30')
+
+        self.assertEqual(response.status_code, 502)
+
+    @patch('app.employee_url', 'http://employee/employees')
+    @patch('app.employee_directory', DirectoryCache('http://employee/employees/'))
+    @patch('app.wfhRequest_url', 'http://wfhrequests/wfhRequests')
+    @patch('upstream.session.request')
+    def test_team_filter_and_counts(self, mock_request):
+        directory = [
+            {"staff_id": 1, "staff_fname": "Team", "staff_lname": "Lead", "dept": "Sales", "reporting_manager": 9},
+            {"staff_id": 2, "staff_fname": "Team", "staff_lname": "Member", "dept": "Sales", "reporting_manager": 1},
+            {"staff_id": 3, "staff_fname": "Other", "staff_lname": "Member", "dept": "Sales", "reporting_manager": 1},
+            {"staff_id": 4, "staff_fname": "Other", "staff_lname": "Team", "dept": "IT", "reporting_manager": 9},
+        ]
+        wfh_requests = [{"requester_id": 2, "entries": [
+            {"request_id": 5, "status": "Approved", "duration": "Full Day", "reason": "", "entry_date": "2024-10-30"}
+        ]}]
+        self.mock_upstreams(mock_request, {
+            ("GET", "http://wfhrequests/wfhRequests/date/2024-10-30"): {"status_code": 200, "data": wfh_requests},
+            ("GET", "http://employee/employees/"): {"status_code": 200, "data": directory},
+        })
+
+        response = self.app.get('/attendance/?date=2024-10-30&reporting_manager=1')
+
+        data = json.loads(response.data)['data']
+        self.assertEqual(sorted((record['requester_id'], record['workingFromHome']) for record in data), [(2, True), (3, False)])
+        # The team's staff IDs and the approved status go upstream with the WFH query
+        wfh_call, = [call for call in mock_request.call_args_list if '/date/' in call.args[1]]
+        self.assertEqual(wfh_call.kwargs['params'], {"status": "Approved", "requester_ids": "2,3"})
+
+        response = self.app.get('/attendance/?date=2024-10-30&dept=Sales&summary=counts')
+
+        self.assertEqual(json.loads(response.data)['data'], {
+            "total": 3, "working_from_home": 1, "in_office": 2,
+            "by_dept": {"Sales": {"working_from_home": 1, "in_office": 2}},
+        })
+        wfh_call = [call for call in mock_request.call_args_list if '/date/' in call.args[1]][-1]
+        self.assertEqual(wfh_call.kwargs['params'], {"status": "Approved", "dept": "Sales"})
+
+    def test_rejects_bad_filters(self):
+        self.assertEqual(self.app.get('/attendance/?date=2024-10-30&reporting_manager=abc').status_code, 400)
+        self.assertEqual(self.app.get('/attendance/?date=2024-10-30&summary=full').status_code, 400)
+
+    @patch('app.employee_url', 'http://employee/employees')
+    @patch('app.employee_directory', DirectoryCache('http://employee/employees/'))
+    @patch('app.wfhRequest_url', 'http://wfhrequests/wfhRequests')
+    @patch('upstream.session.request')
+    def test_range_returns_rosters_per_day(self, mock_request):
+        entry = {"request_id": 7, "requester_id": 2, "duration": "AM", "reason": "Plumber", "status": "Approved"}
+        self.mock_upstreams(mock_request, {
+            ("GET", "http://wfhrequests/wfhRequests/range"): {"status_code": 200, "data": {
+                "2024-10-01": [], "2024-10-02": [dict(entry, entry_date="2024-10-02")], "2024-10-03": [],
+            }},
+            ("GET", "http://employee/employees/"): {"status_code": 200, "data": [
+                {"staff_id": staff_id, "staff_fname": "Staff", "staff_lname": str(staff_id), "dept": "Sales"} for staff_id in (1, 2, 3)
+            ]},
+        })
+
+        response = self.app.get('/attendance/range?start=2024-10-01&end=2024-10-03')
+
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual(data['employees']['2'], {"name": "Staff 2", "dept": "Sales"})
+        self.assertEqual(data['days']['2024-10-01'], {"wfh": [], "office": [1, 2, 3]})
+        self.assertEqual(data['days']['2024-10-02'], {
+            "wfh": [{"request_id": 7, "requester_id": 2, "duration": "AM", "reason": "Plumber"}], "office": [1, 3]
+        })
+        # One upstream call for the whole range, plus the directory
+        self.assertEqual(mock_request.call_count, 2)
+        range_call, = [call for call in mock_request.call_args_list if call.args[1].endswith('/range')]
+        self.assertEqual(range_call.kwargs['params'], {"start": "2024-10-01", "end": "2024-10-03", "status": "Approved"})
+
+    @patch('app.employee_url', 'http://employee/employees')
+    @patch('app.employee_directory', DirectoryCache('http://employee/employees/'))
+    @patch('app.wfhRequest_url', 'http://wfhrequests/wfhRequests')
+    @patch('upstream.session.request')
+    def test_range_passes_upstream_client_errors_through(self, mock_request):
+        directory = {"status_code": 200, "data": []}
+        self.mock_upstreams(mock_request, {
+            ("GET", "http://wfhrequests/wfhRequests/range"): (400, {"error": "Invalid status filter"}),
+            ("GET", "http://employee/employees/"): directory,
+        })
+        response = self.app.get('/attendance/range?start=2024-10-01&end=2024-10-03')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data), {"error": "Invalid status filter"})
+
+        # Server errors upstream are still reported as the upstream being unavailable
+        self.mock_upstreams(mock_request, {
+            ("GET", "http://wfhrequests/wfhRequests/range"): (503, {"error": "Database unavailable"}),
+            ("GET", "http://employee/employees/"): directory,
+        })
+        self.assertEqual(self.app.get('/attendance/range?start=2024-10-01&end=2024-10-03').status_code, 502)
+
+    def test_range_rejects_bad_bounds(self):
+        self.assertEqual(self.app.get('/attendance/range?start=2024-10-01').status_code, 400)
+        self.assertEqual(self.app.get('/attendance/range?start=2024-10-03&end=2024-10-01').status_code, 400)
+        self.assertEqual(self.app.get('/attendance/range?start=2024-01-01&end=2024-12-31').status_code, 400)
+
+class DirectoryCacheTestCase(unittest.TestCase):
+    url = 'http://employee/employees/'
+
+    def setUp(self):
+        self.now = 0
+        self.cache = DirectoryCache(self.url, ttl=300, max_stale=3600, clock=lambda: self.now)
+
+    def response(self, status_code, staff_ids=(), etag='"v1"'):
+        body = {"status_code": 200, "data": [{"staff_id": staff_id} for staff_id in staff_ids]}
+        return MagicMock(status_code=status_code, headers={"ETag": etag}, json=MagicMock(return_value=body))
+
+    @patch('upstream.get')
+    def test_served_from_cache_within_ttl(self, mock_get):
+        mock_get.return_value = self.response(200, [1, 2])
+
+        self.assertEqual(list(self.cache.get()), [1, 2])
+        self.now = 299
+        self.assertEqual(list(self.cache.get()), [1, 2])
+
+        mock_get.assert_called_once_with(self.url, headers=None)
+
+    @patch('upstream.get')
+    def test_revalidates_with_etag_after_ttl(self, mock_get):
+        mock_get.side_effect = [self.response(200, [1]), self.response(304), self.response(200, [1, 3], etag='"v2"')]
+        self.cache.get()
+
+        self.now = 301
+        self.assertEqual(list(self.cache.get()), [1])
+        self.assertEqual(mock_get.call_args.kwargs['headers'], {"If-None-Match": '"v1"'})
+        # A 304 restarts the TTL
+        self.now = 600
+        self.cache.get()
+        self.assertEqual(mock_get.call_count, 2)
+
+        self.now = 602
+        self.assertEqual(list(self.cache.get()), [1, 3])
+
+    @patch('upstream.get')
+    def test_stale_copy_served_until_max_staleness(self, mock_get):
+        mock_get.side_effect = [self.response(200, [1])] + [upstream.UpstreamError("employee service down")] * 2
+        self.cache.get()
+
+        self.now = 3000
+        self.assertEqual(list(self.cache.get()), [1])
+        self.now = 3601
+        with self.assertRaises(upstream.UpstreamError):
+            self.cache.get()
+
+
 if __name__ == "__main__":
     unittest.main()
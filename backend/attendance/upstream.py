@@ -0,0 +1,64 @@
+"""Pooled, concurrent HTTP calls to the wfhRequests and employee services.
+
+One requests.Session keeps connections to each upstream alive between
+attendance requests, and every call carries a connect and read timeout so a
+slow upstream fails the request instead of hanging a worker. Calls that do
+not depend on each other are started with submit() and run on a shared
+thread pool, so a request waits for its slowest upstream, not for the sum.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Seconds to establish a connection, and to wait for the response after that
+CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", 2))
+READ_TIMEOUT = float(os.getenv("UPSTREAM_READ_TIMEOUT", 10))
+# Concurrent upstream calls across all requests, and kept-alive connections per upstream host
+MAX_WORKERS = int(os.getenv("UPSTREAM_MAX_WORKERS", 16))
+POOL_SIZE = MAX_WORKERS
+
+
+class UpstreamError(Exception):
+    """An upstream service could not be reached or returned an unusable response."""
+
+
+session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE)
+session.mount("http://", _adapter)
+session.mount("https://", _adapter)
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="upstream")
+
+
+def _request(method, url, **kwargs):
+    try:
+        return session.request(method, url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    except requests.RequestException as e:
+        raise UpstreamError(f"{method} {url} failed: {e}") from e
+
+
+def json_body(response):
+    try:
+        return response.json()
+    except ValueError as e:
+        raise UpstreamError(f"{response.request.method} {response.url} returned invalid JSON: {e}") from e
+
+
+def get(url, params=None, headers=None):
+    """The raw response, for callers that need its status or headers."""
+    return _request("GET", url, params=params, headers=headers)
+
+
+def get_json(url, params=None):
+    return json_body(get(url, params=params))
+
+
+def post_json(url, body):
+    return json_body(_request("POST", url, json=body))
+
+
+def submit(fn, *args, **kwargs):
+    """Start fn on the upstream pool; call .result() on the returned future to wait for it."""
+    return _executor.submit(fn, *args, **kwargs)
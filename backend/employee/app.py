@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, make_response
 from flask_cors import CORS  # Import CORS
 from sqlalchemy import select
 from typing import List
@@ -7,14 +7,20 @@ import os
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 from celery import Celery
+import click
+import events
+import outbox
+import replica
 
 from factory import ma, db, Employee, EmployeeSchema,  Credential, CredentialSchema, Role, Delegate, DelegateSchema, DelegateStatusHistory, DelegateStatusHistorySchema, Status
 
 load_dotenv()
 app = Flask(__name__)
-CORS(app) 
+CORS(app, expose_headers=[replica.PIN_HEADER])
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI")
+# Optional read replica for GET endpoints
+replica.init_app(app, os.getenv("DATABASE_REPLICA_URI"))
 # BACKEND_CONNECTION_STRING = os.getenv("BACKEND_CONNECTION_STRING")
 BROKER_CONNECTION_STRING = os.getenv("BROKER_CONNECTION_STRING")
 
@@ -27,6 +33,18 @@ with app.app_context():
 worker = Celery('tasks',  
                 #  backend=BACKEND_CONNECTION_STRING,
                  broker=BROKER_CONNECTION_STRING)
+events.init_app(BROKER_CONNECTION_STRING)
+
+# Most staff_ids /employees/batch resolves in one call; the whole directory is a few hundred
+MAX_BATCH_STAFF_IDS = 1000
+
+
+@app.cli.command("relay-outbox")
+@click.option("--batch-size", default=outbox.BATCH_SIZE, show_default=True, help="Tasks published per transaction.")
+def relay_outbox_command(batch_size):
+    """Publish tasks from task_outbox to the broker until stopped."""
+    click.echo("Relaying task_outbox")
+    outbox.relay(worker, batch_size=batch_size)
 
 @app.route("/employees/healthcheck", methods=["GET"])
 def healthcheck():
@@ -80,6 +98,14 @@ def get_all_employee():
     return output_data, 200
 
 @app.route("/employees/", methods=["GET"])
+def get_employees():
+    response = make_response(get_employee_by_staff_id())
+    if response.status_code == 200:
+        # Callers caching the directory revalidate with If-None-Match and get an empty 304 when it is unchanged
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
 def get_employee_by_staff_id(reporting_manager=None):
     staff_id = request.args.get('staff_id')
     dept = request.args.get('dept')
@@ -107,7 +133,37 @@ def get_employee_by_staff_id(reporting_manager=None):
         return output_data, 200
     except SQLAlchemyError as e:
         return jsonify({"error": str(e)}), 500
-    
+
+
+@app.route("/employees/batch", methods=["GET", "POST"])
+def get_employees_by_staff_ids():
+    # GET takes ?staff_ids=1,2,3; POST takes {"staff_ids": [1, 2, 3]} for lists too long for a URL
+    try:
+        if request.method == "POST":
+            staff_ids = {int(staff_id) for staff_id in (request.get_json(silent=True) or {}).get("staff_ids", [])}
+        else:
+            staff_ids = {int(staff_id) for staff_id in request.args.get("staff_ids", "").split(",") if staff_id.strip()}
+    except (TypeError, ValueError):
+        return jsonify({"error": "staff_ids must be a list of integers"}), 400
+
+    if len(staff_ids) > MAX_BATCH_STAFF_IDS:
+        return jsonify({"error": f"At most {MAX_BATCH_STAFF_IDS} staff_ids per call"}), 400
+
+    try:
+        employees = db.session.execute(
+            select(Employee).where(Employee.staff_id.in_(staff_ids)).order_by(Employee.staff_id)
+        ).scalars().all() if staff_ids else []
+    except SQLAlchemyError as e:
+        return jsonify({"error": str(e)}), 500
+
+    output_data = {
+        "status_code": 200,
+        "message": "Employee details:",
+        "data": EmployeeSchema(many=True).dump(employees),
+        "missing": sorted(staff_ids - {employee.staff_id for employee in employees})
+    }
+    return output_data, 200
+
 
 @app.route("/employees/", methods=["PUT"])
 def update_employee():
@@ -308,6 +364,7 @@ def create_delegate():
         create_delegate_status_record(delegate_data)
         
         db.session.commit()
+        events.publish([events.delegate_event(delegate.delegate_to, 1, delegate)])
         
         output_data = {
             "status_code": 201,
@@ -330,10 +387,6 @@ def create_delegate_status_record(delegate_data=None):
         delegate_schema = DelegateStatusHistorySchema()
         delegate_status_history = delegate_schema.load(data, session=db.session)
         db.session.add(delegate_status_history)
-        db.session.commit()
-        
-        if data['status'] != 'pending':
-            update_delegate_status(data['delegate_id'], data['status'])
             
         # Once accepted to be temp reporting manager, 
         # 1) Temp update the reporting manager to the new guy
@@ -352,9 +405,13 @@ def create_delegate_status_record(delegate_data=None):
             affected_staff_ids = [employee['staff_id'] for employee in affected_employees['data']]
 
             print('affected_staff_ids: ', affected_staff_ids)
-            worker.send_task("replace_to_temp_mgr", eta=start_date, kwargs={'temp_manager': delegate_to, 'affected_staff_ids': affected_staff_ids})
-            worker.send_task("replace_to_original_mgr", eta=end_date, kwargs={'original_manager': delegate_from, 'affected_staff_ids': affected_staff_ids})
+            # Queued in the outbox so the tasks are sent only if the acceptance commits
+            outbox.enqueue("replace_to_temp_mgr", {'temp_manager': delegate_to, 'affected_staff_ids': affected_staff_ids}, eta=start_date)
+            outbox.enqueue("replace_to_original_mgr", {'original_manager': delegate_from, 'affected_staff_ids': affected_staff_ids}, eta=end_date)
 
+        if data['status'] != 'pending':
+            update_delegate_status(data['delegate_id'], data['status'])
+        db.session.commit()
         
         output_data = {
             "status_code": 201,
@@ -371,10 +428,16 @@ def update_delegate_status(delegate_id, status):
     stmt = select(Delegate).where(Delegate.delegate_id == delegate_id)
     delegate_record = db.session.execute(stmt).scalars().one_or_none()
     
+    was_pending = delegate_record.notification_status == Status.PENDING
     delegate_record.status = status.upper()
     delegate_record.notification_status = status.upper()
 
     db.session.commit()
+    # The answer leaves delegate_to's inbox and lands in delegate_from's
+    events.publish([
+        events.delegate_event(delegate_record.delegate_to, -1 if was_pending else 0, delegate_record),
+        events.delegate_event(delegate_record.delegate_from, 1, delegate_record),
+    ])
     
 
 # Fetch delegate audit trail
@@ -492,6 +555,7 @@ def get_notifications_length(staffID):
     return output_data, 200
 
 @app.route('/employees/getAllDeleNoti/<int:staff_id>', methods=['GET'])
+@replica.primary  # Marks the inbox seen
 def get_all_requests(staff_id):
     requester_requests = db.session.query(Delegate).filter(
         Delegate.delegate_from == staff_id,
@@ -0,0 +1,86 @@
+"""Delegation events for the notification stream served by the wfhRequests service.
+
+Events are published after commit to the fanout exchange that every
+wfhRequests worker consumes, so a delegate sees a new or answered delegation
+without polling /employees/getDelegateNotiLength. publish() only queues them:
+a background thread talks to the broker, so a slow or unavailable broker
+never delays the response, and drops events once PUBLISH_BACKLOG is full.
+"""
+import logging
+import queue
+import threading
+
+from kombu import Connection, Exchange
+from kombu.pools import producers
+
+logger = logging.getLogger(__name__)
+
+# Must match EXCHANGE in backend/wfhRequests/events.py
+EXCHANGE = Exchange('notifications', type='fanout', durable=False)
+PUBLISH_TIMEOUT = 10
+# Committed batches waiting for the publisher thread
+PUBLISH_BACKLOG = 1000
+
+_connection = None
+_outgoing = queue.Queue(maxsize=PUBLISH_BACKLOG)
+_publisher = None
+_lock = threading.Lock()
+
+
+def init_app(broker_url):
+    global _connection
+    _connection = Connection(broker_url) if broker_url else None
+
+
+def delegate_event(staff_id, delta, delegate):
+    return {
+        'type': 'delegate',
+        'staff_id': staff_id,
+        'delta': delta,
+        'delegate': {
+            'delegate_id': delegate.delegate_id,
+            'delegate_from': delegate.delegate_from,
+            'delegate_to': delegate.delegate_to,
+            # A status assigned in this request is still the plain string until the row is reloaded
+            'status': getattr(delegate.status, 'value', delegate.status),
+        },
+    }
+
+
+def publish(events):
+    """Queue committed changes for the publisher thread; a broker outage only costs the live update."""
+    if _connection is None or not events:
+        return
+    _ensure_publisher()
+    try:
+        _outgoing.put_nowait(events)
+    except queue.Full:
+        logger.warning("Dropping %d delegation events, the broker publisher is behind", len(events))
+
+
+def _ensure_publisher():
+    # Started on first use so it runs inside the worker process rather than the gunicorn master
+    global _publisher
+    with _lock:
+        if _publisher is None or not _publisher.is_alive():
+            _publisher = threading.Thread(target=_publish_batches, name='delegation-publisher', daemon=True)
+            _publisher.start()
+
+
+def _publish_batches():
+    while True:
+        events = _outgoing.get()
+        # Batches that queued up behind a slow publish go out together in one message
+        while True:
+            try:
+                events = events + _outgoing.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            with producers[_connection].acquire(block=True, timeout=PUBLISH_TIMEOUT) as producer:
+                producer.publish(
+                    events, exchange=EXCHANGE, routing_key='', declare=[EXCHANGE], serializer='json',
+                    retry=True, retry_policy={'max_retries': 1, 'interval_start': 0}
+                )
+        except Exception:
+            logger.exception("Failed to publish %d delegation events", len(events))
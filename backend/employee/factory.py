@@ -1,13 +1,16 @@
 import enum
+import uuid
 from flask_sqlalchemy import SQLAlchemy
+from replica import RoutingSession
 from flask_marshmallow import Marshmallow
 from marshmallow import fields
 from marshmallow_enum import EnumField
-from sqlalchemy import String, Integer, Enum, ForeignKey, DateTime, func
+from sqlalchemy import String, Integer, Enum, ForeignKey, DateTime, JSON, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 # Initialize Flask extensions
-db = SQLAlchemy()
+# Reads can be routed to a replica, see replica.py
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 ma = Marshmallow()
 
 # Base class for models
@@ -108,4 +111,17 @@ class DelegateStatusHistorySchema(ma.SQLAlchemyAutoSchema):
 
     class Meta:
         model = DelegateStatusHistory
-        load_instance = True
\ No newline at end of file
+        load_instance = True
+
+
+class TaskOutbox(Base):
+    __tablename__ = "task_outbox"
+
+    outbox_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Sent as the Celery task id, so a task the relay publishes twice is recognisable
+    task_id: Mapped[str] = mapped_column(String(36), nullable=False, default=lambda: str(uuid.uuid4()))
+    task_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    kwargs: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # ISO 8601, passed to Celery as given
+    eta: Mapped[str] = mapped_column(String(40), nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
@@ -0,0 +1,67 @@
+"""Transactional outbox for Celery tasks.
+
+Delegation handlers call enqueue() instead of worker.send_task(), which adds
+a task_outbox row to the current transaction: a rollback drops the task with
+everything else, and the request never waits on the broker.
+
+The relay (``flask --app app relay-outbox``) claims pending rows in batches
+with FOR UPDATE SKIP LOCKED, so several relays can run side by side, publishes
+them over one producer with publisher confirms, and deletes them in the same
+transaction. Delivery is at least once: if the relay dies after publishing
+but before committing, the batch is published again under the same task ids.
+"""
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, select
+
+from factory import db, TaskOutbox
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+# Seconds to wait when the outbox is empty, and after a failed batch
+POLL_INTERVAL = 1
+RETRY_DELAY = 5
+
+
+def enqueue(task_name, kwargs, eta=None):
+    """Send task_name once the current transaction commits."""
+    db.session.add(TaskOutbox(
+        task_name=task_name,
+        kwargs=kwargs,
+        eta=eta.isoformat() if isinstance(eta, datetime) else eta,
+    ))
+
+
+def relay_batch(worker, batch_size=BATCH_SIZE):
+    """Publish up to batch_size pending tasks and return how many were sent."""
+    rows = db.session.scalars(
+        select(TaskOutbox)
+        .order_by(TaskOutbox.outbox_id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).all()
+    if rows:
+        with worker.producer_or_acquire() as producer:
+            for row in rows:
+                # With confirm_publish each publish returns once the broker has taken the message
+                worker.send_task(row.task_name, kwargs=row.kwargs, eta=row.eta, task_id=row.task_id, producer=producer)
+        db.session.execute(delete(TaskOutbox).where(TaskOutbox.outbox_id.in_([row.outbox_id for row in rows])))
+    db.session.commit()
+    return len(rows)
+
+
+def relay(worker, batch_size=BATCH_SIZE, poll_interval=POLL_INTERVAL):
+    worker.conf.broker_transport_options = dict(worker.conf.broker_transport_options or {}, confirm_publish=True)
+    while True:
+        try:
+            sent = relay_batch(worker, batch_size)
+        except Exception:
+            db.session.rollback()
+            logger.exception("Failed to relay outbox batch, retrying in %s seconds", RETRY_DELAY)
+            time.sleep(RETRY_DELAY)
+            continue
+        if sent < batch_size:
+            time.sleep(poll_interval)
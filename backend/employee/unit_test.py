@@ -103,6 +103,30 @@ class EmployeeTest(unittest.TestCase):
         self.assertEqual(first_employee['staff_id'], 140002)  # Check that the correct employee is returned
         self.assertIn('staff_fname', first_employee)  # Check other fields as necessary
 
+    def test_directory_revalidates_with_etag(self):
+        response = self.app.get('/employees/?dept=Sales')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.app.get('/employees/?dept=Sales', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+    def test_get_employees_by_staff_ids(self):
+        response = self.app.get('/employees/batch?staff_ids=140002,130002,140002,999999999')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual([employee['staff_id'] for employee in data['data']], [130002, 140002])
+        self.assertEqual(data['missing'], [999999999])
+
+        response = self.app.post('/employees/batch', json={"staff_ids": [140002]})
+        self.assertEqual([employee['staff_id'] for employee in json.loads(response.data)['data']], [140002])
+
+    def test_get_employees_by_staff_ids_rejects_bad_ids(self):
+        self.assertEqual(self.app.get('/employees/batch?staff_ids=1,abc').status_code, 400)
+        self.assertEqual(self.app.post('/employees/batch', json={"staff_ids": 5}).status_code, 400)
+
     @patch('app.db.session')  # Mock the session object in the app
     def test_update_employee(self, mock_session):
         # Arrange
@@ -336,8 +360,8 @@ class EmployeeTest(unittest.TestCase):
     @patch('app.DelegateStatusHistorySchema')  # Mock the DelegateStatusHistorySchema
     @patch('app.get_delegate_by_delegate_id')  # Mock the get_delegate_by_delegate_id function
     @patch('app.get_employee_by_staff_id')  # Mock the get_employee_by_staff_id function
-    @patch('app.worker')  # Mock the worker for task sending
-    def test_create_delegate_status_record_success(self, mock_worker, mock_get_employee_by_staff_id, mock_get_delegate_by_delegate_id, MockDelegateStatusHistorySchema, mock_session):
+    @patch('app.outbox.enqueue')  # Mock the outbox the tasks are queued in
+    def test_create_delegate_status_record_success(self, mock_enqueue, mock_get_employee_by_staff_id, mock_get_delegate_by_delegate_id, MockDelegateStatusHistorySchema, mock_session):
         # Arrange
         mock_delegate_status_history_instance = MagicMock()
         mock_delegate_status_history_instance.delegate_id = 1
@@ -381,9 +405,9 @@ class EmployeeTest(unittest.TestCase):
         self.assertEqual(data['message'], "Delegate Record created")
         self.assertIn('data', data)
 
-        # Check that tasks were sent to the worker
-        mock_worker.send_task.assert_any_call("replace_to_temp_mgr", eta="2024-10-01T00:00:00Z", kwargs={'temp_manager': "temp_manager_id", 'affected_staff_ids': [101, 102]})
-        mock_worker.send_task.assert_any_call("replace_to_original_mgr", eta="2024-10-05T00:00:00Z", kwargs={'original_manager': "manager_id", 'affected_staff_ids': [101, 102]})
+        # Check that tasks were queued for the relay
+        mock_enqueue.assert_any_call("replace_to_temp_mgr", {'temp_manager': "temp_manager_id", 'affected_staff_ids': [101, 102]}, eta="2024-10-01T00:00:00Z")
+        mock_enqueue.assert_any_call("replace_to_original_mgr", {'original_manager': "manager_id", 'affected_staff_ids': [101, 102]}, eta="2024-10-05T00:00:00Z")
 
     @patch('app.db.session')  # Mock the db.session to prevent actual database calls
     @patch('app.DelegateStatusHistorySchema')  # Mock the DelegateStatusHistorySchema
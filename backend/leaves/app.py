@@ -7,14 +7,17 @@ import os
 from sqlalchemy.exc import SQLAlchemyError
 from dotenv import load_dotenv
 from datetime import datetime
+import replica
 
 from factory import ma, db, AnnualLeave, AnnualLeaveSchema
 
 load_dotenv()
 app = Flask(__name__)
-CORS(app) 
+CORS(app, expose_headers=[replica.PIN_HEADER])
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI")
+# Optional read replica for GET endpoints
+replica.init_app(app, os.getenv("DATABASE_REPLICA_URI"))
 
 db.init_app(app)
 ma.init_app(app)
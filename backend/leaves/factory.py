@@ -1,5 +1,6 @@
 import enum
 from flask_sqlalchemy import SQLAlchemy
+from replica import RoutingSession
 from sqlalchemy.ext.mutable import MutableList
 from flask_marshmallow import Marshmallow
 from marshmallow import fields
@@ -12,7 +13,8 @@ from datetime import timezone
 # class Base(DeclarativeBase):
 #     pass
 
-db = SQLAlchemy()
+# Reads can be routed to a replica, see replica.py
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 ma = Marshmallow()
 
 class Base(db.Model):
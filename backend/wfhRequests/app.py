@@ -1,25 +1,47 @@
-from utility import get_previous_working_day
-from flask import Flask, request, jsonify
+from utility import get_previous_working_day, encode_cursor, decode_cursor, parse_page_size, parse_date_range
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS  # Import CORS
-from sqlalchemy import select, and_, or_
+from sqlalchemy import select, insert, and_, or_, tuple_, union_all
 from typing import List
 from marshmallow import ValidationError
 import os
-from sqlalchemy.exc import SQLAlchemyError
+import json
+import queue
+from collections import Counter
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm.exc import StaleDataError
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from celery import Celery
-
-
-from factory import ma, db,Status, WFHRequest, WFHRequestSchema, WFHRequestEntry, WFHRequestEntrySchema, NotificationStatus, AuditTrail, AuditTrailSchema 
+import click
+
+
+from factory import ma, db,Status, ACTIVE_STATUSES, WFHRequest, WFHRequestSchema, WFHRequestEntry, WFHRequestEntrySchema, NotificationStatus, AuditTrail, AuditTrailSchema, WFHDailyOccupancy
+import migrations
+import occupancy
+import notifications
+import audit_archive
+import events
+import idempotency
+import outbox
+import transitions
+import workcalendar
+import replica
+from loader import load_request, load_requests, iter_request_batches, serialize_request, serialize_requests
+from serializers import dump_request, dump_entry, dump_audit_trail
 
 load_dotenv()
 app = Flask(__name__)
-CORS(app) 
+CORS(app, expose_headers=[replica.PIN_HEADER])
 
 app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URI")
+# Optional read replica for GET endpoints
+replica.init_app(app, os.getenv("DATABASE_REPLICA_URI"))
 # BACKEND_CONNECTION_STRING = os.getenv("BACKEND_CONNECTION_STRING")
 BROKER_CONNECTION_STRING = os.getenv("BROKER_CONNECTION_STRING")
+# Where archived audit trail months are written and read back from, and how many months stay in the database
+app.config["AUDIT_ARCHIVE_DIR"] = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+app.config["AUDIT_ARCHIVE_HORIZON_MONTHS"] = int(os.getenv("AUDIT_ARCHIVE_HORIZON_MONTHS", 12))
 
 db.init_app(app)
 ma.init_app(app)
@@ -30,151 +52,212 @@ with app.app_context():
 worker = Celery('tasks',  
                 #  backend=BACKEND_CONNECTION_STRING,
                  broker=BROKER_CONNECTION_STRING)
+events.init_app(BROKER_CONNECTION_STRING)
+
+# Longest span /wfhRequests/range will answer in one call (about a quarter)
+MAX_RANGE_DAYS = 92
+# Longest span /wfhRequests/requester/<id>/dates will answer in one call
+MAX_DATES_RANGE_DAYS = 366
+work_calendar = workcalendar.default_calendar()
+# Actions managers and HR can apply to many requests in one call, and the most items per call
+BULK_ACTIONS = {'approve', 'reject', 'withdraw', 'acknowledge'}
+MAX_BULK_ITEMS = 500
+# Idle notification streams send a comment this often so proxies keep them open
+STREAM_HEARTBEAT_SECONDS = 15
+
+
+@app.cli.command("migrate")
+def migrate_command():
+    """Apply pending schema migrations. Index builds do not block writes on PostgreSQL."""
+    applied = migrations.upgrade(db.engine)
+    click.echo(f"Applied migrations: {', '.join(applied)}" if applied else "Database is up to date")
+
+
+@app.cli.command("rebuild-occupancy")
+def rebuild_occupancy_command():
+    """Recompute wfh_daily_occupancy from wfhrequestentries."""
+    with db.engine.begin() as conn:
+        occupancy.rebuild(conn)
+    click.echo("Rebuilt wfh_daily_occupancy")
+
+
+@app.cli.command("rebuild-notification-counters")
+def rebuild_notification_counters_command():
+    """Recompute notification_counters from wfhrequests."""
+    with db.engine.begin() as conn:
+        notifications.rebuild(conn)
+    click.echo("Rebuilt notification_counters")
+
+
+@app.cli.command("archive-audit-trail")
+@click.option("--horizon-months", type=int, default=None, help="Months kept in the database (default AUDIT_ARCHIVE_HORIZON_MONTHS).")
+def archive_audit_trail_command(horizon_months):
+    """Create upcoming audittrail partitions and archive the ones older than the horizon."""
+    with db.engine.begin() as conn:
+        if not audit_archive.is_partitioned(conn):
+            click.echo("audittrail is not partitioned; run migrate on PostgreSQL first")
+            return
+        audit_archive.ensure_partitions(conn, audit_archive.month_start(date.today()))
+    if horizon_months is None:
+        horizon_months = app.config["AUDIT_ARCHIVE_HORIZON_MONTHS"]
+    archived = audit_archive.archive(db.engine, horizon_months, app.config["AUDIT_ARCHIVE_DIR"])
+    click.echo(f"Archived: {', '.join(f'{month:%Y-%m}' for month in archived)}" if archived else "Nothing to archive")
+
+
+@app.cli.command("relay-outbox")
+@click.option("--batch-size", default=outbox.BATCH_SIZE, show_default=True, help="Tasks published per transaction.")
+def relay_outbox_command(batch_size):
+    """Publish tasks from task_outbox to the broker until stopped."""
+    click.echo("Relaying task_outbox")
+    outbox.relay(worker, batch_size=batch_size)
 
 
 @app.route("/wfhRequests/healthcheck", methods=["GET"])
 def healthcheck():
     return jsonify({"message": "wfhRequest service reached"}), 200
 
+def wants_ndjson():
+    if request.args.get('stream') == '1':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
+
+def stream_wfh_requests(stmt):
+    """Stream requests matching stmt, with their entries, as one JSON document per line."""
+    def generate():
+        for batch in iter_request_batches(stmt):
+            yield "".join(json.dumps(request_data) + "\n" for request_data in serialize_requests(batch))
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route("/wfhRequests", methods=["GET"])
 def get_wfh_requests():
-    # Query all WFHRequest records and eager load their related WFHRequestEntry records
-    requests = db.session.query(WFHRequest).all()
-    # Query all WFHRequestEntry records
-    all_entries = db.session.query(WFHRequestEntry).all()
-    
-    # Create a dictionary to map request_id to its entries
-    entries_by_request_id = {}
-    for entry in all_entries:
-        if entry.request_id not in entries_by_request_id:
-            entries_by_request_id[entry.request_id] = []
-        entries_by_request_id[entry.request_id].append(WFHRequestEntrySchema().dump(entry))
-    
-    # Serialize the data for each WFHRequest and include entries
-    result = []
-    for request in requests:
-        request_data = WFHRequestSchema().dump(request)
-        # Add entries for the current request
-        request_data['entries'] = entries_by_request_id.get(request.request_id, [])
-        result.append(request_data)
-    
+    if wants_ndjson():
+        return stream_wfh_requests(select(WFHRequest).order_by(WFHRequest.request_id))
+
+    # Keyset pagination is opt-in so existing callers still receive the full listing
+    if 'limit' in request.args or 'cursor' in request.args:
+        return get_wfh_requests_page()
+
+    requests = load_requests(select(WFHRequest))
+
     output_data = {
         "status_code": 200,
         "message": "WFH Requests Record",
-        "data": 
-            result
-        
+        "data": serialize_requests(requests)
     }
     return output_data, 200
     # return jsonify(result)
 
+def get_wfh_requests_page():
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Newest first, with request_id as the tie-breaker so the ordering is total
+    stmt = select(WFHRequest).order_by(WFHRequest.modified_at.desc(), WFHRequest.request_id.desc())
+    if after:
+        stmt = stmt.where(tuple_(WFHRequest.modified_at, WFHRequest.request_id) < tuple_(*after))
+
+    # Fetch one extra row to know whether another page exists
+    requests = load_requests(stmt.limit(limit + 1))
+    has_more = len(requests) > limit
+    requests = requests[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = requests[-1]
+        next_cursor = encode_cursor(last.modified_at, last.request_id)
+
+    output_data = {
+        "status_code": 200,
+        "message": "WFH Requests Record",
+        "data": serialize_requests(requests),
+        "next_cursor": next_cursor
+    }
+    return output_data, 200
+
 @app.route("/wfhRequests/<int:request_id>", methods=["GET"])
 def get_wfh_request(request_id):
-    # Query the WFHRequest with the specified request_id
-    request = db.session.query(WFHRequest).filter_by(request_id=request_id).first()
-    
-    # Query all WFHRequestEntry records related to this WFHRequest
-    entries = db.session.query(WFHRequestEntry).filter_by(request_id=request_id).all()
-    
-    # Serialize the data
-    request_data = WFHRequestSchema().dump(request)
-    request_data['entries'] = [WFHRequestEntrySchema().dump(entry) for entry in entries]
-    
+    wfh_request = load_request(request_id)
+
     output_data = {
         "status_code": 200,
         "message": "One WFH Request By ID",
-        "data": request_data
+        "data": serialize_request(wfh_request)
         
     }
     return output_data, 200
 
 @app.route("/wfhRequests/staff/<int:staff_id>", methods=["GET"])
 def get_wfh_request_by_staff_id(staff_id):
-    
-    requests = db.session.query(WFHRequest).filter(
-        or_(WFHRequest.requester_id == staff_id, WFHRequest.reporting_manager == staff_id)
-    ).all()
-    
-    # Prepare a list to hold all the requests and their entries
-    response_data = []
-
-    for request in requests:
-        print(f"Processing request: {request}")
-
-        # Query all WFHRequestEntry records related to this WFHRequest
-        entries = db.session.query(WFHRequestEntry).filter_by(request_id=request.request_id).all()
-        
-        # Serialize the request data
-        request_data = WFHRequestSchema().dump(request)
-        request_data['entries'] = [WFHRequestEntrySchema().dump(entry) for entry in entries]
-        
-        # Append the serialized request data to the response list
-        response_data.append(request_data)
+    requests = load_requests(
+        select(WFHRequest).where(
+            or_(WFHRequest.requester_id == staff_id, WFHRequest.reporting_manager == staff_id)
+        )
+    )
     
     output_data = {
         "status_code": 200,
         "message": "WFH Requests By Staff ID",
-        "data": response_data
+        "data": serialize_requests(requests)
     }
     return output_data, 200
 
 @app.route("/wfhRequests/requester/<int:staff_id>", methods=["GET"])
 def get_wfh_request_by_requester_id(staff_id):
-    
-    requests = db.session.query(WFHRequest).filter(
-        WFHRequest.requester_id == staff_id
-    ).all()
-    
-    # Prepare a list to hold all the requests and their entries
-    response_data = []
-
-    for request in requests:
-        # Query all WFHRequestEntry records related to this WFHRequest with status 'Approved'
-        entries = db.session.query(WFHRequestEntry).filter_by(
-            request_id=request.request_id, status=Status.APPROVED
-        ).all()
-        
-        if entries:
-            # Serialize the request data
-            request_data = WFHRequestSchema().dump(request)
-            request_data['entries'] = [WFHRequestEntrySchema().dump(entry) for entry in entries]
-            
-            # Append the serialized request data to the response list
-            response_data.append(request_data)
+    # Only approved entries are returned, and requests without any are left out
+    requests = load_requests(
+        select(WFHRequest).where(WFHRequest.requester_id == staff_id),
+        WFHRequestEntry.status == Status.APPROVED
+    )
     
     output_data = {
         "status_code": 200,
         "message": "WFH Requests By Staff ID",
-        "data": response_data
+        "data": serialize_requests(requests, skip_empty=True)
     }
     return output_data, 200
 
+@app.route("/wfhRequests/requester/<int:staff_id>/dates", methods=["GET"])
+def get_occupied_dates(staff_id):
+    try:
+        start, end = parse_date_range(request.args.get('start'), request.args.get('end'), MAX_DATES_RANGE_DAYS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-@app.route("/wfhRequests/dept/<string:dept_name>", methods=["GET"])
-def get_wfh_request_by_dept(dept_name):
-    
-    requests = db.session.query(WFHRequest).filter_by(department=dept_name).all()
+    output_data = {
+        "status_code": 200,
+        "message": "Dates With An Active WFH Request",
+        "data": [day.isoformat() for day in occupied_dates(staff_id, start, end)]
+    }
+    return output_data, 200
 
-    
-    # Prepare a list to hold all the requests and their entries
-    response_data = []
+def occupied_dates(staff_id, start, end):
+    # Answered from the partial unique index on (requester_id, entry_date)
+    return db.session.scalars(
+        select(WFHRequestEntry.entry_date).where(
+            WFHRequestEntry.requester_id == staff_id,
+            WFHRequestEntry.status.in_(ACTIVE_STATUSES),
+            WFHRequestEntry.entry_date.between(start, end),
+        ).order_by(WFHRequestEntry.entry_date)
+    ).all()
 
-    for request in requests:
-        print(f"Processing request: {request}")
 
-        entries = db.session.query(WFHRequestEntry).filter_by(request_id=request.request_id).all()
-        
-        # Serialize the request data
-        request_data = WFHRequestSchema().dump(request)
-        request_data['entries'] = [WFHRequestEntrySchema().dump(entry) for entry in entries]
-        
-        # Append the serialized request data to the response list
-        response_data.append(request_data)
+@app.route("/wfhRequests/dept/<string:dept_name>", methods=["GET"])
+def get_wfh_request_by_dept(dept_name):
+    stmt = select(WFHRequest).where(WFHRequest.department == dept_name)
+    if wants_ndjson():
+        return stream_wfh_requests(stmt.order_by(WFHRequest.request_id))
+
+    requests = load_requests(stmt)
     
     output_data = {
         "status_code": 200,
         "message": "WFH Requests By Department",
-        "data": response_data
+        "data": serialize_requests(requests)
     }
     return output_data, 200
 
@@ -183,58 +266,127 @@ def get_requests_by_date(entry_date_str):
     # Convert the string date to a Python date object
     entry_date = datetime.strptime(entry_date_str, '%Y-%m-%d').date()
 
-    entries = db.session.query(WFHRequestEntry).filter(WFHRequestEntry.entry_date == entry_date).all()
-
-    # Extract request_ids from the entries
-    request_ids = {entry.request_id for entry in entries}
+    # Requests with an entry on that date, carrying only the entries for that date
+    on_date = WFHRequestEntry.entry_date == entry_date
+    stmt = select(WFHRequest)
+
+    # Optional filters let callers such as attendance fetch only the entries and staff they show
+    status = request.args.get('status')
+    if status:
+        try:
+            on_date = and_(on_date, WFHRequestEntry.status.in_([Status(value) for value in status.split(',')]))
+        except ValueError:
+            return jsonify({"error": f"Invalid status: {status}"}), 400
+
+    dept = request.args.get('dept')
+    if dept:
+        stmt = stmt.where(WFHRequest.department == dept)
+
+    if 'requester_ids' in request.args:
+        try:
+            requester_ids = [int(staff_id) for staff_id in request.args['requester_ids'].split(',') if staff_id.strip()]
+        except ValueError:
+            return jsonify({"error": "requester_ids must be a comma-separated list of integers"}), 400
+        stmt = stmt.where(WFHRequest.requester_id.in_(requester_ids))
+
+    requests = load_requests(stmt.where(WFHRequest.entries.any(on_date)), on_date)
     
-    if not request_ids:
+    if not requests:
         return jsonify([])  # Return empty list if no matching entries found
     
-    # Query WFHRequest records with the extracted request_ids
-    requests = db.session.query(WFHRequest).filter(WFHRequest.request_id.in_(request_ids)).all()
-    
-    # Create a dictionary to map request_id to its entries
-    entries_by_request_id = {}
-    for entry in entries:
-        if entry.request_id not in entries_by_request_id:
-            entries_by_request_id[entry.request_id] = []
-        entries_by_request_id[entry.request_id].append(WFHRequestEntrySchema().dump(entry))
-    
-    # Serialize the data for each WFHRequest and include entries
-    result = []
-    for request in requests:
-        request_data = WFHRequestSchema().dump(request)
-        request_data['entries'] = entries_by_request_id.get(request.request_id, [])
-        result.append(request_data)
-    
     output_data = {
         "status_code": 200,
         "message": "WFH Requests By Date",
-        "data": result
+        "data": serialize_requests(requests)
     }
     return output_data, 200
     # return jsonify(result)
 
-@app.route('/wfhRequests/getNotificationsLength/<int:staffID>', methods=['GET'])
-def get_notifications_length(staffID):
-    requester_requests_count = db.session.query(WFHRequest).filter(
-        WFHRequest.requester_id == staffID,
-        # WFHRequest.notification_status == NotificationStatus.EDITED
-        WFHRequest.requester_id != WFHRequest.reporting_manager,  # Exclude if requester is the reporting manager
+def range_days(start, end, working_days_only=False):
+    """ISO dates from start to end, both included; only the working days when working_days_only is set."""
+    if working_days_only:
+        return [day.isoformat() for day in work_calendar.working_days(start, end)]
+    return [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
 
-        WFHRequest.notification_status.in_([NotificationStatus.EDITED, NotificationStatus.WITHDRAWN, NotificationStatus.ACKNOWLEDGED, NotificationStatus.AUTO_REJECTED])
+@app.route('/wfhRequests/range', methods=['GET'])
+def get_requests_by_date_range():
+    try:
+        start, end = parse_date_range(request.args.get('start'), request.args.get('end'), MAX_RANGE_DAYS)
+        working_days_only = request.args.get('working_days_only') == 'true'
+        # Every day in the range gets a bucket, even when nobody is working from home
+        days = {day: [] for day in range_days(start, end, working_days_only)}
+        working_days = work_calendar.working_days_between(start, end)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    ).count()
-    
-    # Query to get requests where reporting_manager = staffID and notification_status = 'Delivered'
-    manager_requests_count = db.session.query(WFHRequest).filter(
-        WFHRequest.reporting_manager == staffID,
-        WFHRequest.reporting_manager != WFHRequest.requester_id,  # Exclude if requester is the reporting manager
-        WFHRequest.notification_status.in_([NotificationStatus.DELIVERED, NotificationStatus.CANCELLED, NotificationStatus.SELF_WITHDRAWN])
-    ).count()
+    # One range scan over the entry_date index, joined to the owning request
+    stmt = select(
+        WFHRequestEntry, WFHRequest.requester_id, WFHRequest.reporting_manager, WFHRequest.department
+    ).join(WFHRequest, WFHRequest.request_id == WFHRequestEntry.request_id).where(
+        WFHRequestEntry.entry_date.between(start, end)
+    ).order_by(WFHRequestEntry.entry_date, WFHRequestEntry.entry_id)
+
+    dept = request.args.get('dept')
+    if dept:
+        stmt = stmt.where(WFHRequest.department == dept)
+
+    status = request.args.get('status')
+    if status:
+        try:
+            statuses = [Status(value) for value in status.split(',')]
+        except ValueError:
+            return jsonify({"error": f"Invalid status: {status}"}), 400
+        stmt = stmt.where(WFHRequestEntry.status.in_(statuses))
+
+    if working_days_only:
+        stmt = stmt.where(WFHRequestEntry.entry_date.in_([date.fromisoformat(day) for day in days]))
+
+    for entry, requester_id, reporting_manager, department in db.session.execute(stmt):
+        entry_data = dump_entry(entry)
+        entry_data['requester_id'] = requester_id
+        entry_data['reporting_manager'] = reporting_manager
+        entry_data['department'] = department
+        days[entry_data['entry_date']].append(entry_data)
+
+    output_data = {
+        "status_code": 200,
+        "message": "WFH Requests By Date Range",
+        "data": days,
+        "working_days": working_days
+    }
+    return output_data, 200
+
+@app.route('/wfhRequests/occupancy', methods=['GET'])
+def get_daily_occupancy():
+    try:
+        start, end = parse_date_range(request.args.get('start'), request.args.get('end'), MAX_RANGE_DAYS)
+        days = range_days(start, end, request.args.get('working_days_only') == 'true')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    total_active_requests = requester_requests_count + manager_requests_count
+    # Primary key range read: at most one row per department per day
+    stmt = select(WFHDailyOccupancy).where(WFHDailyOccupancy.entry_date.between(start, end))
+    dept = request.args.get('dept')
+    if dept:
+        stmt = stmt.where(WFHDailyOccupancy.department == dept)
+
+    heatmap = {}
+    for row in db.session.execute(stmt).scalars():
+        department_days = heatmap.setdefault(row.department, {day: {"approved": 0, "pending": 0} for day in days})
+        if row.entry_date.isoformat() in department_days:
+            department_days[row.entry_date.isoformat()] = {"approved": row.approved_count, "pending": row.pending_count}
+
+    output_data = {
+        "status_code": 200,
+        "message": "WFH Daily Occupancy",
+        "data": heatmap
+    }
+    return output_data, 200
+
+@app.route('/wfhRequests/getNotificationsLength/<int:staffID>', methods=['GET'])
+def get_notifications_length(staffID):
+    # Served from the per-staff counter kept up to date by every notification_status change
+    total_active_requests = notifications.get_unread_count(staffID)
 
     output_data = {
         "status_code": 200,
@@ -242,7 +394,37 @@ def get_notifications_length(staffID):
         "data": total_active_requests
     }
 
-    return output_data, 200
+    # Pollers revalidate with If-None-Match and get an empty 304 while the count is unchanged
+    response = make_response(output_data, 200)
+    response.set_etag(f"{staffID}-{total_active_requests}")
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+@app.route('/wfhRequests/notifications/stream/<int:staff_id>', methods=['GET'])
+def stream_notifications(staff_id):
+    """Server-sent events: the current unread count, then an event whenever a change touches staff_id."""
+    unread_count = notifications.get_unread_count(staff_id)
+    subscription = events.subscribe(staff_id)
+
+    # Not wrapped in stream_with_context: the database session is released when this view returns,
+    # so an idle stream holds no connection
+    def generate():
+        try:
+            yield f"retry: 5000\nevent: count\ndata: {json.dumps({'unread_count': unread_count})}\n\n"
+            while True:
+                try:
+                    notification = subscription.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: notification\ndata: {json.dumps(notification)}\n\n"
+        finally:
+            events.unsubscribe(staff_id, subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
 
 # @app.route('/wfhRequests/getLatestFive/<int:staff_id>', methods=['GET'])
 # def get_latest_five_requests(staff_id):
@@ -284,41 +466,60 @@ def get_notifications_length(staffID):
 
 #     return output_data, 200
 
-@app.route('/wfhRequests/getAll/<int:staff_id>', methods=['GET'])
-def get_all_requests(staff_id):
-    requester_requests = db.session.query(WFHRequest).filter(
-        WFHRequest.requester_id == staff_id,
-        WFHRequest.requester_id != WFHRequest.reporting_manager,  # Exclude if requester is the reporting manager
-        WFHRequest.last_notification_status.in_([NotificationStatus.EDITED, NotificationStatus.SELF_WITHDRAWN, NotificationStatus.ACKNOWLEDGED, NotificationStatus.AUTO_REJECTED, NotificationStatus.WITHDRAWN])
-    )
+def get_inbox(staff_id):
+    """One page of staff_id's notifications, newest first; opening the first page marks everything seen."""
+    try:
+        limit = parse_page_size(request.args.get('limit'))
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-    manager_requests = db.session.query(WFHRequest).filter(
-        WFHRequest.reporting_manager == staff_id,
-        WFHRequest.reporting_manager != WFHRequest.requester_id,  # Exclude if requester is the reporting manager
-        WFHRequest.last_notification_status.in_([NotificationStatus.DELIVERED, NotificationStatus.CANCELLED, NotificationStatus.WITHDRAWN, NotificationStatus.EDITED, NotificationStatus.SELF_WITHDRAWN, NotificationStatus.ACKNOWLEDGED, NotificationStatus.AUTO_REJECTED])
+    # Take at most one page from each side of the inbox, then merge: the cost depends on the page size, not on history
+    newest_first = (WFHRequest.modified_at.desc(), WFHRequest.request_id.desc())
+    sides = []
+    for side in notifications.inbox_sides(staff_id):
+        stmt = select(WFHRequest.request_id, WFHRequest.modified_at).where(side)
+        if after:
+            stmt = stmt.where(tuple_(WFHRequest.modified_at, WFHRequest.request_id) < tuple_(*after))
+        sides.append(select(stmt.order_by(*newest_first).limit(limit + 1).subquery()))
+    page_ids = union_all(*sides).subquery()
+    stmt = (
+        select(WFHRequest)
+        .join(page_ids, WFHRequest.request_id == page_ids.c.request_id)
+        .order_by(*newest_first)
+        .limit(limit + 1)
     )
 
-    combined_requests = requester_requests.union(manager_requests).order_by(WFHRequest.modified_at.desc())
-    requests = combined_requests.all()
-
-    result = []
-    for request in requests:
-        request_data = WFHRequestSchema().dump(request)
-        result.append(request_data)
+    requests = db.session.execute(stmt).scalars().all()
+    has_more = len(requests) > limit
+    requests = requests[:limit]
 
-        request.notification_status = NotificationStatus.SEEN
-        db.session.add(request)
+    # Serialized before marking seen so the page still shows what was unread
+    result = [dump_request(wfh_request) for wfh_request in requests]
+    if not cursor:
+        notifications.mark_seen(staff_id)
+        db.session.commit()
 
-    db.session.commit()
+    next_cursor = None
+    if has_more:
+        last = requests[-1]
+        next_cursor = encode_cursor(last.modified_at, last.request_id)
 
     output_data = {
         "status_code": 200,
         "message": "WFH Requests By Date",
-        "data": result
+        "data": result,
+        "next_cursor": next_cursor
     }
 
     return output_data, 200
 
+@app.route('/wfhRequests/getAll/<int:staff_id>', methods=['GET'])
+@replica.primary  # Marks the inbox seen
+def get_all_requests(staff_id):
+    return get_inbox(staff_id)
+
 @app.route('/wfhRequests/getAuditTrail/<int:request_id>', methods=['GET'])
 def get_all_audit_trails(request_id):
 
@@ -326,10 +527,7 @@ def get_all_audit_trails(request_id):
         AuditTrail.request_id == request_id,
     ).all()
 
-    result = []
-    for request in requests:
-        request_data = AuditTrailSchema().dump(request)
-        result.append(request_data)
+    result = [dump_audit_trail(audit_trail) for audit_trail in requests]
 
     output_data = {
         "status_code": 200,
@@ -340,6 +538,7 @@ def get_all_audit_trails(request_id):
     return output_data, 200
 
 @app.route('/wfhRequests', methods=['POST'])
+@idempotency.idempotent
 def create_wfh_request():
     data = request.get_json()
 
@@ -353,6 +552,10 @@ def create_wfh_request():
             return jsonify({"error": "Requester ID and Reporting Manager are required"}), 400
 
         overall_status = Status.APPROVED if requester_id == reporting_manager else Status.PENDING
+        local_entry_dates = [datetime.strptime(entry_data.get('entry_date'), '%Y-%m-%d %H:%M:%S') for entry_data in entries_data]
+        repeated = sorted(day.isoformat() for day, count in Counter(d.date() for d in local_entry_dates).items() if count > 1)
+        if repeated:
+            return jsonify({"error": "Each date can only be requested once", "dates": repeated}), 400
 
         # Create a new WFHRequest
         wfh_request = WFHRequest(
@@ -363,73 +566,58 @@ def create_wfh_request():
         )
         db.session.add(wfh_request)
         db.session.flush()  # Flush to get the generated wfh_request_id
-        request_id = wfh_request.request_id    
-
+        request_id = wfh_request.request_id
+
+        # All entries go in as one multi-row INSERT ... RETURNING; ids come back in the order the rows were sent
+        entry_rows = [
+            {
+                'request_id': request_id,
+                'requester_id': requester_id,
+                'entry_date': local_entry_date.date(),
+                'reason': entry_data.get('reason'),
+                'duration': entry_data.get('duration'),
+                'action_reason': '',
+                'status': overall_status,
+            }
+            for entry_data, local_entry_date in zip(entries_data, local_entry_dates)
+        ]
+        entry_ids = []
+        if entry_rows:
+            entry_ids = db.session.scalars(
+                insert(WFHRequestEntry).returning(WFHRequestEntry.entry_id, sort_by_parameter_order=True),
+                entry_rows
+            ).all()
+
+        request_audit = {
+            'request_id': request_id,
+            'entry_id': None,
+            'requester_id': requester_id,
+            'reporting_manager': reporting_manager,
+            'department': dept,
+            'status': overall_status,
+            'entry_date': None,
+            'reason': None,
+            'duration': None,
+        }
+        # Self-approved requests are audited as pending, then per entry, then as approved
+        audit_rows = [dict(request_audit, status=Status.PENDING) if reporting_manager == requester_id else request_audit]
+        audit_rows += [
+            dict(request_audit, entry_id=entry_id, entry_date=row['entry_date'], reason=row['reason'], duration=row['duration'])
+            for entry_id, row in zip(entry_ids, entry_rows)
+        ]
         if reporting_manager == requester_id:
-            audit_trail = AuditTrail(
-                request_id=request_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=dept,
-                status=Status.PENDING
-            )
-            db.session.add(audit_trail)
-        else:
-            second_audit_trail = AuditTrail(
-                request_id=request_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=dept,
-                status=overall_status
-            )
-            db.session.add(second_audit_trail)
-            db.session.flush()
+            audit_rows.append(request_audit)
+        db.session.execute(insert(AuditTrail.__table__), audit_rows)
 
-        
-        # Create WFHRequestEntry instances for each entry
-        for entry_data in entries_data:
-            entry = WFHRequestEntry(
-                entry_date=entry_data.get('entry_date'),
-                reason=entry_data.get('reason'),
-                duration=entry_data.get('duration'),
-                action_reason = '',
-                status=overall_status,
-                request_id=request_id  # Explicitly set the request_id here
-            )
-            db.session.add(entry)
-            db.session.flush()  # Flush to get the generated entry_id
-            
-            entry_audit_trail = AuditTrail(
-                request_id=request_id,
-                entry_id=entry.entry_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=dept,
-                status=overall_status,
-                entry_date=entry_data.get('entry_date'),
-                reason=entry_data.get('reason'),
-                duration=entry_data.get('duration'),
-            )
-            db.session.add(entry_audit_trail)
-
-            task_name = "auto_reject"
-            
-            local_entry_date = datetime.strptime(entry_data.get('entry_date'), '%Y-%m-%d %H:%M:%S')
+        occupancy.record_status_changes(dept, [(row['entry_date'], None, overall_status) for row in entry_rows])
+        notifications.record_notification_change(
+            requester_id, reporting_manager, None, NotificationStatus.DELIVERED, wfh_request=wfh_request
+        )
+        # Auto-rejection is scheduled through the outbox, so it commits or rolls back with the entries
+        for entry_id, local_entry_date in zip(entry_ids, local_entry_dates):
             # Get the previous working day at 00:00
             previous_working_day = get_previous_working_day(local_entry_date)
-
-            worker.send_task(task_name, eta=previous_working_day, kwargs={'request_id': request_id, 'entry_id': entry.entry_id})
-
-        if reporting_manager == requester_id:
-            third_audit_trail = AuditTrail(
-                request_id=request_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=dept,
-                status=overall_status
-            )
-            db.session.add(third_audit_trail)
-
+            outbox.enqueue("auto_reject", {'request_id': request_id, 'entry_id': entry_id}, eta=previous_working_day)
         db.session.commit()
 
         # Serialize the response
@@ -443,10 +631,19 @@ def create_wfh_request():
 
     except ValidationError as ve:
         return jsonify({"error": "Invalid data", "details": ve.messages}), 400
+    except IntegrityError as e:
+        db.session.rollback()
+        # Enforced by the unique index over active entry dates, which also catches concurrent submissions
+        requested = {local_entry_date.date() for local_entry_date in local_entry_dates}
+        taken = [day.isoformat() for day in occupied_dates(requester_id, min(requested), max(requested)) if day in requested] if requested else []
+        if taken:
+            return jsonify({"error": "A pending or approved request already exists for these dates", "dates": taken}), 409
+        return jsonify({"error": str(e)}), 500
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
     except Exception as e:
+        db.session.rollback()
         return jsonify({"error": str(e)}), 400
     
 @app.route("/wfhRequests/<int:requestID>", methods=["DELETE"])
@@ -454,6 +651,13 @@ def delete_WFHRequests(requestID):
     try:
         wfh_request = db.session.get(WFHRequest, requestID)
 
+        occupancy.record_status_changes(
+            wfh_request.department, [(entry.entry_date, entry.status, None) for entry in wfh_request.entries]
+        )
+        notifications.record_notification_change(
+            wfh_request.requester_id, wfh_request.reporting_manager, wfh_request.notification_status, None,
+            wfh_request=wfh_request
+        )
         db.session.delete(wfh_request)
         db.session.commit()
         
@@ -467,606 +671,165 @@ def delete_WFHRequests(requestID):
     except ValidationError as e:
         return jsonify({"errors": e.messages}), 400
 
-# for managers only
-@app.route("/wfhRequests/withdraw", methods=["PUT"])
-def withdrawal_requests():
+def retry_later(response):
+    # A transient conflict: Retry-After also tells the Idempotency-Key wrapper not to store it
+    response.status_code = 409
+    response.headers['Retry-After'] = '1'
+    return response
+
+def run_transition(action, message="Entries updated successfully"):
     data = request.get_json()
     request_id = data.get('request_id')
-    entries_data = data.get('entry_ids')  # Expecting a list of objects with entry_id and reason
+    entries_data = data.get('entry_ids')
+    transition = transitions.TRANSITIONS[action]
 
-    # if not request_id or not entry_ids or not isinstance(entry_ids, list):
-    #     return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
     if not request_id or not entries_data or not isinstance(entries_data, list):
-        return jsonify({"error": "request_id and entry_ids (as an array of objects) are required"}), 400
+        if transition.records_reason:
+            return jsonify({"error": "request_id and entry_ids (as an array of objects) are required"}), 400
+        return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
 
     try:
-        wfh_request = WFHRequest.query.get(request_id)
-        if not wfh_request:
-            return jsonify({"error": "Request not found"}), 404
-        requester_id = wfh_request.requester_id
-        reporting_manager = wfh_request.reporting_manager
-        department = wfh_request.department
-
-        entry_ids = [entry.get('entry_id') for entry in entries_data]
-
-        # Find the WFHRequestEntry records that match the request_id and are in the list of entry_ids
-        entries = WFHRequestEntry.query.filter(
-            WFHRequestEntry.request_id == request_id,
-            WFHRequestEntry.entry_id.in_(entry_ids)
-        ).all()
-
-        if not entries:
-            return jsonify({"error": "No matching entries found"}), 404
-
-        reasons_map = {entry['entry_id']: entry['reason'] for entry in entries_data}
-
-        # Update the status of the found entries to WITHDRAWN
-        for entry in entries:
-            entry.status = Status.WITHDRAWN
-            entry.action_reason = reasons_map.get(entry.entry_id)
-            entry_audit_trail = AuditTrail(
-                request_id=request_id,
-                entry_id=entry.entry_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=department,
-                status=Status.WITHDRAWN,
-                action_reason=reasons_map.get(entry.entry_id),
-                entry_date=entry.entry_date,
-                reason=entry.reason,
-                duration=entry.duration,
-            )
-            db.session.add(entry_audit_trail)
-
-
-        all_entries = WFHRequestEntry.query.filter_by(request_id=request_id).all()
-        status_set = set(entry.status for entry in all_entries)
-
-        if len(status_set) > 1:
-            overall_status = Status.REVIEWED
-        else:
-            overall_status = Status.WITHDRAWN
-
-        notification_status = NotificationStatus.WITHDRAWN
-
-        request_record = WFHRequest.query.get(request_id)
-        if request_record:
-            if request_record.overall_status != overall_status:
-                audit_trail = AuditTrail(
-                    request_id=request_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=overall_status,
-                )
-                db.session.add(audit_trail)
-            request_record.overall_status = overall_status
-            request_record.notification_status = notification_status
-            request_record.last_notification_status = notification_status
-            db.session.commit()
-        else:
-            return jsonify({"error": "Request not found"}), 404
-        
-        db.session.commit()
+        # A request that fails its transition is left untouched, so there is nothing to roll back
+        [outcome] = transitions.commit_transition(action, transitions.parse_items(transition, [data]))
+        if 'error' in outcome:
+            return jsonify({"error": outcome['error']}), 404
 
-        return jsonify({"message": "Entries updated successfully"}), 200
+        return jsonify({"message": message}), 200
 
+    except StaleDataError:
+        return retry_later(jsonify({"error": "The request was modified concurrently, please retry"}))
+    except IntegrityError:
+        # Reactivating an entry whose date another active request already holds
+        db.session.rollback()
+        return jsonify({"error": "A pending or approved request already exists for one of these dates"}), 409
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+# for managers only
+@app.route("/wfhRequests/withdraw", methods=["PUT"])
+@idempotency.idempotent
+def withdrawal_requests():
+    return run_transition('withdraw')
+
 @app.route("/wfhRequests/approve", methods=["PUT"])
+@idempotency.idempotent
 def approval_requests():
-    data = request.get_json()
-    request_id = data.get('request_id')
-    entry_ids = data.get('entry_ids')  # Expecting a list of entry IDs
+    return run_transition('approve')
 
-    if not request_id or not entry_ids or not isinstance(entry_ids, list):
-        return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
-
-    try:
-        wfh_request = WFHRequest.query.get(request_id)
-        if not wfh_request:
-            return jsonify({"error": "Request not found"}), 404
-        requester_id = wfh_request.requester_id
-        reporting_manager = wfh_request.reporting_manager
-        department = wfh_request.department
-
-        # Find the WFHRequestEntry records that match the request_id and are in the list of entry_ids
-        entries = WFHRequestEntry.query.filter(
-            WFHRequestEntry.request_id == request_id,
-            WFHRequestEntry.entry_id.in_(entry_ids)
-        ).all()
-
-        if not entries:
-            return jsonify({"error": "No matching entries found"}), 404
-
-        # Update the status of the found entries to WITHDRAWN
-        for entry in entries:
-            entry.status = Status.APPROVED
-            entry_audit_trail = AuditTrail(
-                request_id=request_id,
-                entry_id=entry.entry_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=department,
-                status=Status.APPROVED,
-                entry_date=entry.entry_date,
-                reason=entry.reason,
-                duration=entry.duration,
-            )
-            db.session.add(entry_audit_trail)
-
-        all_entries = WFHRequestEntry.query.filter_by(request_id=request_id).all()
-        status_set = set(entry.status for entry in all_entries)
-
-        if len(status_set) > 1:
-            overall_status = Status.REVIEWED
-            
-        else:
-            overall_status = Status.APPROVED
-        
-        notification_status = NotificationStatus.EDITED
-        
-        request_record = WFHRequest.query.get(request_id)
-        if request_record:
-            if request_record.overall_status != overall_status:
-                audit_trail = AuditTrail(
-                    request_id=request_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=overall_status,
-                )
-                db.session.add(audit_trail)
-            request_record.overall_status = overall_status
-            request_record.notification_status = notification_status
-            request_record.last_notification_status = notification_status
-            db.session.commit()
-        else:
-            return jsonify({"error": "Request not found"}), 404
-        
-        db.session.commit()
-
-        return jsonify({"message": "Entries updated successfully"}), 200
-
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
-    
 @app.route("/wfhRequests/reject", methods=["PUT"])
+@idempotency.idempotent
 def reject_requests():
-    data = request.get_json()
-    request_id = data.get('request_id')
-    # entry_ids = data.get('entry_ids')  # Expecting a list of entry IDs
-    entries_data = data.get('entry_ids')  # Expecting a list of objects with entry_id and reason
-
-
-    # if not request_id or not entry_ids or not isinstance(entry_ids, list):
-    #     return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
-    if not request_id or not entries_data or not isinstance(entries_data, list):
-        return jsonify({"error": "request_id and entry_ids (as an array of objects) are required"}), 400
-    
-    try:
-        wfh_request = WFHRequest.query.get(request_id)
-        if not wfh_request:
-            return jsonify({"error": "Request not found"}), 404
-        requester_id = wfh_request.requester_id
-        reporting_manager = wfh_request.reporting_manager
-        department = wfh_request.department
-
-        entry_ids = [entry.get('entry_id') for entry in entries_data]
-
-        # Find the WFHRequestEntry records that match the request_id and are in the list of entry_ids
-        entries = WFHRequestEntry.query.filter(
-            WFHRequestEntry.request_id == request_id,
-            WFHRequestEntry.entry_id.in_(entry_ids)
-        ).all()
-
-        if not entries:
-            return jsonify({"error": "No matching entries found"}), 404
-        
-        reasons_map = {entry['entry_id']: entry['reason'] for entry in entries_data}
-
-
-        # Update the status of the found entries to WITHDRAWN
-        for entry in entries:
-            entry.status = Status.REJECTED
-            entry.action_reason = reasons_map.get(entry.entry_id)
-            entry_audit_trail = AuditTrail(
-                request_id=request_id,
-                entry_id=entry.entry_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=department,
-                status=Status.REJECTED,
-                action_reason=reasons_map.get(entry.entry_id),
-                entry_date=entry.entry_date,
-                reason=entry.reason,
-                duration=entry.duration,
-            )
-            db.session.add(entry_audit_trail)
-
-
-        all_entries = WFHRequestEntry.query.filter_by(request_id=request_id).all()
-        status_set = set(entry.status for entry in all_entries)
-
-        if len(status_set) > 1:
-            overall_status = Status.REVIEWED
-        else:
-            overall_status = Status.REJECTED
-
-        notification_status = NotificationStatus.EDITED
-
-        request_record = WFHRequest.query.get(request_id)
-        if request_record:
-            if request_record.overall_status != overall_status:
-                audit_trail = AuditTrail(
-                    request_id=request_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=overall_status,
-                )
-                db.session.add(audit_trail)
-            request_record.overall_status = overall_status
-            request_record.notification_status = notification_status
-            request_record.last_notification_status = notification_status
-            
-            
-            db.session.commit()
-        else:
-            return jsonify({"error": "Request not found"}), 404
-        
-        db.session.commit()
-
-        return jsonify({"message": "Entries updated successfully"}), 200
-
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+    return run_transition('reject')
 
 @app.route("/wfhRequests/cancel", methods=["PUT"])
+@idempotency.idempotent
 def cancel_requests():
-    data = request.get_json()
-    request_id = data.get('request_id')
-    entry_ids = data.get('entry_ids')  # Expecting a list of entry IDs
-
-    if not request_id or not entry_ids or not isinstance(entry_ids, list):
-        return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
-
-    try:
-        wfh_request = WFHRequest.query.get(request_id)
-        if not wfh_request:
-            return jsonify({"error": "Request not found"}), 404
-        requester_id = wfh_request.requester_id
-        reporting_manager = wfh_request.reporting_manager
-        department = wfh_request.department
-
-        # Find the WFHRequestEntry records that match the request_id and are in the list of entry_ids
-        entries = WFHRequestEntry.query.filter(
-            WFHRequestEntry.request_id == request_id,
-            WFHRequestEntry.entry_id.in_(entry_ids)
-        ).all()
-
-        if not entries:
-            return jsonify({"error": "No matching entries found"}), 404
-
-        # Update the status of the found entries to WITHDRAWN
-        for entry in entries:
-            entry.status = Status.CANCELLED
-            entry_audit_trail = AuditTrail(
-                request_id=request_id,
-                entry_id=entry.entry_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=department,
-                status=Status.CANCELLED,
-                entry_date=entry.entry_date,
-                reason=entry.reason,
-                duration=entry.duration,
-            )
-            db.session.add(entry_audit_trail)
-
-        all_entries = WFHRequestEntry.query.filter_by(request_id=request_id).all()
-        status_set = set(entry.status for entry in all_entries)
-
-        if len(status_set) > 1:
-            overall_status = Status.PENDING
-        else:
-            overall_status = Status.CANCELLED
-
-        notification_status = NotificationStatus.CANCELLED
-
-        request_record = WFHRequest.query.get(request_id)
-        if request_record:
-            if request_record.overall_status != overall_status:
-                audit_trail = AuditTrail(
-                    request_id=request_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=overall_status,
-                )
-                db.session.add(audit_trail)
-            request_record.overall_status = overall_status
-            request_record.notification_status = notification_status
-            request_record.last_notification_status = notification_status
-            db.session.commit()
-        else:
-            return jsonify({"error": "Request not found"}), 404
-        
-        db.session.commit()
-
-        return jsonify({"message": "Entries updated successfully"}), 200
-
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+    return run_transition('cancel')
 
 # for staff
 @app.route("/wfhRequests/revoke", methods=["PUT"])
+@idempotency.idempotent
 def revoke_requests():
-    data = request.get_json()
-    request_id = data.get('request_id')
-    entry_ids = data.get('entry_ids')  # Expecting a list of entry IDs
-
-    if not request_id or not entry_ids or not isinstance(entry_ids, list):
-        return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
-
-    try:
-        request_record = WFHRequest.query.get(request_id)
-        requester_id = request_record.requester_id
-        reporting_manager = request_record.reporting_manager
-        department = request_record.department
-
-        matches = request_record.requester_id == request_record.reporting_manager
-
-        # Find the WFHRequestEntry records that match the request_id and are in the list of entry_ids
-        entries = WFHRequestEntry.query.filter(
-            WFHRequestEntry.request_id == request_id,
-            WFHRequestEntry.entry_id.in_(entry_ids)
-        ).all()
-
-        if not entries:
-            return jsonify({"error": "No matching entries found"}), 404
-
-        # Update the status of the found entries to WITHDRAWN
-        for entry in entries:
-            if matches:
-                entry.status = Status.WITHDRAWN
-                entry_audit_trail = AuditTrail(
-                    request_id=request_id,
-                    entry_id=entry.entry_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=Status.WITHDRAWN,
-                    entry_date=entry.entry_date,
-                    reason=entry.reason,
-                    duration=entry.duration,
-                )
-                db.session.add(entry_audit_trail)
-            else:
-                entry.status = Status.PENDING_WITHDRAWN
-                entry_audit_trail = AuditTrail(
-                    request_id=request_id,
-                    entry_id=entry.entry_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=Status.PENDING_WITHDRAWN,
-                    entry_date=entry.entry_date,
-                    reason=entry.reason,
-                    duration=entry.duration,
-                )
-                db.session.add(entry_audit_trail)
-
-        all_entries = WFHRequestEntry.query.filter_by(request_id=request_id).all()
-        status_set = set(entry.status for entry in all_entries)
-
-        if len(status_set) > 1:
-            overall_status = Status.REVIEWED
-        else:
-            if matches:
-                overall_status = Status.WITHDRAWN
-            else:
-                overall_status = Status.PENDING_WITHDRAWN
-
-        notification_status = NotificationStatus.SELF_WITHDRAWN
-
-        request_record = WFHRequest.query.get(request_id)
-        if request_record:
-            if request_record.overall_status != overall_status:
-                audit_trail = AuditTrail(
-                    request_id=request_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=overall_status,
-                )
-                db.session.add(audit_trail)
-            request_record.overall_status = overall_status
-            request_record.notification_status = notification_status
-            request_record.last_notification_status = notification_status
-            db.session.commit()
-        else:
-            return jsonify({"error": "Request not found"}), 404
-        
-        db.session.commit()
-
-        return jsonify({"message": "Entries updated successfully"}), 200
-
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
+    return run_transition('revoke')
 
 @app.route("/wfhRequests/acknowledge", methods=["PUT"])
+@idempotency.idempotent
 def acknowledge_requests():
-    data = request.get_json()
-    request_id = data.get('request_id')
-    entry_ids = data.get('entry_ids')  # Expecting a list of entry IDs
-
-    if not request_id or not entry_ids or not isinstance(entry_ids, list):
-        return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
-
-    try:
-        wfh_request = WFHRequest.query.get(request_id)
-        if not wfh_request:
-            return jsonify({"error": "Request not found"}), 404
-        requester_id = wfh_request.requester_id
-        reporting_manager = wfh_request.reporting_manager
-        department = wfh_request.department
-
-        # Find the WFHRequestEntry records that match the request_id and are in the list of entry_ids
-        entries = WFHRequestEntry.query.filter(
-            WFHRequestEntry.request_id == request_id,
-            WFHRequestEntry.entry_id.in_(entry_ids)
-        ).all()
-
-        if not entries:
-            return jsonify({"error": "No matching entries found"}), 404
-
-        # Update the status of the found entries to WITHDRAWN
-        for entry in entries:
-            entry.status = Status.WITHDRAWN
-            entry_audit_trail = AuditTrail(
-                request_id=request_id,
-                entry_id=entry.entry_id,
-                requester_id=requester_id,
-                reporting_manager=reporting_manager,
-                department=department,
-                status=Status.WITHDRAWN,
-                entry_date=entry.entry_date,
-                reason=entry.reason,
-                duration=entry.duration,
-            )
-            db.session.add(entry_audit_trail)
-
-        all_entries = WFHRequestEntry.query.filter_by(request_id=request_id).all()
-        status_set = set(entry.status for entry in all_entries)
-
-        if len(status_set) > 1:
-            overall_status = Status.REVIEWED
-        else:
-            overall_status = Status.WITHDRAWN
-
-        notification_status = NotificationStatus.ACKNOWLEDGED
-
-        request_record = WFHRequest.query.get(request_id)
-        if request_record:
-            if request_record.overall_status != overall_status:
-                audit_trail = AuditTrail(
-                    request_id=request_id,
-                    requester_id=requester_id,
-                    reporting_manager=reporting_manager,
-                    department=department,
-                    status=overall_status,
-                )
-                db.session.add(audit_trail)
-            request_record.overall_status = overall_status
-            request_record.notification_status = notification_status
-            request_record.last_notification_status = notification_status
-            db.session.commit()
-        else:
-            return jsonify({"error": "Request not found"}), 404
-        
-        db.session.commit()
-
-        return jsonify({"message": "Entries updated successfully"}), 200
-
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        return jsonify({"error": str(e)}), 500
-
+    return run_transition('acknowledge')
 
 @app.route("/wfhRequests/autoReject", methods=["PUT"])
+@idempotency.idempotent
 def auto_reject_requests():
-    data = request.get_json()
-    request_id = data.get('request_id')
-    entry_ids = data.get('entry_ids')  # Expecting a list of entry IDs
+    return run_transition('auto_reject', message="Entries updated successfully to AUTO_REJECTED")
 
-    if not request_id or not entry_ids or not isinstance(entry_ids, list):
-        return jsonify({"error": "request_id and entry_ids (as an array) are required"}), 400
 
-    try:
-        # Find the WFHRequestEntry records that match the request_id and are in the list of entry_ids
-        entries = WFHRequestEntry.query.filter(
-            WFHRequestEntry.request_id == request_id,
-            WFHRequestEntry.entry_id.in_(entry_ids)
-        ).all()
-
-        if not entries:
-            return jsonify({"error": "No matching entries found"}), 404
-        
-        # Update the status of the found entries to AUTO_REJECTED
-        for entry in entries:
-            if (entry.status == Status.PENDING):
-                entry.status = Status.AUTO_REJECTED
-
-        all_entries = WFHRequestEntry.query.filter_by(request_id=request_id).all()
-        status_set = set(entry.status for entry in all_entries)
-
-        if len(status_set) > 1:
-            overall_status = Status.REVIEWED
-        else:
-            overall_status = Status.AUTO_REJECTED  # Set overall status to AUTO_REJECTED if all entries are auto-rejected
-
-        notification_status = NotificationStatus.AUTO_REJECTED  # Assuming a notification status for auto-rejection
-
-        request_record = WFHRequest.query.get(request_id)
-        if request_record:
-            request_record.overall_status = overall_status
-            request_record.notification_status = notification_status
-            request_record.last_notification_status = notification_status
-            db.session.commit()
-        else:
-            return jsonify({"error": "Request not found"}), 404
-
-        db.session.commit()
+@app.route("/wfhRequests/bulk/<string:action>", methods=["PUT"])
+@idempotency.idempotent
+def bulk_transition(action):
+    if action not in BULK_ACTIONS:
+        return jsonify({"error": f"Unsupported bulk action: {action}"}), 404
 
-        return jsonify({"message": "Entries updated successfully to AUTO_REJECTED"}), 200
+    data = request.get_json()
+    items_data = data.get('items') if isinstance(data, dict) else None
+    if not items_data or not isinstance(items_data, list):
+        return jsonify({"error": "items (as an array of {request_id, entry_ids, reason} objects) are required"}), 400
+    if len(items_data) > MAX_BULK_ITEMS:
+        return jsonify({"error": f"At most {MAX_BULK_ITEMS} items are accepted per call"}), 400
+
+    transition = transitions.TRANSITIONS[action]
+    results = [None] * len(items_data)
+    items, positions, request_ids = [], [], set()
+    for position, item_data in enumerate(items_data):
+        try:
+            item = transitions.parse_bulk_item(transition, item_data)
+        except ValueError as e:
+            results[position] = {"request_id": item_data.get('request_id') if isinstance(item_data, dict) else None,
+                                 "status": "failed", "error": str(e)}
+            continue
+        if item.request_id in request_ids:
+            results[position] = {"request_id": item.request_id, "status": "failed", "error": "Duplicate request_id"}
+            continue
+        request_ids.add(item.request_id)
+        items.append(item)
+        positions.append(position)
 
+    try:
+        # Every valid item is applied in this one transaction
+        outcomes = transitions.commit_transition(action, items) if items else []
+    except StaleDataError:
+        return retry_later(jsonify({"error": "One of the requests was modified concurrently, please retry"}))
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "A pending or approved request already exists for one of these dates"}), 409
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+    for position, outcome in zip(positions, outcomes):
+        results[position] = dict(outcome, status="failed" if 'error' in outcome else "updated")
 
-@app.route('/wfhRequests/getAudit/<int:staff_id>', methods=['GET'])
-def get_audit_trail_by_staff_id(staff_id):
-    requester_requests = db.session.query(WFHRequest).filter(
-        WFHRequest.requester_id == staff_id,
-        WFHRequest.requester_id != WFHRequest.reporting_manager,  # Exclude if requester is the reporting manager
-        WFHRequest.last_notification_status.in_([NotificationStatus.EDITED, NotificationStatus.SELF_WITHDRAWN, NotificationStatus.ACKNOWLEDGED, NotificationStatus.AUTO_REJECTED, NotificationStatus.WITHDRAWN])
-    )
-
-    manager_requests = db.session.query(WFHRequest).filter(
-        WFHRequest.reporting_manager == staff_id,
-        WFHRequest.reporting_manager != WFHRequest.requester_id,  # Exclude if requester is the reporting manager
-        WFHRequest.last_notification_status.in_([NotificationStatus.DELIVERED, NotificationStatus.CANCELLED, NotificationStatus.WITHDRAWN, NotificationStatus.EDITED, NotificationStatus.SELF_WITHDRAWN, NotificationStatus.ACKNOWLEDGED, NotificationStatus.AUTO_REJECTED])
-    )
-
-    combined_requests = requester_requests.union(manager_requests).order_by(WFHRequest.modified_at.desc())
-    requests = combined_requests.all()
+    updated = sum(1 for result in results if result['status'] == "updated")
+    output_data = {
+        "status_code": 200,
+        "message": f"Bulk {action} processed",
+        "data": {
+            "updated": updated,
+            "failed": len(results) - updated,
+            "results": results
+        }
+    }
+    return output_data, 200
 
-    result = []
-    for request in requests:
-        request_data = WFHRequestSchema().dump(request)
-        result.append(request_data)
 
-        request.notification_status = NotificationStatus.SEEN
-        db.session.add(request)
+@app.route('/wfhRequests/getAuditTrail/<int:request_id>/archive', methods=['GET'])
+def get_archived_audit_trails(request_id):
+    # Optional YYYY-MM bounds limit the archive files that are read
+    from_month = request.args.get('from')
+    to_month = request.args.get('to')
+    try:
+        for month in (from_month, to_month):
+            if month is not None:
+                datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({"error": "from and to must be in YYYY-MM format"}), 400
 
-    db.session.commit()
+    result = audit_archive.read_archive(app.config["AUDIT_ARCHIVE_DIR"], request_id, from_month, to_month)
 
     output_data = {
         "status_code": 200,
-        "message": "WFH Requests By Date",
+        "message": "Archived audit trail",
         "data": result
     }
 
     return output_data, 200
 
+
+@app.route('/wfhRequests/getAudit/<int:staff_id>', methods=['GET'])
+@replica.primary  # Marks the inbox seen
+def get_audit_trail_by_staff_id(staff_id):
+    return get_inbox(staff_id)
+
     
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5002)
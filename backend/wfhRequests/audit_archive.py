@@ -0,0 +1,204 @@
+"""Monthly partitions of audittrail and the archives of cold months.
+
+On PostgreSQL, migration 0006 turns audittrail into a table partitioned by
+created_at month (audittrail_YYYY_MM, plus audittrail_default for rows no
+month partition covers yet). Recent audit lookups only touch the partitions
+they need.
+
+archive() writes every month older than the horizon to
+<archive dir>/audittrail_YYYY_MM.ndjson.gz: one AuditTrailSchema row per line,
+ordered by audit_id. It records the file in manifest.json and then drops the
+partition; empty months are dropped without a file. read_archive() answers lookups from those files, using the
+request_id range in the manifest to skip files.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+from datetime import date, datetime, timezone
+
+from sqlalchemy import select, text
+
+from factory import AuditTrail
+from serializers import dump_audit_trail
+
+MANIFEST = "manifest.json"
+DEFAULT_PARTITION = "audittrail_default"
+# Month partitions kept ahead of the current month
+PARTITIONS_AHEAD = 3
+PARTITION_NAME = re.compile(r"^audittrail_(\d{4})_(\d{2})$")
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def partition_name(month):
+    return f"audittrail_{month:%Y_%m}"
+
+
+def month_bounds(month):
+    # Partition bounds are UTC midnights, so a month holds the same rows wherever the server runs
+    lower = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+    upper_month = add_months(month, 1)
+    return lower, datetime(upper_month.year, upper_month.month, 1, tzinfo=timezone.utc)
+
+
+def is_partitioned(conn):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'audittrail'"
+    )).first() is not None
+
+
+def partition_months(conn):
+    """Months that currently have a partition, oldest first."""
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'audittrail'"
+    )).scalars()
+    months = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match[1]), int(match[2]), 1))
+    return sorted(months)
+
+
+def create_partition(conn, month):
+    """Add the partition for month, moving in any of its rows that landed in the default partition."""
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+        return False
+    lower, upper = month_bounds(month)
+    bounds = {"lower": lower, "upper": upper}
+    conn.execute(text(f"CREATE TABLE {name} (LIKE audittrail INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    conn.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :lower AND created_at < :upper RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    # ATTACH also creates the partition's primary key and indexes from the parent's
+    conn.execute(text(
+        f"ALTER TABLE audittrail ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    ))
+    return True
+
+
+def ensure_partitions(conn, first_month, today=None):
+    """Create the month partitions from first_month through PARTITIONS_AHEAD months after today."""
+    last_month = add_months(month_start(today or date.today()), PARTITIONS_AHEAD)
+    created = []
+    month = first_month
+    while month <= last_month:
+        if create_partition(conn, month):
+            created.append(month)
+        month = add_months(month, 1)
+    return created
+
+
+def load_manifest(archive_dir):
+    try:
+        with open(os.path.join(archive_dir, MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return {"archives": []}
+
+
+def save_manifest(archive_dir, manifest):
+    path = os.path.join(archive_dir, MANIFEST)
+    with open(path + ".tmp", "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+        manifest_file.flush()
+        os.fsync(manifest_file.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def archive_month(conn, month, archive_dir):
+    """Write month's rows to a gzip NDJSON file and return its manifest entry, or None if it has no rows."""
+    lower, upper = month_bounds(month)
+    file_name = f"{partition_name(month)}.ndjson.gz"
+    path = os.path.join(archive_dir, file_name)
+    stmt = (
+        select(AuditTrail.__table__)
+        .where(AuditTrail.created_at >= lower, AuditTrail.created_at < upper)
+        .order_by(AuditTrail.audit_id)
+    )
+
+    digest = hashlib.sha256()
+    rows = 0
+    min_request_id = max_request_id = None
+    with gzip.open(path + ".tmp", "wb") as archive_file:
+        for row in conn.execute(stmt, execution_options={"yield_per": 1000}):
+            line = (json.dumps(dump_audit_trail(row), separators=(",", ":")) + "\n").encode()
+            archive_file.write(line)
+            digest.update(line)
+            rows += 1
+            min_request_id = row.request_id if min_request_id is None else min(min_request_id, row.request_id)
+            max_request_id = row.request_id if max_request_id is None else max(max_request_id, row.request_id)
+    if not rows:
+        os.remove(path + ".tmp")
+        return None
+    with open(path + ".tmp", "rb") as archive_file:
+        os.fsync(archive_file.fileno())
+    os.replace(path + ".tmp", path)
+
+    return {
+        "month": f"{month:%Y-%m}",
+        "file": file_name,
+        "rows": rows,
+        "min_request_id": min_request_id,
+        "max_request_id": max_request_id,
+        # Of the uncompressed NDJSON
+        "sha256": digest.hexdigest(),
+        "archived_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def archive(engine, horizon_months, archive_dir, today=None):
+    """Archive and drop every month partition older than horizon_months; return the months archived."""
+    cutoff = add_months(month_start(today or date.today()), -horizon_months)
+    os.makedirs(archive_dir, exist_ok=True)
+    archived = []
+    with engine.connect() as conn:
+        if not is_partitioned(conn):
+            return archived
+        months = [month for month in partition_months(conn) if month < cutoff]
+
+    for month in months:
+        # One transaction per month: the partition is only dropped once its file and manifest entry are on disk
+        with engine.begin() as conn:
+            entry = archive_month(conn, month, archive_dir)
+            if entry is not None:
+                manifest = load_manifest(archive_dir)
+                manifest["archives"] = [item for item in manifest["archives"] if item["month"] != entry["month"]] + [entry]
+                manifest["archives"].sort(key=lambda item: item["month"])
+                save_manifest(archive_dir, manifest)
+            conn.execute(text(f"ALTER TABLE audittrail DETACH PARTITION {partition_name(month)}"))
+            conn.execute(text(f"DROP TABLE {partition_name(month)}"))
+        archived.append(month)
+    return archived
+
+
+def read_archive(archive_dir, request_id, from_month=None, to_month=None):
+    """Archived audit rows of request_id, oldest first, from months between from_month and to_month ("YYYY-MM")."""
+    rows = []
+    for entry in load_manifest(archive_dir)["archives"]:
+        if from_month and entry["month"] < from_month or to_month and entry["month"] > to_month:
+            continue
+        if not entry["min_request_id"] <= request_id <= entry["max_request_id"]:
+            continue
+        with gzip.open(os.path.join(archive_dir, entry["file"]), "rt") as archive_file:
+            for line in archive_file:
+                row = json.loads(line)
+                if row["request_id"] == request_id:
+                    rows.append(row)
+    return rows
@@ -0,0 +1,81 @@
+"""Measure POST /wfhRequests latency for requests with 1, 20 and 200 entries.
+
+Run from backend/wfhRequests against a scratch database:
+
+    DATABASE_URI=postgresql+psycopg://... python -m benchmarks.create_benchmark [rounds]
+
+Auto-rejection tasks only reach the outbox; run no relay against the scratch
+database. Every request and task the benchmark creates is deleted afterwards.
+"""
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import event
+
+from app import app
+from factory import db, WFHRequest, AuditTrail, WFHDailyOccupancy, NotificationCounter, TaskOutbox
+
+DEPARTMENT = "CreateBenchmark"
+REQUESTER_ID = 990401
+MANAGER_ID = 990402
+ENTRY_COUNTS = (1, 20, 200)
+
+
+def payload(entry_count):
+    first_day = date(2033, 1, 1)
+    return {
+        "requester_id": REQUESTER_ID,
+        "reporting_manager": MANAGER_ID,
+        "department": DEPARTMENT,
+        "entries": [
+            {"entry_date": f"{first_day + timedelta(days=day)} 09:00:00", "reason": "Benchmark", "duration": "Full Day"}
+            for day in range(entry_count)
+        ],
+    }
+
+
+def cleanup(last_outbox_id):
+    for wfh_request in db.session.query(WFHRequest).filter_by(department=DEPARTMENT):
+        db.session.query(AuditTrail).filter_by(request_id=wfh_request.request_id).delete()
+        db.session.delete(wfh_request)
+    db.session.query(NotificationCounter).filter(NotificationCounter.staff_id.in_([REQUESTER_ID, MANAGER_ID])).delete()
+    db.session.query(WFHDailyOccupancy).filter_by(department=DEPARTMENT).delete()
+    db.session.query(TaskOutbox).filter(TaskOutbox.outbox_id > last_outbox_id).delete()
+    db.session.commit()
+
+
+def main(rounds):
+    client = app.test_client()
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        last_outbox_id = db.session.query(db.func.max(TaskOutbox.outbox_id)).scalar() or 0
+        event.listen(db.engine, "before_cursor_execute", count_statement)
+        print(f"{rounds} rounds per size on {db.engine.dialect.name}")
+        print(f"{'entries':>8}{'median':>12}{'p95':>12}{'statements':>12}")
+        try:
+            for entry_count in ENTRY_COUNTS:
+                body = payload(entry_count)
+                latencies = []
+                for _ in range(rounds):
+                    statements.clear()
+                    start = time.perf_counter()
+                    response = client.post('/wfhRequests', json=body)
+                    latencies.append(time.perf_counter() - start)
+                    if response.status_code != 201:
+                        raise SystemExit(f"POST failed with {response.status_code}: {response.get_data(as_text=True)}")
+                p95 = statistics.quantiles(latencies, n=20)[-1] if rounds > 1 else latencies[0]
+                print(f"{entry_count:>8}{statistics.median(latencies) * 1000:>10.1f}ms{p95 * 1000:>10.1f}ms{len(statements):>12}")
+                cleanup(last_outbox_id)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", count_statement)
+            cleanup(last_outbox_id)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
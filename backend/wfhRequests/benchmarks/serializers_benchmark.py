@@ -0,0 +1,65 @@
+"""Compare the precompiled serializers with the marshmallow schemas.
+
+Run from backend/wfhRequests (no database needed):
+
+    python -m benchmarks.serializers_benchmark [rows]
+
+Rows are transient model instances, so only serialization is measured.
+"""
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from factory import (
+    Status, NotificationStatus, WFHRequest, WFHRequestEntry, AuditTrail,
+    WFHRequestSchema, WFHRequestEntrySchema, AuditTrailSchema,
+)
+from serializers import dump_request, dump_entry, dump_audit_trail
+
+
+def make_rows(count):
+    created_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    requests, entries, audit_trails = [], [], []
+    for i in range(count):
+        requests.append(WFHRequest(
+            request_id=i, requester_id=100000 + i % 500, reporting_manager=130002, department="Engineering",
+            overall_status=Status.APPROVED, notification_status=NotificationStatus.SEEN,
+            last_notification_status=NotificationStatus.EDITED, created_at=created_at, modified_at=created_at
+        ))
+        entries.append(WFHRequestEntry(
+            entry_id=i, request_id=i, entry_date=date(2024, 1, 1) + timedelta(days=i % 365), reason="Appointment",
+            duration="Full Day", status=Status.APPROVED, action_reason=""
+        ))
+        audit_trails.append(AuditTrail(
+            audit_id=i, request_id=i, entry_id=i, requester_id=100000 + i % 500, reporting_manager=130002,
+            department="Engineering", entry_date=date(2024, 1, 1), reason="Appointment", duration="Full Day",
+            status=Status.APPROVED, action_reason="", created_at=created_at
+        ))
+    return requests, entries, audit_trails
+
+
+def timed(dump, rows):
+    start = time.perf_counter()
+    result = [dump(row) for row in rows]
+    return time.perf_counter() - start, result
+
+
+def main(count):
+    requests, entries, audit_trails = make_rows(count)
+    print(f"{count} rows per model")
+    print(f"{'model':<16}{'marshmallow':>14}{'precompiled':>14}{'speedup':>10}")
+    for label, schema_class, dump, rows in (
+        ("WFHRequest", WFHRequestSchema, dump_request, requests),
+        ("WFHRequestEntry", WFHRequestEntrySchema, dump_entry, entries),
+        ("AuditTrail", AuditTrailSchema, dump_audit_trail, audit_trails),
+    ):
+        # The endpoints built a new schema per row, so the baseline does the same
+        schema_seconds, expected = timed(lambda row: schema_class().dump(row), rows)
+        fast_seconds, actual = timed(dump, rows)
+        if [list(item.items()) for item in actual] != [list(item.items()) for item in expected]:
+            raise SystemExit(f"{label}: precompiled output differs from the schema")
+        print(f"{label:<16}{schema_seconds:>13.3f}s{fast_seconds:>13.3f}s{schema_seconds / fast_seconds:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,162 @@
+"""Live notification events for /wfhRequests/notifications/stream/<staff_id>.
+
+Write paths queue an event for every staff member they touch with
+queue_event(); once the transaction commits, the batch is handed to a
+publisher thread, which sends it to a fanout exchange on the RabbitMQ broker.
+The response never waits on the broker: while it is slow or down, batches
+wait in a bounded backlog and are dropped once it is full, costing only the
+live update. Each worker process binds its own exclusive queue to that
+exchange and hands events to the streams subscribed to that staff member, so
+an event reaches a client whichever worker holds its connection. Without a
+broker, events are delivered within this process only.
+"""
+import logging
+import queue
+import socket
+import threading
+import time
+
+from kombu import Connection, Exchange, Queue
+from kombu.pools import producers
+from sqlalchemy import event
+
+from factory import db
+
+logger = logging.getLogger(__name__)
+
+# Shared with the employee service, which publishes delegation events to the same exchange
+EXCHANGE = Exchange('notifications', type='fanout', durable=False)
+PENDING_KEY = 'pending_notification_events'
+# Events buffered per open stream; a stream that falls this far behind misses events
+SUBSCRIBER_BACKLOG = 100
+DRAIN_TIMEOUT = 10
+RECONNECT_DELAY = 5
+# Committed batches waiting for the publisher thread; past this many, new batches are dropped
+PUBLISH_BACKLOG = 1000
+
+_connection = None
+_subscribers = {}
+_lock = threading.Lock()
+_consumer = None
+_outgoing = queue.Queue(maxsize=PUBLISH_BACKLOG)
+_publisher = None
+
+
+def init_app(broker_url):
+    global _connection
+    _connection = Connection(broker_url) if broker_url else None
+
+
+def queue_event(staff_id, payload):
+    """Queue payload for staff_id; it is sent only if the current transaction commits."""
+    db.session.info.setdefault(PENDING_KEY, []).append(dict(payload, staff_id=staff_id))
+
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        publish(pending)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop(PENDING_KEY, None)
+
+
+def publish(events):
+    if _connection is None:
+        dispatch(events)
+        return
+    _ensure_publisher()
+    try:
+        _outgoing.put_nowait(events)
+    except queue.Full:
+        logger.warning("Dropping %d notification events, the broker publisher is behind", len(events))
+
+
+def dispatch(events):
+    """Hand events to the streams open in this process."""
+    for notification in events:
+        with _lock:
+            subscriptions = list(_subscribers.get(notification['staff_id'], ()))
+        for subscription in subscriptions:
+            try:
+                subscription.put_nowait(notification)
+            except queue.Full:
+                logger.warning("Dropping notification event for staff %s", notification['staff_id'])
+
+
+def subscribe(staff_id):
+    _ensure_consumer()
+    subscription = queue.Queue(maxsize=SUBSCRIBER_BACKLOG)
+    with _lock:
+        _subscribers.setdefault(staff_id, set()).add(subscription)
+    return subscription
+
+
+def unsubscribe(staff_id, subscription):
+    with _lock:
+        subscriptions = _subscribers.get(staff_id, set())
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            _subscribers.pop(staff_id, None)
+
+
+def _ensure_consumer():
+    # Started on first use so it runs inside the worker process rather than the gunicorn master
+    global _consumer
+    if _connection is None:
+        return
+    with _lock:
+        if _consumer is None or not _consumer.is_alive():
+            _consumer = threading.Thread(target=_consume, name='notification-events', daemon=True)
+            _consumer.start()
+
+
+def _ensure_publisher():
+    global _publisher
+    with _lock:
+        if _publisher is None or not _publisher.is_alive():
+            _publisher = threading.Thread(target=_publish_batches, name='notification-publisher', daemon=True)
+            _publisher.start()
+
+
+def _publish_batches():
+    while True:
+        events = _outgoing.get()
+        # Batches that queued up behind a slow publish go out together in one message
+        while True:
+            try:
+                events = events + _outgoing.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            with producers[_connection].acquire(block=True, timeout=DRAIN_TIMEOUT) as producer:
+                producer.publish(
+                    events, exchange=EXCHANGE, routing_key='', declare=[EXCHANGE], serializer='json',
+                    retry=True, retry_policy={'max_retries': 1, 'interval_start': 0}
+                )
+        except Exception:
+            logger.exception("Failed to publish %d notification events", len(events))
+
+
+def _on_message(body, message):
+    dispatch(body)
+
+
+def _consume():
+    while True:
+        try:
+            with _connection.clone() as conn:
+                # Server-named queue that lives as long as this process's connection
+                events_queue = Queue('', exchange=EXCHANGE, exclusive=True, auto_delete=True, durable=False)
+                with conn.Consumer(events_queue, callbacks=[_on_message], accept=['json'], no_ack=True):
+                    while True:
+                        try:
+                            conn.drain_events(timeout=DRAIN_TIMEOUT)
+                        except socket.timeout:
+                            conn.heartbeat_check()
+        except Exception:
+            logger.exception("Notification event consumer disconnected, retrying in %s seconds", RECONNECT_DELAY)
+            time.sleep(RECONNECT_DELAY)
@@ -1,10 +1,13 @@
 import enum
+import uuid
+from typing import List
 from flask_sqlalchemy import SQLAlchemy
+from replica import RoutingSession
 from sqlalchemy.ext.mutable import MutableList
 from flask_marshmallow import Marshmallow
 from marshmallow import fields
 from marshmallow_enum import EnumField
-from sqlalchemy import Column, Integer, String, Date, Enum, DateTime, ForeignKey, func, JSON
+from sqlalchemy import Column, Integer, String, Text, Date, Enum, DateTime, ForeignKey, Index, func, JSON, event, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from datetime import timezone
 
@@ -12,7 +15,8 @@ from datetime import timezone
 # class Base(DeclarativeBase):
 #     pass
 
-db = SQLAlchemy()
+# Reads can be routed to a replica, see replica.py
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 ma = Marshmallow()
 
 class Base(db.Model):
@@ -30,6 +34,12 @@ class Status(enum.Enum):
     ACKNOWLEDGED = "Acknowledged"
 
 
+# Entry statuses that hold their date: a requester has at most one such entry per day
+ACTIVE_STATUSES = (Status.PENDING, Status.APPROVED, Status.PENDING_WITHDRAWN)
+# Enums are stored by name
+ACTIVE_ENTRY_CLAUSE = "status IN ({})".format(", ".join(f"'{status.name}'" for status in ACTIVE_STATUSES))
+
+
 class NotificationStatus(enum.Enum):
     DELIVERED = "Delivered"
     SEEN = "Seen"
@@ -49,11 +59,26 @@ class WFHRequest(Base):
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
     reporting_manager: Mapped[int] = mapped_column(Integer, nullable=False)
     department: Mapped[str] = mapped_column(String(50))
-    entries: Mapped['WFHRequestEntry'] = relationship('WFHRequestEntry', back_populates='wfhRequest', cascade="all, delete", lazy='joined', uselist=True)
+    entries: Mapped[List['WFHRequestEntry']] = relationship('WFHRequestEntry', back_populates='wfhRequest', cascade="all, delete", order_by='WFHRequestEntry.entry_id', uselist=True)
     notification_status: Mapped[NotificationStatus] = mapped_column(Enum(NotificationStatus), nullable=False, default=NotificationStatus.DELIVERED)
     modified_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), default=func.now(), onupdate=func.now(), nullable=False)
     last_notification_status: Mapped[NotificationStatus] = mapped_column(Enum(NotificationStatus), nullable=False, default=NotificationStatus.DELIVERED)
     audit_trails = relationship('AuditTrail', back_populates='wfh_request')
+    # Bumped by every UPDATE of the row: ORM flushes check it through version_id_col, and the bulk
+    # UPDATEs in transitions.py and notifications.py maintain it by hand
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
+
+    # Kept in sync with migrations m0001_hot_path_indexes.py and m0004_inbox_indexes.py
+    __table_args__ = (
+        Index('ix_wfhrequests_requester_id_notification_status', 'requester_id', 'notification_status'),
+        Index('ix_wfhrequests_reporting_manager_notification_status', 'reporting_manager', 'notification_status'),
+        Index('ix_wfhrequests_department', 'department'),
+        Index('ix_wfhrequests_modified_at_request_id', 'modified_at', 'request_id'),
+        Index('ix_wfhrequests_requester_id_modified_at', 'requester_id', 'modified_at', 'request_id'),
+        Index('ix_wfhrequests_reporting_manager_modified_at', 'reporting_manager', 'modified_at', 'request_id'),
+    )
 
 class WFHRequestEntry(Base):
     __tablename__ = "wfhrequestentries"
@@ -65,9 +90,25 @@ class WFHRequestEntry(Base):
     duration: Mapped[str] = mapped_column(String(50))
     status: Mapped[Status] = mapped_column(Enum(Status), nullable=False, default=Status.PENDING)
     action_reason: Mapped[str] = mapped_column(String(255))
+    # Copied from the owning request so the unique index below can cover it
+    requester_id: Mapped[int] = mapped_column(Integer, nullable=False)
     wfhRequest: Mapped['WFHRequest'] = relationship('WFHRequest', back_populates='entries')
     audit_trails = relationship('AuditTrail', back_populates='wfh_request_entry')
 
+    # Kept in sync with migrations m0001_hot_path_indexes.py and m0009_unique_active_entry_dates.py
+    __table_args__ = (
+        Index('ix_wfhrequestentries_entry_date', 'entry_date'),
+        Index('ix_wfhrequestentries_request_id_status', 'request_id', 'status'),
+        Index('uq_wfhrequestentries_requester_id_entry_date', 'requester_id', 'entry_date', unique=True,
+              postgresql_where=text(ACTIVE_ENTRY_CLAUSE), sqlite_where=text(ACTIVE_ENTRY_CLAUSE)),
+    )
+
+
+@event.listens_for(WFHRequestEntry, 'before_insert')
+def copy_requester_id(mapper, connection, entry):
+    if entry.requester_id is None:
+        entry.requester_id = entry.wfhRequest.requester_id
+
 class AuditTrail(Base):
     __tablename__ = "audittrail"
 
@@ -86,6 +127,56 @@ class AuditTrail(Base):
     wfh_request = relationship('WFHRequest', back_populates='audit_trails')
     wfh_request_entry = relationship('WFHRequestEntry', back_populates='audit_trails')
 
+    # On PostgreSQL, migration m0006_partition_audittrail.py partitions the table by created_at month
+    # and makes (audit_id, created_at) its primary key; see audit_archive.py
+    __table_args__ = (
+        Index('ix_audittrail_request_id', 'request_id'),
+    )
+
+class WFHDailyOccupancy(Base):
+    __tablename__ = "wfh_daily_occupancy"
+
+    # Requests without a department are counted under ''
+    department: Mapped[str] = mapped_column(String(50), primary_key=True)
+    entry_date: Mapped[Date] = mapped_column(Date, primary_key=True)
+    approved_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    pending_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class NotificationCounter(Base):
+    __tablename__ = "notification_counters"
+
+    staff_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    unread_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+class TaskOutbox(Base):
+    __tablename__ = "task_outbox"
+
+    outbox_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Sent as the Celery task id, so a task the relay publishes twice is recognisable
+    task_id: Mapped[str] = mapped_column(String(36), nullable=False, default=lambda: str(uuid.uuid4()))
+    task_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    kwargs: Mapped[dict] = mapped_column(JSON, nullable=False)
+    # ISO 8601, passed to Celery as given
+    eta: Mapped[str] = mapped_column(String(40), nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), default=func.now(), nullable=False)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # Method, path and body hash of the first request that used the key
+    fingerprint: Mapped[str] = mapped_column(String(64), nullable=False)
+    # Null while the first request is still running
+    status_code: Mapped[int] = mapped_column(Integer, nullable=True)
+    response_body: Mapped[str] = mapped_column(Text, nullable=True)
+    content_type: Mapped[str] = mapped_column(String(100), nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+    expires_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+
 class WFHRequestEntrySchema(ma.SQLAlchemyAutoSchema):
     entry_id = fields.Int(dump_only=True)
     request_id = fields.Int(dump_only=True)
@@ -99,6 +190,7 @@ class WFHRequestEntrySchema(ma.SQLAlchemyAutoSchema):
         model = WFHRequestEntry
         load_instance = True
         include_fk = True # Include foreign key fields
+        exclude = ("requester_id",)  # Already on the owning request
 
 class WFHRequestSchema(ma.SQLAlchemyAutoSchema):
     request_id = fields.Int(dump_only=True)
@@ -115,6 +207,7 @@ class WFHRequestSchema(ma.SQLAlchemyAutoSchema):
     class Meta:
         model = WFHRequest
         load_instance = True
+        exclude = ("version",)  # Internal to optimistic locking; clients never send it back
 
 class AuditTrailSchema(ma.SQLAlchemyAutoSchema):
     audit_id = fields.Int(dump_only=True)
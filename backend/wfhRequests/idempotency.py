@@ -0,0 +1,138 @@
+"""Idempotency-Key support for mutating endpoints.
+
+The first request with a key claims it by inserting an idempotency_keys row
+and committing it before the view runs, so rollbacks inside the view, such as
+a transition retried after a concurrent change, cannot drop the claim and let
+a repeat of the request in. The claim is a lease that expires after
+CLAIM_TTL, so a key whose request died mid-way can be used again. The
+response is stored on that row afterwards, extending it to IDEMPOTENCY_TTL.
+Until the row expires, a request that repeats the key gets the stored response
+back, marked with Idempotent-Replayed, and the main tables are never read or
+written. A key reused with a different method, path or body is rejected, and
+so is a repeat that arrives while the first request is still running.
+
+Server errors and responses carrying Retry-After (transient conflicts) are
+not stored: the claim is released so the client can retry. Before a response
+is stored, whatever the view left uncommitted is rolled back.
+
+Each stored response also purges a few expired keys, which keeps the table
+bounded by the keys used within IDEMPOTENCY_TTL.
+"""
+import functools
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from flask import Response, jsonify, make_response, request
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from factory import db, IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+IDEMPOTENCY_TTL = timedelta(hours=24)
+# How long a claimed key stays locked without a stored response; well above the slowest request
+CLAIM_TTL = timedelta(minutes=1)
+# Expired keys removed by each stored response
+PURGE_BATCH = 10
+
+
+def _insert():
+    return postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+
+
+def request_fingerprint():
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def claim(key, fingerprint, now):
+    """Insert the key for this request, taking over an expired one; return whether it was claimed."""
+    stmt = _insert()(IdempotencyKey).values(
+        key=key, fingerprint=fingerprint, created_at=now, expires_at=now + CLAIM_TTL
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['key'],
+        set_={
+            'fingerprint': stmt.excluded.fingerprint,
+            'status_code': None,
+            'response_body': None,
+            'content_type': None,
+            'created_at': stmt.excluded.created_at,
+            'expires_at': stmt.excluded.expires_at,
+        },
+        where=IdempotencyKey.expires_at < now,
+    ).returning(IdempotencyKey.key)
+    return db.session.execute(stmt).first() is not None
+
+
+def store(key, fingerprint, now, response):
+    # An upsert, as another request's purge may have removed a claim that outlived CLAIM_TTL
+    stmt = _insert()(IdempotencyKey).values(
+        key=key, fingerprint=fingerprint, created_at=now, expires_at=now + IDEMPOTENCY_TTL,
+        status_code=response.status_code, response_body=response.get_data(as_text=True),
+        content_type=response.content_type,
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=['key'],
+        set_={
+            'status_code': stmt.excluded.status_code,
+            'response_body': stmt.excluded.response_body,
+            'content_type': stmt.excluded.content_type,
+            'expires_at': stmt.excluded.expires_at,
+        },
+    ))
+    expired = select(IdempotencyKey.key).where(IdempotencyKey.expires_at < now).limit(PURGE_BATCH)
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(expired)))
+    db.session.commit()
+
+
+def release(key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)))
+    db.session.commit()
+
+
+def idempotent(view):
+    """Replay the stored response when the request carries an Idempotency-Key that was already used."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(*args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"{HEADER} must be between 1 and {MAX_KEY_LENGTH} characters"}), 400
+
+        fingerprint = request_fingerprint()
+        now = datetime.now(timezone.utc)
+        if not claim(key, fingerprint, now):
+            stored = db.session.execute(
+                select(IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+                       IdempotencyKey.response_body, IdempotencyKey.content_type)
+                .where(IdempotencyKey.key == key)
+            ).one()
+            db.session.rollback()
+            if stored.fingerprint != fingerprint:
+                return jsonify({"error": f"{HEADER} was already used for a different request"}), 422
+            if stored.status_code is None:
+                response = jsonify({"error": f"A request with this {HEADER} is still in progress"})
+                response.headers['Retry-After'] = '1'
+                return response, 409
+            response = Response(stored.response_body, status=stored.status_code, content_type=stored.content_type)
+            response.headers[REPLAYED_HEADER] = 'true'
+            return response
+        # Committed on its own, so rollbacks inside the view leave the claim in place
+        db.session.commit()
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code >= 500 or 'Retry-After' in response.headers:
+            # Server errors and transient conflicts are retried under the same key
+            release(key)
+        else:
+            # Drop anything the view flushed but did not commit, so only the key is written
+            db.session.rollback()
+            store(key, fingerprint, now, response)
+        return response
+    return wrapper
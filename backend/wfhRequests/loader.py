@@ -0,0 +1,48 @@
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from factory import db, WFHRequest, WFHRequestSchema
+from serializers import dump_request, dump_entry
+
+# Requests are read in batches of this size; selectinload issues one IN query per batch
+# to fetch their entries, so a listing costs 2 queries per batch instead of 1 + N.
+BATCH_SIZE = 500
+
+
+# Loading plans: each read endpoint states which of a request's entries it needs
+def with_entries(stmt, *entry_criteria):
+    """Attach entries to the requests selected by stmt, optionally filtered."""
+    relationship = WFHRequest.entries.and_(*entry_criteria) if entry_criteria else WFHRequest.entries
+    return stmt.options(selectinload(relationship))
+
+
+def load_requests(stmt, *entry_criteria):
+    return db.session.execute(with_entries(stmt, *entry_criteria)).scalars().all()
+
+
+def load_request(request_id):
+    stmt = select(WFHRequest).where(WFHRequest.request_id == request_id)
+    return db.session.execute(with_entries(stmt)).scalars().first()
+
+
+def iter_request_batches(stmt, *entry_criteria):
+    """Yield lists of requests read through a server-side cursor, BATCH_SIZE at a time."""
+    stmt = with_entries(stmt, *entry_criteria).execution_options(yield_per=BATCH_SIZE)
+    for batch in db.session.execute(stmt).scalars().partitions():
+        yield batch
+
+
+def serialize_request(wfh_request):
+    if wfh_request is None:
+        # A missing request has always been reported as the schema defaults with no entries
+        return dict(WFHRequestSchema().dump(None), entries=[])
+    request_data = dump_request(wfh_request)
+    request_data['entries'] = [dump_entry(entry) for entry in wfh_request.entries]
+    return request_data
+
+
+def serialize_requests(requests, skip_empty=False):
+    return [
+        serialize_request(wfh_request) for wfh_request in requests
+        if wfh_request.entries or not skip_empty
+    ]
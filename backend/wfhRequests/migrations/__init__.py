@@ -0,0 +1,89 @@
+"""Versioned schema migrations for the wfhRequests database.
+
+Each module in this package named ``m<revision>_<slug>.py`` defines ``revision``,
+``down_revision``, ``description``, ``transactional`` and ``upgrade(conn)``.
+Applied revisions are recorded in the ``schema_migrations`` table, so running
+``flask --app app migrate`` repeatedly only applies what is pending.
+
+Migrations with ``transactional = False`` run on an autocommit connection, which
+lets PostgreSQL build indexes with ``CREATE INDEX CONCURRENTLY`` while the
+service keeps serving reads and writes.
+"""
+import importlib
+import pkgutil
+
+from sqlalchemy import text
+
+VERSION_TABLE = "schema_migrations"
+
+
+def load_migrations():
+    modules = {}
+    for info in pkgutil.iter_modules(__path__):
+        if info.name.startswith("m"):
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            modules[module.down_revision] = module
+
+    # Follow the down_revision chain from the first migration
+    ordered = []
+    current = modules.get(None)
+    while current is not None:
+        ordered.append(current)
+        current = modules.get(current.revision)
+    if len(ordered) != len(modules):
+        raise RuntimeError("Migration chain is broken: every down_revision must point to an existing revision")
+    return ordered
+
+
+def applied_revisions(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+            "revision VARCHAR(32) PRIMARY KEY, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        ))
+        return {row[0] for row in conn.execute(text(f"SELECT revision FROM {VERSION_TABLE}"))}
+
+
+def upgrade(engine):
+    """Apply every pending migration in order and return the revisions applied."""
+    done = applied_revisions(engine)
+    applied = []
+    for migration in load_migrations():
+        if migration.revision in done:
+            continue
+
+        if migration.transactional:
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+        else:
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                migration.upgrade(conn)
+
+        with engine.begin() as conn:
+            conn.execute(text(f"INSERT INTO {VERSION_TABLE} (revision) VALUES (:revision)"), {"revision": migration.revision})
+        applied.append(migration.revision)
+    return applied
+
+
+def create_index(conn, name, table, columns, unique=False, where=None):
+    """Create an index if it does not exist, without blocking writes on PostgreSQL."""
+    postgres = conn.dialect.name == "postgresql"
+    if postgres:
+        # An interrupted concurrent build leaves an invalid index behind; rebuild it
+        invalid = conn.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {"name": name}).first()
+        if invalid:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+    statement = "CREATE {unique}INDEX {concurrently}IF NOT EXISTS {name} ON {table} ({columns}){where}".format(
+        unique="UNIQUE " if unique else "",
+        concurrently="CONCURRENTLY " if postgres else "",
+        name=name,
+        table=table,
+        columns=", ".join(columns),
+        where=f" WHERE {where}" if where else "",
+    )
+    conn.execute(text(statement))
@@ -0,0 +1,26 @@
+"""Secondary indexes matching the predicates of the read and notification endpoints."""
+from migrations import create_index
+
+revision = "0001"
+down_revision = None
+description = "hot-path indexes for wfhrequests, wfhrequestentries and audittrail"
+transactional = False
+
+INDEXES = [
+    # getNotificationsLength, getAll and getAudit filter on one side of the request plus its notification status;
+    # /staff/<id> and /requester/<id> use the leading column
+    ("ix_wfhrequests_requester_id_notification_status", "wfhrequests", ["requester_id", "notification_status"]),
+    ("ix_wfhrequests_reporting_manager_notification_status", "wfhrequests", ["reporting_manager", "notification_status"]),
+    ("ix_wfhrequests_department", "wfhrequests", ["department"]),
+    # Keyset pagination and the notification inbox order by (modified_at, request_id)
+    ("ix_wfhrequests_modified_at_request_id", "wfhrequests", ["modified_at", "request_id"]),
+    ("ix_wfhrequestentries_entry_date", "wfhrequestentries", ["entry_date"]),
+    # Entry lookups by request, optionally narrowed to a status
+    ("ix_wfhrequestentries_request_id_status", "wfhrequestentries", ["request_id", "status"]),
+    ("ix_audittrail_request_id", "audittrail", ["request_id"]),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
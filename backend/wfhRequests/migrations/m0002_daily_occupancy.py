@@ -0,0 +1,13 @@
+"""Daily per-department occupancy counts, backfilled from the existing entries."""
+import occupancy
+from factory import WFHDailyOccupancy
+
+revision = "0002"
+down_revision = "0001"
+description = "wfh_daily_occupancy table"
+transactional = True
+
+
+def upgrade(conn):
+    WFHDailyOccupancy.__table__.create(conn, checkfirst=True)
+    occupancy.rebuild(conn)
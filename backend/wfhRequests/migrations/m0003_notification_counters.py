@@ -0,0 +1,13 @@
+"""Per-staff unread notification counters, backfilled from wfhrequests."""
+import notifications
+from factory import NotificationCounter
+
+revision = "0003"
+down_revision = "0002"
+description = "notification_counters table"
+transactional = True
+
+
+def upgrade(conn):
+    NotificationCounter.__table__.create(conn, checkfirst=True)
+    notifications.rebuild(conn)
@@ -0,0 +1,18 @@
+"""Per-side indexes for the cursor-paginated notification inbox."""
+from migrations import create_index
+
+revision = "0004"
+down_revision = "0003"
+description = "inbox indexes ordered by modified_at for requesters and reporting managers"
+transactional = False
+
+INDEXES = [
+    # getAll and getAudit read each side of the inbox newest first and stop after one page
+    ("ix_wfhrequests_requester_id_modified_at", "wfhrequests", ["requester_id", "modified_at", "request_id"]),
+    ("ix_wfhrequests_reporting_manager_modified_at", "wfhrequests", ["reporting_manager", "modified_at", "request_id"]),
+]
+
+
+def upgrade(conn):
+    for name, table, columns in INDEXES:
+        create_index(conn, name, table, columns)
@@ -0,0 +1,11 @@
+"""Outbox of Celery tasks, written in the same transaction as the rows they refer to."""
+from factory import TaskOutbox
+
+revision = "0005"
+down_revision = "0004"
+description = "task_outbox table"
+transactional = True
+
+
+def upgrade(conn):
+    TaskOutbox.__table__.create(conn, checkfirst=True)
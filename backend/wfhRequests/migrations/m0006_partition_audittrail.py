@@ -0,0 +1,51 @@
+"""Partition audittrail by created_at month on PostgreSQL.
+
+The existing table is renamed, a partitioned audittrail with the same columns
+takes its place and the rows are copied across. The primary key becomes
+(audit_id, created_at), as PostgreSQL requires the partition key in it;
+audit_id keeps its sequence, so it stays unique. Other databases keep the
+plain table.
+"""
+from datetime import date
+
+from sqlalchemy import text
+
+import audit_archive
+
+revision = "0006"
+down_revision = "0005"
+description = "partition audittrail by month"
+transactional = True
+
+
+def upgrade(conn):
+    if conn.dialect.name != "postgresql" or audit_archive.is_partitioned(conn):
+        return
+
+    sequence = conn.execute(text("SELECT pg_get_serial_sequence('audittrail', 'audit_id')")).scalar()
+    conn.execute(text("ALTER TABLE audittrail RENAME TO audittrail_unpartitioned"))
+    conn.execute(text("ALTER TABLE audittrail_unpartitioned RENAME CONSTRAINT audittrail_pkey TO audittrail_unpartitioned_pkey"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_audittrail_request_id"))
+
+    conn.execute(text(
+        "CREATE TABLE audittrail (LIKE audittrail_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+    ))
+    conn.execute(text("ALTER TABLE audittrail ADD CONSTRAINT audittrail_pkey PRIMARY KEY (audit_id, created_at)"))
+    conn.execute(text(
+        "ALTER TABLE audittrail ADD CONSTRAINT audittrail_request_id_fkey "
+        "FOREIGN KEY (request_id) REFERENCES wfhrequests (request_id)"
+    ))
+    conn.execute(text(
+        "ALTER TABLE audittrail ADD CONSTRAINT audittrail_entry_id_fkey "
+        "FOREIGN KEY (entry_id) REFERENCES wfhrequestentries (entry_id)"
+    ))
+    conn.execute(text("CREATE INDEX ix_audittrail_request_id ON audittrail (request_id)"))
+    if sequence:
+        # Otherwise dropping the old table would drop the sequence with it
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY audittrail.audit_id"))
+    conn.execute(text(f"CREATE TABLE {audit_archive.DEFAULT_PARTITION} PARTITION OF audittrail DEFAULT"))
+
+    oldest = conn.execute(text("SELECT min(created_at) FROM audittrail_unpartitioned")).scalar()
+    audit_archive.ensure_partitions(conn, audit_archive.month_start(oldest or date.today()))
+    conn.execute(text("INSERT INTO audittrail SELECT * FROM audittrail_unpartitioned"))
+    conn.execute(text("DROP TABLE audittrail_unpartitioned"))
@@ -0,0 +1,11 @@
+"""Stored responses for requests sent with an Idempotency-Key header."""
+from factory import IdempotencyKey
+
+revision = "0007"
+down_revision = "0006"
+description = "idempotency_keys table"
+transactional = True
+
+
+def upgrade(conn):
+    IdempotencyKey.__table__.create(conn, checkfirst=True)
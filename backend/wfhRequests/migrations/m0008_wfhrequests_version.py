@@ -0,0 +1,14 @@
+"""Version counter on wfhrequests for optimistic concurrency control."""
+from sqlalchemy import inspect, text
+
+revision = "0008"
+down_revision = "0007"
+description = "wfhrequests.version column"
+transactional = True
+
+
+def upgrade(conn):
+    if "version" in {column["name"] for column in inspect(conn).get_columns("wfhrequests")}:
+        return
+    # A constant default lets PostgreSQL add the column without rewriting the table
+    conn.execute(text("ALTER TABLE wfhrequests ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
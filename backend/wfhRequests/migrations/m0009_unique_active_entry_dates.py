@@ -0,0 +1,35 @@
+"""One active entry per requester and day, enforced by a partial unique index."""
+from sqlalchemy import inspect, text
+
+from factory import ACTIVE_ENTRY_CLAUSE
+from migrations import create_index
+
+revision = "0009"
+down_revision = "0008"
+description = "wfhrequestentries.requester_id and a unique index over active entry dates"
+transactional = False
+
+
+def upgrade(conn):
+    if "requester_id" not in {column["name"] for column in inspect(conn).get_columns("wfhrequestentries")}:
+        conn.execute(text("ALTER TABLE wfhrequestentries ADD COLUMN requester_id INTEGER"))
+    conn.execute(text(
+        "UPDATE wfhrequestentries SET requester_id = ("
+        "SELECT requester_id FROM wfhrequests WHERE wfhrequests.request_id = wfhrequestentries.request_id"
+        ") WHERE requester_id IS NULL"
+    ))
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("ALTER TABLE wfhrequestentries ALTER COLUMN requester_id SET NOT NULL"))
+
+    # Existing duplicates need a decision from someone who knows which request stands
+    duplicates = conn.execute(text(
+        f"SELECT requester_id, entry_date FROM wfhrequestentries WHERE {ACTIVE_ENTRY_CLAUSE} "
+        "GROUP BY requester_id, entry_date HAVING count(*) > 1 ORDER BY requester_id, entry_date LIMIT 20"
+    )).all()
+    if duplicates:
+        listed = ", ".join(f"{requester_id} on {entry_date}" for requester_id, entry_date in duplicates)
+        raise RuntimeError(f"Requesters with more than one active entry for a day: {listed}. "
+                           "Withdraw or cancel the extra entries, then migrate again.")
+
+    create_index(conn, "uq_wfhrequestentries_requester_id_entry_date", "wfhrequestentries",
+                 ["requester_id", "entry_date"], unique=True, where=ACTIVE_ENTRY_CLAUSE)
@@ -0,0 +1,182 @@
+"""Per-staff unread notification counters.
+
+A request is unread for its requester while its notification_status is in
+REQUESTER_UNREAD, and unread for its reporting manager while it is in
+MANAGER_UNREAD (self-approved requests never notify anyone). Every code path
+that changes notification_status reports the change through
+record_notification_change() in the same transaction, so reading a count is a
+primary key lookup instead of two COUNT queries over wfhrequests. The same
+calls queue live events for the staff members involved (see events.py).
+"""
+from collections import Counter
+
+from sqlalchemy import and_, delete, func, insert, literal_column, or_, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+import events
+from factory import db, NotificationCounter, NotificationStatus, WFHRequest
+from utility import upsert_increments
+
+REQUESTER_UNREAD = {
+    NotificationStatus.EDITED,
+    NotificationStatus.WITHDRAWN,
+    NotificationStatus.ACKNOWLEDGED,
+    NotificationStatus.AUTO_REJECTED,
+}
+MANAGER_UNREAD = {
+    NotificationStatus.DELIVERED,
+    NotificationStatus.CANCELLED,
+    NotificationStatus.SELF_WITHDRAWN,
+}
+
+# A request stays in a staff member's inbox, read or not, while last_notification_status is in these sets
+REQUESTER_INBOX = [
+    NotificationStatus.EDITED, NotificationStatus.SELF_WITHDRAWN, NotificationStatus.ACKNOWLEDGED,
+    NotificationStatus.AUTO_REJECTED, NotificationStatus.WITHDRAWN,
+]
+MANAGER_INBOX = [
+    NotificationStatus.DELIVERED, NotificationStatus.CANCELLED, NotificationStatus.WITHDRAWN, NotificationStatus.EDITED,
+    NotificationStatus.SELF_WITHDRAWN, NotificationStatus.ACKNOWLEDGED, NotificationStatus.AUTO_REJECTED,
+]
+
+
+def unread_deltas(requester_id, reporting_manager, old_status, new_status):
+    """Counter changes caused by a request moving from old_status to new_status (None when created or deleted)."""
+    deltas = Counter()
+    if requester_id == reporting_manager:
+        return deltas
+    deltas[requester_id] += (new_status in REQUESTER_UNREAD) - (old_status in REQUESTER_UNREAD)
+    deltas[reporting_manager] += (new_status in MANAGER_UNREAD) - (old_status in MANAGER_UNREAD)
+    return deltas
+
+
+def apply_deltas(deltas, summary=None, staff_ids=()):
+    """Update counters, queueing an event for each staff member whose count changed or who is in staff_ids."""
+    update_counters(deltas)
+    queue_events(deltas, summary, staff_ids)
+
+
+def update_counters(deltas):
+    rows = [{'staff_id': staff_id, 'unread_count': delta} for staff_id, delta in deltas.items() if delta]
+    upsert_increments(db.session, NotificationCounter, rows, keys=['staff_id'], counters=['unread_count'])
+
+
+def queue_events(deltas, summary=None, staff_ids=()):
+    for staff_id in set(staff_ids) | {staff_id for staff_id, delta in deltas.items() if delta}:
+        events.queue_event(staff_id, {'type': 'wfh_request', 'delta': deltas.get(staff_id, 0), 'request': summary})
+
+
+def request_summary(wfh_request, notification_status):
+    return {
+        'request_id': wfh_request.request_id,
+        'requester_id': wfh_request.requester_id,
+        'reporting_manager': wfh_request.reporting_manager,
+        'department': wfh_request.department,
+        'overall_status': getattr(wfh_request.overall_status, 'value', wfh_request.overall_status),
+        'notification_status': getattr(notification_status, 'value', notification_status),
+    }
+
+
+def record_notification_change(requester_id, reporting_manager, old_status, new_status, wfh_request=None):
+    deltas = unread_deltas(requester_id, reporting_manager, old_status, new_status)
+    if wfh_request is None:
+        apply_deltas(deltas)
+    else:
+        apply_deltas(deltas, request_summary(wfh_request, new_status), staff_ids=(requester_id, reporting_manager))
+
+
+def record_notification_changes(changes):
+    """Batch form of record_notification_change for (wfh_request, old_status, new_status): one counter upsert."""
+    total = Counter()
+    for wfh_request, old_status, new_status in changes:
+        deltas = unread_deltas(wfh_request.requester_id, wfh_request.reporting_manager, old_status, new_status)
+        total.update(deltas)
+        queue_events(deltas, request_summary(wfh_request, new_status),
+                     staff_ids=(wfh_request.requester_id, wfh_request.reporting_manager))
+    update_counters(total)
+
+
+def unread_filter(staff_id):
+    return or_(
+        and_(
+            WFHRequest.requester_id == staff_id,
+            WFHRequest.requester_id != WFHRequest.reporting_manager,
+            WFHRequest.notification_status.in_(REQUESTER_UNREAD)
+        ),
+        and_(
+            WFHRequest.reporting_manager == staff_id,
+            WFHRequest.reporting_manager != WFHRequest.requester_id,
+            WFHRequest.notification_status.in_(MANAGER_UNREAD)
+        ),
+    )
+
+
+def inbox_sides(staff_id):
+    """The requester and reporting manager halves of a staff member's inbox, each served by its own index."""
+    return [
+        and_(
+            WFHRequest.requester_id == staff_id,
+            WFHRequest.requester_id != WFHRequest.reporting_manager,
+            WFHRequest.last_notification_status.in_(REQUESTER_INBOX)
+        ),
+        and_(
+            WFHRequest.reporting_manager == staff_id,
+            WFHRequest.reporting_manager != WFHRequest.requester_id,
+            WFHRequest.last_notification_status.in_(MANAGER_INBOX)
+        ),
+    ]
+
+
+def count_unread(staff_id):
+    """Count a staff member's unread requests straight from wfhrequests."""
+    return db.session.query(WFHRequest).filter(unread_filter(staff_id)).count()
+
+
+def mark_seen(staff_id):
+    """Mark every request unread for staff_id as seen in one UPDATE and return their ids."""
+    stmt = (
+        update(WFHRequest)
+        .where(unread_filter(staff_id))
+        # Seeing a request does not modify it, so inbox order and open cursors stay put
+        .values(notification_status=NotificationStatus.SEEN, modified_at=WFHRequest.modified_at,
+                # Bumped by hand, as only ORM flushes maintain the version
+                version=WFHRequest.version + 1)
+        .returning(WFHRequest.request_id)
+        .execution_options(synchronize_session=False)
+    )
+    seen_ids = db.session.execute(stmt).scalars().all()
+    # The unread sets are disjoint, so each of these rows was unread for staff_id alone
+    apply_deltas(Counter({staff_id: -len(seen_ids)}))
+    return seen_ids
+
+
+def get_unread_count(staff_id):
+    counter = db.session.get(NotificationCounter, staff_id)
+    if counter is not None:
+        return counter.unread_count
+
+    # Counters are backfilled by migration 0003; this only covers databases where it has not run yet
+    unread_count = count_unread(staff_id)
+    insert_stmt = postgresql.insert if db.session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    db.session.execute(
+        insert_stmt(NotificationCounter).values(staff_id=staff_id, unread_count=unread_count).on_conflict_do_nothing()
+    )
+    db.session.commit()
+    return unread_count
+
+
+def rebuild(conn):
+    """Recompute every counter from wfhrequests."""
+    requester_side = select(WFHRequest.requester_id.label('staff_id'), literal_column('1').label('unread')).where(
+        WFHRequest.requester_id != WFHRequest.reporting_manager,
+        WFHRequest.notification_status.in_(REQUESTER_UNREAD)
+    )
+    manager_side = select(WFHRequest.reporting_manager.label('staff_id'), literal_column('1').label('unread')).where(
+        WFHRequest.reporting_manager != WFHRequest.requester_id,
+        WFHRequest.notification_status.in_(MANAGER_UNREAD)
+    )
+    unread = union_all(requester_side, manager_side).subquery()
+    counts = select(unread.c.staff_id, func.sum(unread.c.unread)).group_by(unread.c.staff_id)
+
+    conn.execute(delete(NotificationCounter))
+    conn.execute(insert(NotificationCounter).from_select(['staff_id', 'unread_count'], counts))
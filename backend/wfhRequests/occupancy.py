@@ -0,0 +1,63 @@
+"""Per-department daily WFH head counts, maintained alongside entry status changes.
+
+Every code path that changes WFHRequestEntry.status reports the change through
+record_status_changes() in the same transaction, so wfh_daily_occupancy always
+matches wfhrequestentries. rebuild() recomputes the table from scratch for repair.
+"""
+from collections import defaultdict
+
+from sqlalchemy import case, delete, func, insert, literal_column, select
+
+from factory import db, Status, WFHDailyOccupancy, WFHRequest, WFHRequestEntry
+from utility import upsert_increments
+
+COUNTERS = {
+    Status.APPROVED: 'approved_count',
+    Status.PENDING: 'pending_count',
+}
+
+
+def record_status_changes(department, changes):
+    """Apply (entry_date, old_status, new_status) changes to the occupancy counts.
+
+    old_status is None for a new entry and new_status is None for a deleted one.
+    """
+    record_changes([(department, *change) for change in changes])
+
+
+def record_changes(changes):
+    """Apply (department, entry_date, old_status, new_status) changes across departments in one upsert."""
+    deltas = defaultdict(lambda: {'approved_count': 0, 'pending_count': 0})
+    for department, entry_date, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        key = (department or '', entry_date)
+        if old_status in COUNTERS:
+            deltas[key][COUNTERS[old_status]] -= 1
+        if new_status in COUNTERS:
+            deltas[key][COUNTERS[new_status]] += 1
+
+    rows = [
+        {'department': department, 'entry_date': entry_date, **counts}
+        for (department, entry_date), counts in deltas.items() if any(counts.values())
+    ]
+    upsert_increments(db.session, WFHDailyOccupancy, rows,
+                      keys=['department', 'entry_date'], counters=['approved_count', 'pending_count'])
+
+
+def rebuild(conn):
+    """Recompute every occupancy row from wfhrequestentries."""
+    department = func.coalesce(WFHRequest.department, literal_column("''"))
+    counts = select(
+        department,
+        WFHRequestEntry.entry_date,
+        func.sum(case((WFHRequestEntry.status == Status.APPROVED, 1), else_=0)),
+        func.sum(case((WFHRequestEntry.status == Status.PENDING, 1), else_=0)),
+    ).join(WFHRequest, WFHRequest.request_id == WFHRequestEntry.request_id).where(
+        WFHRequestEntry.status.in_(list(COUNTERS))
+    ).group_by(department, WFHRequestEntry.entry_date)
+
+    conn.execute(delete(WFHDailyOccupancy))
+    conn.execute(insert(WFHDailyOccupancy).from_select(
+        ['department', 'entry_date', 'approved_count', 'pending_count'], counts
+    ))
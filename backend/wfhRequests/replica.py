@@ -0,0 +1,76 @@
+"""Read-replica routing for the database session.
+
+When DATABASE_REPLICA_URI is set, init_app() registers it as the "replica"
+bind. Requests made with a read-only method then run their SELECTs on the
+replica, while flushes and INSERT/UPDATE/DELETE statements always go to the
+primary. Outside a request (CLI commands, the outbox relay) everything uses
+the primary.
+
+After a successful mutation the response carries a Read-Primary-Until header
+with a short-lived expiry time. A client that echoes it back on its next
+requests reads from the primary until it passes, so it sees its own writes
+despite replication lag. A header rather than a cookie keeps this working for
+the cross-origin frontend, which makes uncredentialed CORS requests; the app
+must list PIN_HEADER in the CORS expose_headers so the browser can read it.
+Views that must always read the primary are marked with @primary.
+
+Two SQLite files or two PostgreSQL containers are enough to try it locally:
+point DATABASE_URI and DATABASE_REPLICA_URI at them.
+"""
+import os
+import time
+
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = "replica"
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+PIN_HEADER = "Read-Primary-Until"
+# How long reads stay on the primary after the client's own write; above the replica's usual lag
+PIN_SECONDS = int(os.getenv("DATABASE_REPLICA_PIN_SECONDS", 10))
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and not getattr(clause, "is_dml", False) and _reading_from_replica():
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _reading_from_replica():
+    return has_request_context() and g.get("read_from_replica", False)
+
+
+def _pinned():
+    try:
+        return float(request.headers.get(PIN_HEADER, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def primary(view):
+    """Keep this read-only method view on the primary, e.g. because it also writes."""
+    view.reads_primary = True
+    return view
+
+
+def init_app(app, replica_uri):
+    """Register the replica bind and request hooks; call before db.init_app(app)."""
+    if not replica_uri:
+        return
+    app.config.setdefault("SQLALCHEMY_BINDS", {})[REPLICA_BIND] = replica_uri
+
+    @app.before_request
+    def route_reads():
+        view = app.view_functions.get(request.endpoint)
+        g.read_from_replica = (
+            request.method in READ_METHODS and not getattr(view, "reads_primary", False) and not _pinned()
+        )
+
+    @app.after_request
+    def pin_after_write(response):
+        if request.method not in READ_METHODS and response.status_code < 400:
+            response.headers[PIN_HEADER] = f"{time.time() + PIN_SECONDS:.0f}"
+        return response
@@ -0,0 +1,56 @@
+"""Precompiled row serializers matching the marshmallow schemas in factory.py.
+
+compile_serializer() reads a schema's dump fields once and generates a plain
+function that reads each attribute and converts it inline (enums to .value,
+dates to ISO strings), so large listings skip marshmallow's per-field
+dispatch. Fields it cannot inline are delegated to the marshmallow field
+itself, which keeps the output identical to schema.dump().
+"""
+import datetime
+
+from marshmallow import fields
+from marshmallow_enum import EnumField, LoadDumpOptions
+
+from factory import WFHRequestSchema, WFHRequestEntrySchema, AuditTrailSchema
+
+
+def _inline(field, value):
+    """Source expression converting the non-None value for field, or None if it has to go through marshmallow."""
+    field_type = type(field)
+    if field_type is fields.Integer and not field.as_string:
+        return f"int({value})"
+    if field_type is fields.String:
+        return f"str({value})"
+    if field_type is fields.DateTime and (field.format or field.DEFAULT_FORMAT) in ('iso', 'iso8601'):
+        return f"{value}.isoformat()"
+    if field_type is fields.Date and (field.format or field.DEFAULT_FORMAT) in ('iso', 'iso8601'):
+        return f"_date_isoformat({value})"
+    if field_type is EnumField:
+        return f"{value}.value" if field.dump_by == LoadDumpOptions.value else f"{value}.name"
+    return None
+
+
+def compile_serializer(schema):
+    """Build obj -> dict for schema, equivalent to schema.dump(obj) for a single object."""
+    name = f"dump_{type(schema).__name__}"
+    namespace = {'_date_isoformat': datetime.date.isoformat}
+    reads, items = [], []
+    for index, (field_name, field) in enumerate(schema.dump_fields.items()):
+        attribute = field.attribute or field_name
+        key = field.data_key if field.data_key is not None else field_name
+        expression = _inline(field, f"_v{index}")
+        if expression is None or not attribute.isidentifier():
+            namespace[f"_field{index}"] = field
+            items.append(f"        {key!r}: _field{index}.serialize({field_name!r}, obj),")
+        else:
+            reads.append(f"    _v{index} = obj.{attribute}")
+            items.append(f"        {key!r}: None if _v{index} is None else {expression},")
+
+    source = "\n".join([f"def {name}(obj):", *reads, "    return {", *items, "    }", ""])
+    exec(compile(source, f"<serializer {type(schema).__name__}>", "exec"), namespace)
+    return namespace[name]
+
+
+dump_request = compile_serializer(WFHRequestSchema())
+dump_entry = compile_serializer(WFHRequestEntrySchema())
+dump_audit_trail = compile_serializer(AuditTrailSchema())
@@ -23,7 +23,9 @@ def auto_reject(request_id, entry_id):
     }
 
     # Make the PUT request to the autoReject endpoint
-    response = requests.put(UPDATE_STATUS_URL, json=payload)
+    # Retries and redelivered tasks reuse the key, so the entry is only rejected once
+    headers = {"Idempotency-Key": f"auto_reject-{request_id}-{entry_id}"}
+    response = requests.put(UPDATE_STATUS_URL, json=payload, headers=headers)
 
     if response.status_code == 200:
         return 'Successful handling: Entries auto-rejected'
@@ -0,0 +1,283 @@
+"""State transitions for WFH request entries.
+
+TRANSITIONS declares what each action does: the status its entries move to,
+the overall status of a request whose entries end up in different statuses,
+and the notification it raises. apply_transition() performs an action on any
+number of requests with a fixed number of statements:
+
+1. one SELECT that returns the request rows and the targeted entries
+   together with an aggregate over each request's remaining entries,
+2. one UPDATE of the request rows,
+3. one UPDATE of the entries per target status,
+4. one INSERT of all audit rows,
+5. one upsert each for the occupancy and notification counters.
+
+Nothing is locked while reading. The UPDATE of the request rows only matches
+the versions that SELECT returned, so a request that another transaction
+changed in the meantime raises StaleDataError before anything is written.
+commit_transition() then rolls back and starts over from fresh reads, up to
+MAX_ATTEMPTS times.
+"""
+from typing import NamedTuple
+
+from sqlalchemy import and_, case, cast, distinct, func, insert, literal, select, tuple_, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+
+from factory import db, Status, NotificationStatus, WFHRequest, WFHRequestEntry, AuditTrail
+import notifications
+import occupancy
+
+# Attempts at a transition before a version conflict is reported to the caller
+MAX_ATTEMPTS = 3
+
+
+class Transition(NamedTuple):
+    # Status the targeted entries move to; the request takes it too when all its entries share it
+    entry_status: Status
+    # Overall status when the request's entries end up in different statuses
+    mixed_status: Status
+    notification_status: NotificationStatus
+    # Replaces entry_status when the requester is their own reporting manager
+    self_managed_status: Status = None
+    # Only entries currently in one of these statuses move; None moves every targeted entry
+    from_statuses: frozenset = None
+    # Whether the action takes a reason per entry and stores it as action_reason
+    records_reason: bool = False
+    audited: bool = True
+
+
+TRANSITIONS = {
+    'withdraw': Transition(Status.WITHDRAWN, Status.REVIEWED, NotificationStatus.WITHDRAWN, records_reason=True),
+    'approve': Transition(Status.APPROVED, Status.REVIEWED, NotificationStatus.EDITED),
+    'reject': Transition(Status.REJECTED, Status.REVIEWED, NotificationStatus.EDITED, records_reason=True),
+    'cancel': Transition(Status.CANCELLED, Status.PENDING, NotificationStatus.CANCELLED),
+    'revoke': Transition(Status.PENDING_WITHDRAWN, Status.REVIEWED, NotificationStatus.SELF_WITHDRAWN,
+                         self_managed_status=Status.WITHDRAWN),
+    'acknowledge': Transition(Status.WITHDRAWN, Status.REVIEWED, NotificationStatus.ACKNOWLEDGED),
+    'auto_reject': Transition(Status.AUTO_REJECTED, Status.REVIEWED, NotificationStatus.AUTO_REJECTED,
+                              from_statuses=frozenset({Status.PENDING}), audited=False),
+}
+
+
+class TransitionItem(NamedTuple):
+    request_id: int
+    entry_ids: list
+    # entry_id -> reason, for actions that record one
+    reasons: dict = None
+
+
+def parse_items(transition, items):
+    """Build TransitionItems from request payloads: {request_id, entry_ids} where entry_ids are
+    plain ids, or {entry_id, reason} objects for actions that record a reason."""
+    parsed = []
+    for item in items:
+        entries_data = item.get('entry_ids')
+        if transition.records_reason:
+            parsed.append(TransitionItem(
+                item.get('request_id'),
+                [entry.get('entry_id') for entry in entries_data],
+                {entry['entry_id']: entry['reason'] for entry in entries_data},
+            ))
+        else:
+            parsed.append(TransitionItem(item.get('request_id'), entries_data))
+    return parsed
+
+
+def parse_bulk_item(transition, item):
+    """Build a TransitionItem from one bulk payload item, raising ValueError when it is malformed.
+
+    entry_ids holds plain ids or {entry_id, reason} objects; an item-level reason applies to entries without one.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Each item must be an object")
+    request_id = item.get('request_id')
+    entries_data = item.get('entry_ids')
+    if not isinstance(request_id, int) or not entries_data or not isinstance(entries_data, list):
+        raise ValueError("request_id and entry_ids (as an array) are required")
+
+    entry_ids, reasons = [], {}
+    for entry in entries_data:
+        entry_id = entry.get('entry_id') if isinstance(entry, dict) else entry
+        if not isinstance(entry_id, int):
+            raise ValueError(f"Invalid entry_id: {entry_id}")
+        entry_ids.append(entry_id)
+        reasons[entry_id] = entry.get('reason', item.get('reason')) if isinstance(entry, dict) else item.get('reason')
+    return TransitionItem(request_id, entry_ids, reasons if transition.records_reason else None)
+
+
+def apply_transition(action, items):
+    """Apply action to every TransitionItem in items and return one outcome dict per item, in order.
+
+    An outcome carries an "error" ("Request not found" or "No matching entries found") when nothing was
+    changed for that item; the other items are still applied.
+    """
+    transition = TRANSITIONS[action]
+    request_ids = sorted({item.request_id for item in items})
+    targets = [(item.request_id, entry_id) for item in items for entry_id in item.entry_ids]
+
+    # Status spread of each request's entries that are not being targeted
+    others = (
+        select(
+            WFHRequestEntry.request_id,
+            func.count(distinct(WFHRequestEntry.status)).label('status_count'),
+            func.min(WFHRequestEntry.status).label('status'),
+        )
+        .where(
+            WFHRequestEntry.request_id.in_(request_ids),
+            tuple_(WFHRequestEntry.request_id, WFHRequestEntry.entry_id).not_in(targets),
+        )
+        .group_by(WFHRequestEntry.request_id)
+        .subquery()
+    )
+    stmt = (
+        select(
+            WFHRequest,
+            WFHRequestEntry.entry_id, WFHRequestEntry.entry_date, WFHRequestEntry.status,
+            WFHRequestEntry.reason, WFHRequestEntry.duration,
+            others.c.status_count, others.c.status,
+        )
+        .outerjoin(WFHRequestEntry, and_(
+            WFHRequestEntry.request_id == WFHRequest.request_id,
+            tuple_(WFHRequestEntry.request_id, WFHRequestEntry.entry_id).in_(targets),
+        ))
+        .outerjoin(others, others.c.request_id == WFHRequest.request_id)
+        .where(WFHRequest.request_id.in_(request_ids))
+        # A fixed order keeps concurrent batches from deadlocking on the request rows they update
+        .order_by(WFHRequest.request_id, WFHRequestEntry.entry_id)
+        .execution_options(populate_existing=True)
+    )
+
+    loaded = {}
+    for wfh_request, entry_id, entry_date, status, reason, duration, other_count, other_status in db.session.execute(stmt):
+        _, entries, _ = loaded.setdefault(wfh_request.request_id, (wfh_request, [], (other_count or 0, other_status)))
+        if entry_id is not None:
+            entries.append((entry_id, entry_date, status, reason, duration))
+
+    outcomes = []
+    moves = {}
+    audit_rows = []
+    occupancy_changes = []
+    notification_changes = []
+    updated_requests = []
+    for item in items:
+        if item.request_id not in loaded:
+            outcomes.append({"request_id": item.request_id, "error": "Request not found"})
+            continue
+        wfh_request, entries, (other_count, other_status) = loaded.pop(item.request_id)
+        if not entries:
+            outcomes.append({"request_id": item.request_id, "error": "No matching entries found"})
+            continue
+
+        self_managed = wfh_request.requester_id == wfh_request.reporting_manager
+        new_status = transition.self_managed_status if self_managed and transition.self_managed_status else transition.entry_status
+
+        final_statuses = {other_status} if other_count else set()
+        moved_ids = []
+        for entry_id, entry_date, status, reason, duration in entries:
+            if transition.from_statuses is not None and status not in transition.from_statuses:
+                final_statuses.add(status)
+                continue
+            final_statuses.add(new_status)
+            moved_ids.append(entry_id)
+            moves.setdefault(new_status, {})[entry_id] = item.reasons.get(entry_id) if item.reasons is not None else None
+            occupancy_changes.append((wfh_request.department, entry_date, status, new_status))
+            if transition.audited:
+                audit_rows.append(audit_row(wfh_request, new_status, entry_id=entry_id, entry_date=entry_date,
+                                            reason=reason, duration=duration,
+                                            action_reason=moves[new_status][entry_id]))
+
+        overall_status = new_status if other_count <= 1 and len(final_statuses) == 1 else transition.mixed_status
+        if transition.audited and wfh_request.overall_status != overall_status:
+            audit_rows.append(audit_row(wfh_request, overall_status))
+
+        updated_requests.append((wfh_request, overall_status))
+        notification_changes.append((wfh_request, wfh_request.notification_status, transition.notification_status))
+        outcomes.append({"request_id": item.request_id, "overall_status": overall_status.value, "entry_ids": moved_ids})
+
+    if updated_requests:
+        update_requests(updated_requests, transition.notification_status)
+    for new_status, reasons in moves.items():
+        values = {'status': new_status}
+        if transition.records_reason:
+            values['action_reason'] = case(reasons, value=WFHRequestEntry.entry_id)
+        db.session.execute(
+            update(WFHRequestEntry).where(WFHRequestEntry.entry_id.in_(reasons)).values(**values),
+            execution_options={'synchronize_session': False},
+        )
+    if audit_rows:
+        db.session.execute(insert(AuditTrail.__table__), audit_rows)
+    occupancy.record_changes(occupancy_changes)
+    notifications.record_notification_changes(notification_changes)
+    return outcomes
+
+
+def update_requests(updated_requests, notification_status):
+    """Write the new statuses of (wfh_request, overall_status) pairs in one UPDATE that checks and bumps their versions.
+
+    The ORM would check version_id_col the same way, but with one UPDATE per request.
+    """
+    expected = [(wfh_request.request_id, wfh_request.version) for wfh_request, _ in updated_requests]
+    stmt = (
+        update(WFHRequest)
+        .where(tuple_(WFHRequest.request_id, WFHRequest.version).in_(expected))
+        .values(
+            overall_status=cast(case(
+                {wfh_request.request_id: literal(overall_status, WFHRequest.overall_status.type)
+                 for wfh_request, overall_status in updated_requests},
+                value=WFHRequest.request_id,
+            ), WFHRequest.overall_status.type),
+            notification_status=notification_status,
+            last_notification_status=notification_status,
+            version=WFHRequest.version + 1,
+        )
+        .returning(WFHRequest.request_id)
+        .execution_options(synchronize_session=False)
+    )
+    updated_ids = set(db.session.execute(stmt).scalars())
+    if len(updated_ids) != len(expected):
+        stale = sorted(request_id for request_id, _ in expected if request_id not in updated_ids)
+        raise StaleDataError(f"wfhrequests rows {stale} were modified by another transaction")
+
+    # Mirror the UPDATE on the loaded requests without making them dirty
+    for wfh_request, overall_status in updated_requests:
+        set_committed_value(wfh_request, 'overall_status', overall_status)
+        set_committed_value(wfh_request, 'notification_status', notification_status)
+        set_committed_value(wfh_request, 'last_notification_status', notification_status)
+        set_committed_value(wfh_request, 'version', wfh_request.version + 1)
+
+
+def commit_transition(action, items):
+    """apply_transition() and commit, starting over when another transaction changed one of the requests.
+
+    Raises StaleDataError once MAX_ATTEMPTS attempts have conflicted.
+    """
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            outcomes = apply_transition(action, items)
+            if all('error' in outcome for outcome in outcomes):
+                # Nothing was changed
+                db.session.rollback()
+            else:
+                db.session.commit()
+            return outcomes
+        except StaleDataError:
+            db.session.rollback()
+            if attempt == MAX_ATTEMPTS:
+                raise
+
+
+def audit_row(wfh_request, status, entry_id=None, entry_date=None, reason=None, duration=None, action_reason=None):
+    # Every row carries the same keys so the batch goes out as a single multi-row INSERT
+    return {
+        'request_id': wfh_request.request_id,
+        'entry_id': entry_id,
+        'requester_id': wfh_request.requester_id,
+        'reporting_manager': wfh_request.reporting_manager,
+        'department': wfh_request.department,
+        'status': status,
+        'action_reason': action_reason,
+        'entry_date': entry_date,
+        'reason': reason,
+        'duration': duration,
+    }
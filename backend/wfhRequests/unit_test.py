@@ -1,9 +1,27 @@
 import unittest
+import math
+import os
+import queue
+import tempfile
 from unittest.mock import patch, MagicMock
-from app import app, db, WFHRequest, WFHRequestEntry
-from flask import json
-from datetime import datetime
-from factory import Status, NotificationStatus
+from app import app, db, WFHRequest, WFHRequestEntry, AuditTrail
+from flask import Flask, json, request
+from datetime import datetime, date, timezone
+from sqlalchemy import event, select, text, update
+from sqlalchemy.exc import SQLAlchemyError
+from factory import Status, NotificationStatus, WFHDailyOccupancy, NotificationCounter, TaskOutbox, IdempotencyKey, WFHRequestSchema, WFHRequestEntrySchema, AuditTrailSchema
+import migrations
+import audit_archive
+import occupancy
+import notifications
+import events
+import idempotency
+import outbox
+import replica
+import serializers
+import transitions
+import workcalendar
+from utility import get_previous_working_day
 
 class WFHRequestsTest(unittest.TestCase):
     def setUp(self):
@@ -25,13 +43,6 @@ class WFHRequestsTest(unittest.TestCase):
                 }
             ]
         }
-        self.sample_withdraw_data = {
-            "request_id": 1,
-            "entry_ids": [
-                {"entry_id": 101, "reason": "Personal reasons"},
-                {"entry_id": 102, "reason": "Family emergency"}
-            ]
-        }
 
     def tearDown(self):
         self.app_context.pop()
@@ -59,6 +70,82 @@ class WFHRequestsTest(unittest.TestCase):
             self.assertIn('entries', first_request)
             self.assertIsInstance(first_request['entries'], list)  # Ensure entries are a list
 
+    def test_get_wfh_requests_paginated(self):
+        response = self.app.get('/wfhRequests?limit=2')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertIn('next_cursor', data)
+        self.assertLessEqual(len(data['data']), 2)
+
+        if data['next_cursor']:
+            next_response = self.app.get(f"/wfhRequests?limit=2&cursor={data['next_cursor']}")
+            self.assertEqual(next_response.status_code, 200)
+            next_data = json.loads(next_response.data)
+
+            # Pages must not overlap
+            first_ids = {r['request_id'] for r in data['data']}
+            next_ids = {r['request_id'] for r in next_data['data']}
+            self.assertFalse(first_ids & next_ids)
+
+    def test_get_wfh_requests_invalid_cursor(self):
+        response = self.app.get('/wfhRequests?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_fast_serializers_match_schemas(self):
+        created_at = datetime(2031, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc)
+        wfh_request = WFHRequest(
+            request_id=1, requester_id=2, reporting_manager=3, department=None, overall_status=Status.APPROVED,
+            notification_status=NotificationStatus.SEEN, last_notification_status=NotificationStatus.EDITED,
+            created_at=created_at, modified_at=datetime(2031, 1, 2)
+        )
+        entry = WFHRequestEntry(
+            entry_id=4, request_id=1, entry_date=date(2031, 1, 3), reason="Reason", duration="AM",
+            status=Status.PENDING, action_reason=None
+        )
+        audit_trail = AuditTrail(
+            audit_id=5, request_id=1, entry_id=None, requester_id=2, reporting_manager=3, department="Dept",
+            entry_date=None, status=Status.REJECTED, created_at=created_at
+        )
+
+        for dump, schema, obj in (
+            (serializers.dump_request, WFHRequestSchema(), wfh_request),
+            (serializers.dump_entry, WFHRequestEntrySchema(), entry),
+            (serializers.dump_audit_trail, AuditTrailSchema(), audit_trail),
+        ):
+            # Same keys, same order, same values
+            self.assertEqual(list(dump(obj).items()), list(schema.dump(obj).items()))
+        self.assertNotIn('version', serializers.dump_request(wfh_request))
+
+    def test_stream_wfh_requests_ndjson(self):
+        response = self.app.get('/wfhRequests', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+
+        # Every line is a standalone request document with its entries
+        for line in response.get_data(as_text=True).splitlines():
+            request_data = json.loads(line)
+            self.assertIn('request_id', request_data)
+            self.assertIsInstance(request_data['entries'], list)
+
+    def test_stream_wfh_requests_by_dept(self):
+        response = self.app.get('/wfhRequests/dept/Finance?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+
+        for line in response.get_data(as_text=True).splitlines():
+            self.assertEqual(json.loads(line)['department'], 'Finance')
+
+    def test_migrations_are_idempotent(self):
+        migrations.upgrade(db.engine)
+
+        # A second run finds nothing pending
+        self.assertEqual(migrations.upgrade(db.engine), [])
+        self.assertEqual(
+            [m.revision for m in migrations.load_migrations()],
+            sorted(migrations.applied_revisions(db.engine))
+        )
+
     def test_valid_request_ID(self):
         response = self.app.get('/wfhRequests/3')  # Valid request ID
         self.assertEqual(response.status_code, 200)
@@ -162,6 +249,29 @@ class WFHRequestsTest(unittest.TestCase):
         self.assertIsInstance(data, list)  # Ensure the response is a list
         self.assertEqual(len(data), 0)  # No entries should be returned
 
+    def test_get_requests_by_date_range_buckets(self):
+        response = self.app.get('/wfhRequests/range?start=2024-10-14&end=2024-10-20')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        # One bucket per day, inclusive of both ends
+        self.assertEqual(sorted(data['data'].keys()), [f"2024-10-{day}" for day in range(14, 21)])
+
+    def test_get_requests_by_date_range_working_days(self):
+        # Chinese New Year 2024 fell on a weekend, with the Monday off in lieu
+        response = self.app.get('/wfhRequests/range?start=2024-02-08&end=2024-02-14&working_days_only=true')
+        self.assertEqual(response.status_code, 200)
+
+        data = json.loads(response.data)
+        self.assertEqual(sorted(data['data'].keys()), ["2024-02-08", "2024-02-09", "2024-02-13", "2024-02-14"])
+        self.assertEqual(data['working_days'], 4)
+
+    def test_get_requests_by_date_range_invalid(self):
+        self.assertEqual(self.app.get('/wfhRequests/range?start=2024-10-14').status_code, 400)
+        self.assertEqual(self.app.get('/wfhRequests/range?start=2024-10-20&end=2024-10-14').status_code, 400)
+        self.assertEqual(self.app.get('/wfhRequests/range?start=2024-01-01&end=2024-12-31').status_code, 400)
+        self.assertEqual(self.app.get('/wfhRequests/range?start=2024-10-14&end=2024-10-20&status=Unknown').status_code, 400)
+
     def test_get_notifications_length_with_notifications(self):
         # Call the endpoint with a staff ID that has notifications
         response = self.app.get('/wfhRequests/getNotificationsLength/140894')
@@ -228,43 +338,6 @@ class WFHRequestsTest(unittest.TestCase):
         # Check status code in response
         self.assertEqual(data['status_code'], 200)
 
-    @patch('app.db.session')
-    @patch('app.worker.send_task')
-    def test_create_wfh_request(self, mock_send_task, mock_db_session):
-        # Mock the send_task call
-        mock_send_task.return_value = MagicMock()
-
-        # Mock the database commit and flush
-        mock_db_session.commit = MagicMock()
-        mock_db_session.flush = MagicMock()
-
-        # Mock the creation of WFHRequest and WFHRequestEntry objects
-        mock_wfh_request = WFHRequest(requester_id=1, reporting_manager=2, department="IT", overall_status=Status.PENDING)
-        mock_wfh_request.request_id = 1
-        mock_db_session.add = MagicMock()
-        
-        # Mock WFHRequestEntry creation
-        mock_wfh_entry = WFHRequestEntry(request_id=1, entry_date="2024-10-14 09:00:00", reason="Doctor's appointment", duration="Full Day", status=Status.PENDING)
-        mock_wfh_entry.entry_id = 1
-
-        # Simulate POST request to /wfhRequests
-        response = self.app.post(
-            '/wfhRequests',
-            data=json.dumps(self.sample_data),
-            content_type='application/json'
-        )
-
-        # Assert that the response status code is 201 (created)
-        self.assertEqual(response.status_code, 201)
-
-        # Assert that the mock methods were called
-        mock_db_session.add.assert_called()
-        mock_send_task.assert_called()
-
-        # Assert the response message
-        response_data = json.loads(response.data)
-        self.assertEqual(response_data["message"], "WFH Request created")
-    
     @patch('app.db.session')
     def test_delete_request(self, mock_db_session):
         # Simulate the deletion of an existing WFH request
@@ -280,373 +353,1028 @@ class WFHRequestsTest(unittest.TestCase):
         mock_db_session.delete.assert_called_with(mock_wfh_request)
         mock_db_session.commit.assert_called()
 
-    @patch('app.db.session')
-    def test_withdrawal(self, mock_db_session):
-        mock_wfh_request = MagicMock()
-        mock_db_session.get.return_value = mock_wfh_request
 
-        response = self.app.put(
-            '/wfhRequests/withdraw',
-            data=json.dumps(self.sample_withdraw_data),
-            content_type='application/json'
+class WorkCalendarTest(unittest.TestCase):
+    def setUp(self):
+        self.calendar = workcalendar.WorkCalendar(2024, 2025, {
+            date(2024, 12, 25): "Christmas Day", date(2025, 1, 1): "New Year's Day",
+        })
+
+    def test_is_working_day(self):
+        self.assertTrue(self.calendar.is_working_day(date(2024, 12, 24)))
+        self.assertFalse(self.calendar.is_working_day(date(2024, 12, 25)))
+        self.assertFalse(self.calendar.is_working_day(date(2024, 12, 28)))
+
+    def test_previous_and_next_working_day(self):
+        # Back over New Year's Day, then over a weekend
+        self.assertEqual(self.calendar.previous_working_day(date(2025, 1, 2)), date(2024, 12, 31))
+        self.assertEqual(self.calendar.previous_working_day(date(2024, 12, 30)), date(2024, 12, 27))
+        self.assertEqual(self.calendar.next_working_day(date(2024, 12, 24)), date(2024, 12, 26))
+        self.assertEqual(self.calendar.next_working_day(date(2024, 12, 27)), date(2024, 12, 30))
+
+    def test_working_days_in_range(self):
+        self.assertEqual(self.calendar.working_days_between(date(2024, 12, 23), date(2025, 1, 5)), 8)
+        self.assertEqual(self.calendar.working_days(date(2024, 12, 25), date(2024, 12, 31)), [
+            date(2024, 12, 26), date(2024, 12, 27), date(2024, 12, 30), date(2024, 12, 31)
+        ])
+        self.assertEqual(self.calendar.working_days_between(date(2025, 12, 31), date(2025, 12, 31)), 1)
+        self.assertEqual(self.calendar.working_days(date(2024, 12, 28), date(2024, 12, 29)), [])
+
+    def test_outside_the_span_only_weekends_are_skipped(self):
+        self.assertTrue(self.calendar.is_working_day(date(2026, 1, 1)))
+        self.assertFalse(self.calendar.is_working_day(date(2023, 12, 31)))
+        self.assertEqual(self.calendar.previous_working_day(date(2024, 1, 1)), date(2023, 12, 29))
+        self.assertEqual(self.calendar.next_working_day(date(2025, 12, 31)), date(2026, 1, 1))
+        self.assertEqual(self.calendar.next_working_day(date(2026, 1, 2)), date(2026, 1, 5))
+
+    def test_ranges_across_the_span_boundary(self):
+        # Holidays count inside the span and only weekends outside it
+        self.assertEqual(self.calendar.working_days_between(date(2023, 12, 28), date(2024, 1, 2)), 4)
+        self.assertEqual(self.calendar.working_days(date(2025, 12, 30), date(2026, 1, 5)), [
+            date(2025, 12, 30), date(2025, 12, 31), date(2026, 1, 1), date(2026, 1, 2), date(2026, 1, 5)
+        ])
+        self.assertEqual(self.calendar.working_days_between(date(2025, 12, 30), date(2026, 1, 5)), 5)
+        self.assertEqual(self.calendar.working_days_between(date(2041, 1, 1), date(2041, 1, 31)), 23)
+
+    def test_previous_working_day_skips_public_holidays(self):
+        # Chinese New Year 2024: Saturday, Sunday and the Monday off in lieu
+        self.assertEqual(get_previous_working_day(datetime(2024, 2, 13, 9)).isoformat(), "2024-02-09T00:00:00+08:00")
+        self.assertEqual(get_previous_working_day(datetime(2024, 10, 14, 9)).isoformat(), "2024-10-11T00:00:00+08:00")
+
+
+class WFHTransitionTest(unittest.TestCase):
+    """Creates and transitions run against the database in a single transaction."""
+
+    requester_id = 990301
+    manager_id = 990302
+    department = "TransitionTest"
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        self.request_id, self.entry_ids = self.create_request(self.requester_id, self.manager_id)
+        self.last_outbox_id = db.session.query(db.func.max(TaskOutbox.outbox_id)).scalar() or 0
+
+        self.statements = []
+        self.commits = []
+        event.listen(db.engine, "before_cursor_execute", self._count_statement)
+        event.listen(db.engine, "commit", self._count_commit)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self._count_statement)
+        event.remove(db.engine, "commit", self._count_commit)
+        for wfh_request in db.session.query(WFHRequest).filter_by(department=self.department):
+            db.session.query(AuditTrail).filter_by(request_id=wfh_request.request_id).delete()
+            db.session.delete(wfh_request)
+        db.session.query(NotificationCounter).filter(
+            NotificationCounter.staff_id.in_([self.requester_id, self.manager_id])
+        ).delete()
+        db.session.query(WFHDailyOccupancy).filter_by(department=self.department).delete()
+        db.session.query(TaskOutbox).filter(TaskOutbox.outbox_id > self.last_outbox_id).delete()
+        db.session.query(IdempotencyKey).filter(IdempotencyKey.key.like("transition-test-%")).delete(synchronize_session=False)
+        db.session.commit()
+        self.app_context.pop()
+
+    def outbox_tasks(self):
+        tasks = db.session.query(TaskOutbox).filter(TaskOutbox.outbox_id > self.last_outbox_id).order_by(TaskOutbox.outbox_id)
+        return [(task.task_name, task.kwargs, task.eta) for task in tasks]
+
+    def _count_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _count_commit(self, conn):
+        self.commits.append(conn)
+
+    def create_request(self, requester_id, reporting_manager, statuses=(Status.PENDING, Status.PENDING), first_day=1):
+        wfh_request = WFHRequest(requester_id=requester_id, reporting_manager=reporting_manager, department=self.department)
+        for day, status in enumerate(statuses, start=first_day):
+            wfh_request.entries.append(WFHRequestEntry(
+                entry_date=date(2031, 7, day), reason="Transition", duration="Full Day", status=status, action_reason=""
+            ))
+        db.session.add(wfh_request)
+        db.session.commit()
+        return wfh_request.request_id, [entry.entry_id for entry in wfh_request.entries]
+
+    def put(self, action, entry_ids, request_id=None, idempotency_key=None):
+        self.statements.clear()
+        self.commits.clear()
+        headers = {idempotency.HEADER: idempotency_key} if idempotency_key else {}
+        return self.app.put(
+            f'/wfhRequests/{action}', json={"request_id": request_id or self.request_id, "entry_ids": entry_ids}, headers=headers
         )
-        self.assertEqual(response.status_code, 200)
+
+    def load(self, request_id=None):
+        db.session.expire_all()
+        wfh_request = db.session.get(WFHRequest, request_id or self.request_id)
+        return wfh_request, {entry.entry_id: entry for entry in wfh_request.entries}
+
+    def audit_statuses(self, request_id=None):
+        audit_trails = db.session.query(AuditTrail).filter_by(request_id=request_id or self.request_id).order_by(AuditTrail.audit_id)
+        return [(audit_trail.entry_id, audit_trail.status) for audit_trail in audit_trails]
+
+    def post_request(self, requester_id, reporting_manager, days, idempotency_key=None):
+        self.statements.clear()
+        self.commits.clear()
+        headers = {idempotency.HEADER: idempotency_key} if idempotency_key else {}
+        return self.app.post('/wfhRequests', headers=headers, json={
+            "requester_id": requester_id,
+            "reporting_manager": reporting_manager,
+            "department": self.department,
+            "entries": [
+                {"entry_date": f"2032-{1 + day // 28:02d}-{1 + day % 28:02d} 09:00:00", "reason": "Batch", "duration": "Full Day"}
+                for day in range(days)
+            ],
+        })
+
+    def test_create_wfh_request(self):
+        response = self.post_request(self.requester_id, self.manager_id, 1)
+
+        self.assertEqual(response.status_code, 201)
         response_data = json.loads(response.data)
-        self.assertEqual(response_data["message"], "Entries updated successfully")
+        self.assertEqual(response_data["message"], "WFH Request created")
 
-        mock_db_session.commit.assert_called()
+        request_id = response_data["data"]["request_id"]
+        wfh_request, entries = self.load(request_id)
+        self.assertEqual(wfh_request.overall_status, Status.PENDING)
+        self.assertEqual([entry.entry_date for entry in entries.values()], [date(2032, 1, 1)])
+        entry_id, = entries
+        self.assertEqual(self.audit_statuses(request_id), [(None, Status.PENDING), (entry_id, Status.PENDING)])
+        # The auto-reject task waits in the outbox, committed with the request
+        self.assertEqual(self.outbox_tasks(), [(
+            "auto_reject", {'request_id': request_id, 'entry_id': entry_id},
+            get_previous_working_day(datetime(2032, 1, 1, 9)).isoformat()
+        )])
+
+    def test_create_many_entries_batches_inserts(self):
+        response = self.post_request(self.requester_id, self.manager_id, 200)
+        self.assertEqual(response.status_code, 201)
 
-    @patch('app.db.session')
-    @patch('app.WFHRequestEntry')
-    @patch('app.WFHRequest')
-    def test_approve_request(self, mock_wfh_request, mock_wfh_request_entry, mock_db_session):
-        # Mock the WFHRequestEntry records (these are the individual entries)
-        mock_wfh_request_entry_1 = MagicMock()
-        mock_wfh_request_entry_2 = MagicMock()
-
-        # Mock the WFHRequest (the overall request)
-        mock_request_record = MagicMock()
-
-        # Set the mock to return a list of matching WFHRequestEntry objects
-        mock_filter_query = MagicMock()
-        mock_filter_query.filter.return_value = mock_filter_query  # Allow method chaining
-        mock_filter_query.all.return_value = [mock_wfh_request_entry_1, mock_wfh_request_entry_2]
-
-        # Simulate the request entries being approved in the app logic
-        mock_wfh_request_entry_1.status = Status.APPROVED
-        mock_wfh_request_entry_2.status = Status.APPROVED
-
-        # Mock the WFHRequestEntry query behavior
-        mock_wfh_request_entry.query.filter.return_value = mock_filter_query
-
-        # Mock getting the WFHRequest record for the request_id
-        mock_wfh_request.query.get.return_value = mock_request_record
-
-        # Simulate the PUT request to the /wfhRequests/approve endpoint
-        response = self.app.put(
-            '/wfhRequests/approve',
-            data=json.dumps({
-                'request_id': 1,
-                'entry_ids': [101, 102]  # Example entry IDs
-            }),
-            content_type='application/json'
-        )
+        # Entries and audits go out as multi-row inserts, so the statement count does not grow with them.
+        # SQLite cannot return ids in parameter order from one statement, so SQLAlchemy inserts its entries row by row.
+        self.assertEqual(len(self.commits), 1)
+        if db.engine.dialect.name == 'postgresql':
+            self.assertLessEqual(len(self.statements), 8, self.statements)
+
+        request_id = json.loads(response.data)["data"]["request_id"]
+        wfh_request, entries = self.load(request_id)
+        self.assertEqual(len(entries), 200)
+        self.assertEqual(sorted(entry.entry_date for entry in entries.values())[-1], date(2032, 8, 4))
+        audits = self.audit_statuses(request_id)
+        self.assertEqual(audits[0], (None, Status.PENDING))
+        self.assertEqual([entry_id for entry_id, _ in audits[1:]], sorted(entries))
+        self.assertEqual(len(self.outbox_tasks()), 200)
+
+    def test_create_self_managed_request_is_approved(self):
+        response = self.post_request(self.manager_id, self.manager_id, 2)
+        self.assertEqual(response.status_code, 201)
+
+        request_id = json.loads(response.data)["data"]["request_id"]
+        wfh_request, entries = self.load(request_id)
+        self.assertEqual(wfh_request.overall_status, Status.APPROVED)
+        first, second = sorted(entries)
+        self.assertEqual(self.audit_statuses(request_id), [
+            (None, Status.PENDING), (first, Status.APPROVED), (second, Status.APPROVED), (None, Status.APPROVED)
+        ])
+
+    def test_create_with_invalid_entry_date(self):
+        response = self.app.post('/wfhRequests', json={
+            "requester_id": self.requester_id, "reporting_manager": self.manager_id, "department": self.department,
+            "entries": [{"entry_date": "14/10/2032", "reason": "Batch", "duration": "Full Day"}],
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.outbox_tasks(), [])
+        self.assertEqual(db.session.query(WFHRequest).filter_by(requester_id=self.requester_id).count(), 1)
+
+    def test_create_rejects_dates_already_requested(self):
+        def post(*days):
+            return self.app.post('/wfhRequests', json={
+                "requester_id": self.requester_id, "reporting_manager": self.manager_id, "department": self.department,
+                "entries": [{"entry_date": f"2031-07-{day:02d} 00:00:00", "reason": "Again", "duration": "Full Day"} for day in days],
+            })
+
+        response = post(2, 3)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(json.loads(response.data)["dates"], ["2031-07-02"])
+
+        response = post(3, 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.data)["dates"], ["2031-07-03"])
+        self.assertEqual(db.session.query(WFHRequest).filter_by(requester_id=self.requester_id).count(), 1)
+
+        # Cancelled entries give their dates back
+        self.put('cancel', self.entry_ids[1:])
+        self.assertEqual(post(2, 3).status_code, 201)
+
+    def test_occupied_dates(self):
+        self.create_request(self.requester_id, self.manager_id, (Status.APPROVED, Status.REJECTED, Status.PENDING_WITHDRAWN), first_day=3)
+
+        response = self.app.get(f'/wfhRequests/requester/{self.requester_id}/dates?start=2031-07-02&end=2031-07-31')
 
-        # Assert that the response status code is 200 (OK)
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["data"], ["2031-07-02", "2031-07-03", "2031-07-05"])
+        self.assertEqual(self.app.get(f'/wfhRequests/requester/{self.requester_id}/dates?start=2031-07-02').status_code, 400)
 
-        # Parse the JSON response data
-        response_data = json.loads(response.data)
+    @patch('app.db.session.commit', side_effect=SQLAlchemyError("commit failed"))
+    def test_rolled_back_create_leaves_no_task(self, mock_commit):
+        response = self.post_request(self.requester_id, self.manager_id, 1)
 
-        # Assert that the entries were updated successfully
-        self.assertEqual(response_data["message"], "Entries updated successfully")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.outbox_tasks(), [])
 
-        # Assert that the mock query methods were called correctly
-        mock_wfh_request_entry.query.filter.assert_called_once()  # Ensure first filter was called
+    def test_relay_publishes_and_clears_outbox(self):
+        self.post_request(self.requester_id, self.manager_id, 3)
+        task_ids = [task.task_id for task in db.session.query(TaskOutbox).filter(TaskOutbox.outbox_id > self.last_outbox_id)]
+        worker = MagicMock()
 
-        # Assert that the function updated the status of the WFHRequest
-        self.assertEqual(mock_request_record.overall_status, Status.APPROVED)
-        self.assertEqual(mock_request_record.notification_status, NotificationStatus.EDITED)
+        self.assertEqual(outbox.relay_batch(worker, batch_size=2), 2)
+        self.assertEqual(outbox.relay_batch(worker, batch_size=2), 1)
 
-    @patch('app.WFHRequestEntry')
-    @patch('app.WFHRequest')
-    @patch('app.db.session')
-    def test_reject_requests(self, mock_db_session, mock_WFHRequest, mock_WFHRequestEntry):
-        # Create test client
-        client = app.test_client()
-
-        # Mock data
-        mock_request_id = 1
-        mock_entry_ids = [
-            {"entry_id": 101, "reason": "Invalid request"},
-            {"entry_id": 102, "reason": "Not allowed"}
-        ]
+        self.assertEqual(self.outbox_tasks(), [])
+        sent = [call.kwargs['task_id'] for call in worker.send_task.call_args_list]
+        self.assertEqual(sent, task_ids)
+        self.assertTrue(all(call.args == ("auto_reject",) for call in worker.send_task.call_args_list))
 
-        # Create mock WFHRequestEntry instances
-        mock_entry_1 = MagicMock()
-        mock_entry_1.entry_id = 101
-        mock_entry_1.request_id = mock_request_id
-        mock_entry_1.status = Status.PENDING
-
-        mock_entry_2 = MagicMock()
-        mock_entry_2.entry_id = 102
-        mock_entry_2.request_id = mock_request_id
-        mock_entry_2.status = Status.PENDING
-
-        # Chain the mock methods to ensure the proper behavior
-        mock_filter_query = MagicMock()
-        mock_filter_query.filter.return_value = mock_filter_query  # Chaining the filter
-        mock_filter_query.all.return_value = [mock_entry_1, mock_entry_2]  # Return the mock entries
-        mock_WFHRequestEntry.query.filter.return_value = mock_filter_query
-
-        # Mock all entries related to this request ID
-        mock_WFHRequestEntry.query.filter_by.return_value.all.return_value = [mock_entry_1, mock_entry_2]
-
-        # Mock the WFHRequest record
-        mock_request_record = MagicMock()
-        mock_request_record.request_id = mock_request_id
-        mock_WFHRequest.query.get.return_value = mock_request_record
-
-        # Create the payload
-        payload = {
-            "request_id": mock_request_id,
-            "entry_ids": mock_entry_ids
-        }
+    def test_relay_keeps_tasks_when_publishing_fails(self):
+        self.post_request(self.requester_id, self.manager_id, 1)
+        worker = MagicMock()
+        worker.send_task.side_effect = ConnectionError("broker down")
 
-        # Send the request
-        response = client.put('/wfhRequests/reject', data=json.dumps(payload), content_type='application/json')
+        with self.assertRaises(ConnectionError):
+            outbox.relay_batch(worker)
+        db.session.rollback()
 
-        # Check that the query was called with correct parameters
-        mock_WFHRequestEntry.query.filter.assert_called()
-        mock_filter_query.all.assert_called()  # Ensure `all()` was called on the chain
+        self.assertEqual(len(self.outbox_tasks()), 1)
 
-        # Check that the status was updated for both entries
-        self.assertEqual(mock_entry_1.status, Status.REJECTED)
-        self.assertEqual(mock_entry_2.status, Status.REJECTED)
+    def test_approve_request(self):
+        response = self.put('approve', self.entry_ids)
 
-        # Check that the action_reason was updated for both entries
-        self.assertEqual(mock_entry_1.action_reason, "Invalid request")
-        self.assertEqual(mock_entry_2.action_reason, "Not allowed")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["message"], "Entries updated successfully")
+        # One round of statements and a single commit, whatever the number of entries
+        self.assertEqual(len(self.commits), 1)
+        self.assertLessEqual(len(self.statements), 6, self.statements)
+
+        wfh_request, entries = self.load()
+        self.assertTrue(all(entry.status == Status.APPROVED for entry in entries.values()))
+        self.assertEqual(wfh_request.overall_status, Status.APPROVED)
+        self.assertEqual(wfh_request.notification_status, NotificationStatus.EDITED)
+        self.assertEqual(self.audit_statuses(), [
+            (self.entry_ids[0], Status.APPROVED), (self.entry_ids[1], Status.APPROVED), (None, Status.APPROVED)
+        ])
+
+    def test_approving_part_of_a_request_marks_it_reviewed(self):
+        self.put('approve', self.entry_ids[:1])
+
+        wfh_request, entries = self.load()
+        self.assertEqual(entries[self.entry_ids[0]].status, Status.APPROVED)
+        self.assertEqual(entries[self.entry_ids[1]].status, Status.PENDING)
+        self.assertEqual(wfh_request.overall_status, Status.REVIEWED)
+
+    def race_transitions(self, entry_ids, races):
+        """Approve entry_ids from another connection right before each of the first races request updates."""
+        writes = []
+
+        def approve_concurrently(conn, cursor, statement, parameters, context, executemany):
+            if conn is other or not statement.startswith("UPDATE wfhrequests "):
+                return
+            writes.append(statement)
+            if len(writes) <= races:
+                other.execute(
+                    update(WFHRequestEntry).where(WFHRequestEntry.entry_id.in_(entry_ids)).values(status=Status.APPROVED)
+                )
+                other.execute(
+                    update(WFHRequest).where(WFHRequest.request_id == self.request_id).values(version=WFHRequest.version + 1)
+                )
+                other.commit()
+
+        other = db.engine.connect()
+        event.listen(db.engine, "before_cursor_execute", approve_concurrently)
+        self.addCleanup(other.close)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", approve_concurrently)
+        return writes
+
+    def test_transition_retries_after_concurrent_change(self):
+        writes = self.race_transitions(self.entry_ids[1:], races=1)
+
+        response = self.put('approve', self.entry_ids[:1])
 
-        # Check that the request record was updated
-        self.assertEqual(mock_request_record.overall_status, Status.REJECTED)
-        self.assertEqual(mock_request_record.notification_status, NotificationStatus.EDITED)
-        self.assertEqual(mock_request_record.last_notification_status, NotificationStatus.EDITED)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(writes), 2)
+        wfh_request, entries = self.load()
+        self.assertTrue(all(entry.status == Status.APPROVED for entry in entries.values()))
+        # Recomputed from the other approval instead of overwriting it with REVIEWED
+        self.assertEqual(wfh_request.overall_status, Status.APPROVED)
+        self.assertEqual(self.audit_statuses(), [(self.entry_ids[0], Status.APPROVED), (None, Status.APPROVED)])
+
+    def test_transition_gives_up_after_repeated_conflicts(self):
+        writes = self.race_transitions([], races=transitions.MAX_ATTEMPTS)
+
+        response = self.put('approve', self.entry_ids)
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(writes), transitions.MAX_ATTEMPTS)
+        wfh_request, entries = self.load()
+        self.assertTrue(all(entry.status == Status.PENDING for entry in entries.values()))
+        self.assertEqual(wfh_request.overall_status, Status.PENDING)
+        self.assertEqual(self.audit_statuses(), [])
+
+    def test_reject_requests(self):
+        response = self.put('reject', [
+            {"entry_id": self.entry_ids[0], "reason": "Invalid request"},
+            {"entry_id": self.entry_ids[1], "reason": "Not allowed"},
+        ])
+        self.assertEqual(response.status_code, 200)
 
-        # Check that the response status is 200
+        wfh_request, entries = self.load()
+        self.assertEqual(entries[self.entry_ids[0]].status, Status.REJECTED)
+        self.assertEqual(entries[self.entry_ids[0]].action_reason, "Invalid request")
+        self.assertEqual(entries[self.entry_ids[1]].action_reason, "Not allowed")
+        self.assertEqual(wfh_request.overall_status, Status.REJECTED)
+        self.assertEqual(wfh_request.notification_status, NotificationStatus.EDITED)
+        self.assertEqual(wfh_request.last_notification_status, NotificationStatus.EDITED)
+
+    def test_withdrawal(self):
+        response = self.put('withdraw', [
+            {"entry_id": self.entry_ids[0], "reason": "Personal reasons"},
+            {"entry_id": self.entry_ids[1], "reason": "Family emergency"},
+        ])
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["message"], "Entries updated successfully")
 
-        # Check that the session commit was called twice (once for entries, once for the request)
-        self.assertEqual(mock_db_session.commit.call_count, 2)
+        wfh_request, entries = self.load()
+        self.assertEqual(entries[self.entry_ids[1]].action_reason, "Family emergency")
+        self.assertEqual(wfh_request.overall_status, Status.WITHDRAWN)
+        self.assertEqual(wfh_request.notification_status, NotificationStatus.WITHDRAWN)
 
+    def test_cancel_requests(self):
+        self.put('cancel', self.entry_ids[:1])
+        wfh_request, _ = self.load()
+        # A partly cancelled request goes back to pending
+        self.assertEqual(wfh_request.overall_status, Status.PENDING)
 
-    @patch('app.db.session')
-    @patch('app.WFHRequestEntry')
-    @patch('app.WFHRequest')
-    def test_cancel_requests(self, mock_wfh_request, mock_wfh_request_entry, mock_db_session):
-        # Mock the WFHRequestEntry records (these are the individual entries)
-        mock_wfh_request_entry_1 = MagicMock()
-        mock_wfh_request_entry_2 = MagicMock()
-
-        # Mock the WFHRequest (the overall request)
-        mock_request_record = MagicMock()
-
-        # Set the mock to return a list of matching WFHRequestEntry objects
-        mock_filter_query = MagicMock()
-        mock_filter_query.filter.return_value = mock_filter_query  # Allow method chaining
-        mock_filter_query.all.return_value = [mock_wfh_request_entry_1, mock_wfh_request_entry_2]
-
-        # Simulate the request entries being cancelled in the app logic
-        mock_wfh_request_entry_1.status = Status.CANCELLED
-        mock_wfh_request_entry_2.status = Status.CANCELLED
-
-        # Mock the WFHRequestEntry query behavior
-        mock_wfh_request_entry.query.filter.return_value = mock_filter_query
-
-        # Mock getting the WFHRequest record for the request_id
-        mock_wfh_request.query.get.return_value = mock_request_record
-
-        # Simulate the PUT request to the /wfhRequests/cancel endpoint
-        response = self.app.put(
-            '/wfhRequests/cancel',
-            data=json.dumps({
-                'request_id': 1,
-                'entry_ids': [101, 102]  # Example entry IDs
-            }),
-            content_type='application/json'
-        )
+        response = self.put('cancel', self.entry_ids[1:])
+        self.assertEqual(response.status_code, 200)
+        wfh_request, _ = self.load()
+        self.assertEqual(wfh_request.overall_status, Status.CANCELLED)
+        self.assertEqual(wfh_request.notification_status, NotificationStatus.CANCELLED)
 
-        # Assert that the response status code is 200 (OK)
+    def test_revoke_requests(self):
+        response = self.put('revoke', self.entry_ids)
+        self.assertEqual(response.status_code, 200)
+        wfh_request, _ = self.load()
+        self.assertEqual(wfh_request.overall_status, Status.PENDING_WITHDRAWN)
+        self.assertEqual(wfh_request.notification_status, NotificationStatus.SELF_WITHDRAWN)
+
+        # Requesters who are their own manager withdraw straight away
+        request_id, entry_ids = self.create_request(self.manager_id, self.manager_id)
+        self.put('revoke', entry_ids, request_id=request_id)
+        wfh_request, entries = self.load(request_id)
+        self.assertTrue(all(entry.status == Status.WITHDRAWN for entry in entries.values()))
+        self.assertEqual(wfh_request.overall_status, Status.WITHDRAWN)
+
+    def test_acknowledge_requests(self):
+        response = self.put('acknowledge', self.entry_ids)
         self.assertEqual(response.status_code, 200)
 
-        # Parse the JSON response data
-        response_data = json.loads(response.data)
+        wfh_request, _ = self.load()
+        self.assertEqual(wfh_request.overall_status, Status.WITHDRAWN)
+        self.assertEqual(wfh_request.notification_status, NotificationStatus.ACKNOWLEDGED)
 
-        # Assert that the entries were updated successfully
-        self.assertEqual(response_data["message"], "Entries updated successfully")
+    def test_auto_reject_requests(self):
+        request_id, entry_ids = self.create_request(self.requester_id, self.manager_id, (Status.PENDING, Status.APPROVED), first_day=3)
+        response = self.put('autoReject', entry_ids, request_id=request_id)
 
-        # Assert that the mock query methods were called correctly
-        mock_wfh_request_entry.query.filter.assert_called_once()  # Ensure filter was called
-        mock_filter_query.all.assert_called_once()  # Ensure all() was called to get the entries
-        self.assertEqual(mock_db_session.commit.call_count, 2)  # Expect two commit() calls
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["message"], "Entries updated successfully to AUTO_REJECTED")
+
+        # Only pending entries are auto-rejected, and no audit rows are written
+        wfh_request, entries = self.load(request_id)
+        self.assertEqual(entries[entry_ids[0]].status, Status.AUTO_REJECTED)
+        self.assertEqual(entries[entry_ids[1]].status, Status.APPROVED)
+        self.assertEqual(wfh_request.overall_status, Status.REVIEWED)
+        self.assertEqual(wfh_request.notification_status, NotificationStatus.AUTO_REJECTED)
+        self.assertEqual(self.audit_statuses(request_id), [])
+
+    def test_bulk_approve(self):
+        other_request_id, other_entry_ids = self.create_request(self.requester_id, self.manager_id, first_day=3)
+        self.statements.clear()
+        self.commits.clear()
+
+        response = self.app.put('/wfhRequests/bulk/approve', json={"items": [
+            {"request_id": self.request_id, "entry_ids": self.entry_ids},
+            {"request_id": 999999999, "entry_ids": [1]},
+            {"request_id": other_request_id, "entry_ids": other_entry_ids[:1]},
+            {"request_id": self.request_id, "entry_ids": self.entry_ids},
+            {"entry_ids": [1]},
+        ]})
 
-        # Assert that the function updated the status of the WFHRequest
-        self.assertEqual(mock_request_record.overall_status, Status.CANCELLED)
-        self.assertEqual(mock_request_record.notification_status, NotificationStatus.CANCELLED)
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.data)['data']
+        self.assertEqual((data['updated'], data['failed']), (2, 3))
+        self.assertEqual([result['status'] for result in data['results']],
+                         ["updated", "failed", "updated", "failed", "failed"])
+        self.assertEqual(data['results'][1]['error'], "Request not found")
+        self.assertEqual(data['results'][2]['overall_status'], Status.REVIEWED.value)
+        self.assertEqual(data['results'][3]['error'], "Duplicate request_id")
+
+        # All items share one transaction and the same statements as a single click
+        self.assertEqual(len(self.commits), 1)
+        self.assertLessEqual(len(self.statements), 6, self.statements)
+        self.assertEqual(self.load()[0].overall_status, Status.APPROVED)
+        self.assertEqual(self.load(other_request_id)[1][other_entry_ids[0]].status, Status.APPROVED)
+
+    def test_bulk_reject_applies_item_reason(self):
+        response = self.app.put('/wfhRequests/bulk/reject', json={"items": [
+            {"request_id": self.request_id, "entry_ids": self.entry_ids, "reason": "Team offsite"},
+        ]})
+        self.assertEqual(json.loads(response.data)['data']['updated'], 1)
+
+        _, entries = self.load()
+        self.assertTrue(all(entry.action_reason == "Team offsite" for entry in entries.values()))
+
+    def test_bulk_rejects_unknown_action_and_empty_payload(self):
+        self.assertEqual(self.app.put('/wfhRequests/bulk/revoke', json={"items": []}).status_code, 404)
+        self.assertEqual(self.app.put('/wfhRequests/bulk/approve', json={"items": []}).status_code, 400)
+
+    def test_missing_request_or_entries(self):
+        response = self.put('approve', [1], request_id=999999999)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data)["error"], "Request not found")
+
+        response = self.put('approve', [999999999])
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.data)["error"], "No matching entries found")
+        self.assertEqual(self.commits, [])
+
+
+    def test_replayed_key_returns_the_stored_response(self):
+        first = self.put('approve', self.entry_ids, idempotency_key="transition-test-approve")
+        audits = self.audit_statuses()
+
+        replay = self.put('approve', self.entry_ids, idempotency_key="transition-test-approve")
+
+        self.assertEqual(replay.status_code, first.status_code)
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(replay.headers[idempotency.REPLAYED_HEADER], 'true')
+        self.assertNotIn(idempotency.REPLAYED_HEADER, first.headers)
+        # The replay reads the stored response only
+        self.assertTrue(all("idempotency_keys" in statement for statement in self.statements), self.statements)
+        self.assertEqual(self.commits, [])
+        self.assertEqual(self.audit_statuses(), audits)
+
+    def test_key_reused_for_a_different_request_is_rejected(self):
+        self.put('approve', self.entry_ids[:1], idempotency_key="transition-test-reused")
+
+        response = self.put('reject', [{"entry_id": self.entry_ids[1], "reason": "No"}], idempotency_key="transition-test-reused")
+
+        self.assertEqual(response.status_code, 422)
+        wfh_request, entries = self.load()
+        self.assertEqual(entries[self.entry_ids[1]].status, Status.PENDING)
+
+    def test_repeated_create_with_a_key_creates_one_request(self):
+        first = self.post_request(self.requester_id, self.manager_id, 2, idempotency_key="transition-test-create")
+        replay = self.post_request(self.requester_id, self.manager_id, 2, idempotency_key="transition-test-create")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(json.loads(replay.data), json.loads(first.data))
+        # The request from setUp plus the one created here
+        self.assertEqual(db.session.query(WFHRequest).filter_by(requester_id=self.requester_id).count(), 2)
+        self.assertEqual(len(self.outbox_tasks()), 2)
+
+    def test_server_error_releases_the_key(self):
+        with patch('transitions.apply_transition', side_effect=SQLAlchemyError("database unavailable")):
+            response = self.put('approve', self.entry_ids, idempotency_key="transition-test-retry")
+        self.assertEqual(response.status_code, 500)
+
+        response = self.put('approve', self.entry_ids, idempotency_key="transition-test-retry")
 
-    @patch('app.db.session')
-    @patch('app.WFHRequestEntry')
-    @patch('app.WFHRequest')
-    def test_revoke_requests(self, mock_wfh_request, mock_wfh_request_entry, mock_db_session):
-        # Mock the WFHRequestEntry records (these are the individual entries)
-        mock_wfh_request_entry_1 = MagicMock()
-        mock_wfh_request_entry_2 = MagicMock()
-
-        # Mock the WFHRequest (the overall request)
-        mock_request_record = MagicMock()
-        mock_request_record.requester_id = 1
-        mock_request_record.reporting_manager = 1  # Simulate that the requester is also the manager
-
-        # Set the mock to return a list of matching WFHRequestEntry objects
-        mock_filter_query = MagicMock()
-        mock_filter_query.filter.return_value = mock_filter_query  # Allow method chaining
-        mock_filter_query.all.return_value = [mock_wfh_request_entry_1, mock_wfh_request_entry_2]
-
-        # Simulate the request entries being set to WITHDRAWN since requester == manager
-        mock_wfh_request_entry_1.status = Status.WITHDRAWN
-        mock_wfh_request_entry_2.status = Status.WITHDRAWN
-
-        # Mock the WFHRequestEntry query behavior
-        mock_wfh_request_entry.query.filter.return_value = mock_filter_query
-
-        # Mock getting the WFHRequest record for the request_id
-        mock_wfh_request.query.get.return_value = mock_request_record
-
-        # Simulate the PUT request to the /wfhRequests/revoke endpoint
-        response = self.app.put(
-            '/wfhRequests/revoke',
-            data=json.dumps({
-                'request_id': 1,
-                'entry_ids': [101, 102]  # Example entry IDs
-            }),
-            content_type='application/json'
-        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(idempotency.REPLAYED_HEADER, response.headers)
+        wfh_request, entries = self.load()
+        self.assertEqual(wfh_request.overall_status, Status.APPROVED)
+
+    def test_client_error_after_flush_stores_only_the_key(self):
+        with patch('app.get_previous_working_day', side_effect=ValueError("no calendar for this date")):
+            response = self.post_request(self.requester_id, self.manager_id, 1, idempotency_key="transition-test-flushed")
+        self.assertEqual(response.status_code, 400)
+
+        # Nothing the view flushed before failing was committed with the stored key
+        self.assertEqual(db.session.query(WFHRequest).filter_by(requester_id=self.requester_id).count(), 1)
+        self.assertEqual(self.outbox_tasks(), [])
+        replay = self.post_request(self.requester_id, self.manager_id, 1, idempotency_key="transition-test-flushed")
+        self.assertEqual(replay.headers[idempotency.REPLAYED_HEADER], 'true')
+
+    def test_concurrent_conflict_releases_the_key(self):
+        self.race_transitions([], races=transitions.MAX_ATTEMPTS)
+        response = self.put('approve', self.entry_ids, idempotency_key="transition-test-conflict")
+        self.assertEqual(response.status_code, 409)
+
+        # The retry the 409 asks for runs instead of replaying the conflict
+        response = self.put('approve', self.entry_ids, idempotency_key="transition-test-conflict")
 
-        # Assert that the response status code is 200 (OK)
         self.assertEqual(response.status_code, 200)
+        self.assertNotIn(idempotency.REPLAYED_HEADER, response.headers)
 
-        # Parse the JSON response data
-        response_data = json.loads(response.data)
+    def test_claim_is_held_across_retried_attempts(self):
+        writes = self.race_transitions([], races=1)
+        claims_seen = []
 
-        # Assert that the entries were updated successfully
-        self.assertEqual(response_data["message"], "Entries updated successfully")
+        def read_claim_elsewhere(conn, cursor, statement, parameters, context, executemany):
+            # Before the retried attempt's UPDATE, after the first attempt was rolled back
+            if statement.startswith("UPDATE wfhrequests ") and len(writes) == 2:
+                with db.engine.connect() as outside:
+                    claims_seen.append(outside.scalar(
+                        select(IdempotencyKey.key).where(IdempotencyKey.key == "transition-test-held")
+                    ))
 
-        # Assert that the mock query methods were called correctly
-        mock_wfh_request_entry.query.filter.assert_called_once()  # Ensure filter was called
-        mock_filter_query.all.assert_called_once()  # Ensure all() was called to get the entries
-        self.assertEqual(mock_db_session.commit.call_count, 2)  # Expect two commit() calls
+        event.listen(db.engine, "before_cursor_execute", read_claim_elsewhere)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", read_claim_elsewhere)
+        response = self.put('approve', self.entry_ids, idempotency_key="transition-test-held")
 
-        # Assert that the function updated the status of the WFHRequest
-        self.assertEqual(mock_request_record.overall_status, Status.WITHDRAWN)
-        self.assertEqual(mock_request_record.notification_status, NotificationStatus.SELF_WITHDRAWN)
+        self.assertEqual(response.status_code, 200)
+        # A repeat of the request arriving during the retry would have found the key taken
+        self.assertEqual(claims_seen, ["transition-test-held"])
+
+    def test_key_in_progress_is_refused(self):
+        now = datetime.now(timezone.utc)
+        with app.test_request_context('/wfhRequests/approve', method='PUT',
+                                      json={"request_id": self.request_id, "entry_ids": self.entry_ids}):
+            fingerprint = idempotency.request_fingerprint()
+        db.session.add(IdempotencyKey(
+            key="transition-test-running", fingerprint=fingerprint, created_at=now, expires_at=now + idempotency.IDEMPOTENCY_TTL
+        ))
+        db.session.commit()
+
+        response = self.put('approve', self.entry_ids, idempotency_key="transition-test-running")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_expired_key_is_claimed_again(self):
+        expired = datetime.now(timezone.utc) - idempotency.IDEMPOTENCY_TTL
+        db.session.add(IdempotencyKey(
+            key="transition-test-expired", fingerprint="stale", status_code=200, response_body="{}",
+            content_type="application/json", created_at=expired, expires_at=expired
+        ))
+        db.session.commit()
+
+        response = self.put('approve', self.entry_ids, idempotency_key="transition-test-expired")
 
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["message"], "Entries updated successfully")
 
-    @patch('app.db.session')
-    @patch('app.WFHRequestEntry')
-    @patch('app.WFHRequest')
-    def test_acknowledge_requests(self, mock_wfh_request, mock_wfh_request_entry, mock_db_session):
-        # Mock the WFHRequestEntry records (these are the individual entries)
-        mock_wfh_request_entry_1 = MagicMock()
-        mock_wfh_request_entry_2 = MagicMock()
-
-        # Mock the WFHRequest (the overall request)
-        mock_request_record = MagicMock()
-
-        # Set the mock to return a list of matching WFHRequestEntry objects
-        mock_filter_query = MagicMock()
-        mock_filter_query.filter.return_value = mock_filter_query  # Allow method chaining
-        mock_filter_query.all.return_value = [mock_wfh_request_entry_1, mock_wfh_request_entry_2]
-
-        # Simulate the request entries being set to WITHDRAWN
-        mock_wfh_request_entry_1.status = Status.WITHDRAWN
-        mock_wfh_request_entry_2.status = Status.WITHDRAWN
-
-        # Mock the WFHRequestEntry query behavior
-        mock_wfh_request_entry.query.filter.return_value = mock_filter_query
-
-        # Mock getting the WFHRequest record for the request_id
-        mock_wfh_request.query.get.return_value = mock_request_record
-
-        # Simulate the PUT request to the /wfhRequests/acknowledge endpoint
-        response = self.app.put(
-            '/wfhRequests/acknowledge',
-            data=json.dumps({
-                'request_id': 1,
-                'entry_ids': [101, 102]  # Example entry IDs
-            }),
-            content_type='application/json'
+class WFHRequestsQueryCountTest(unittest.TestCase):
+    """Read endpoints must issue a bounded number of queries, however many requests match."""
+
+    staff_id = 990001
+    department = "QueryCountTest"
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        self.request_ids = []
+        for day in range(1, 6):
+            wfh_request = WFHRequest(requester_id=self.staff_id, reporting_manager=self.staff_id + 1, department=self.department)
+            # A requester holds one active entry per day, so the pending one lands ten days later
+            for offset, status in ((0, Status.APPROVED), (10, Status.PENDING)):
+                wfh_request.entries.append(WFHRequestEntry(
+                    entry_date=date(2031, 3, day + offset), reason="Query count", duration="Full Day",
+                    status=status, action_reason=""
+                ))
+            db.session.add(wfh_request)
+            db.session.flush()
+            self.request_ids.append(wfh_request.request_id)
+        db.session.commit()
+
+        self.statements = []
+        event.listen(db.engine, "before_cursor_execute", self._count)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self._count)
+        for request_id in self.request_ids:
+            db.session.delete(db.session.get(WFHRequest, request_id))
+        db.session.commit()
+        self.app_context.pop()
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def assertQueryCount(self, url, max_queries):
+        self.statements.clear()
+        response = self.app.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(self.statements), max_queries, self.statements)
+        return json.loads(response.data)
+
+    def test_staff_endpoint(self):
+        data = self.assertQueryCount(f'/wfhRequests/staff/{self.staff_id}', 2)
+        self.assertEqual(len(data['data']), 5)
+        self.assertTrue(all(len(r['entries']) == 2 for r in data['data']))
+
+    def test_requester_endpoint(self):
+        data = self.assertQueryCount(f'/wfhRequests/requester/{self.staff_id}', 2)
+        self.assertEqual(len(data['data']), 5)
+        self.assertTrue(all(e['status'] == 'Approved' for r in data['data'] for e in r['entries']))
+
+    def test_dept_endpoint(self):
+        data = self.assertQueryCount(f'/wfhRequests/dept/{self.department}', 2)
+        self.assertEqual(len(data['data']), 5)
+
+    def test_date_endpoint(self):
+        data = self.assertQueryCount('/wfhRequests/date/2031-03-02', 2)
+        self.assertEqual(len(data['data']), 1)
+        # Only the entry on that date; the request's pending entry falls ten days later
+        self.assertEqual([entry['entry_date'] for entry in data['data'][0]['entries']], ['2031-03-02'])
+
+    def test_date_endpoint_filters(self):
+        data = self.assertQueryCount(
+            f'/wfhRequests/date/2031-03-12?status=Approved,Pending&dept={self.department}&requester_ids={self.staff_id},1', 2
         )
+        self.assertEqual(len(data['data']), 1)
+        self.assertEqual([entry['status'] for entry in data['data'][0]['entries']], ['Pending'])
+
+        self.assertEqual(json.loads(self.app.get('/wfhRequests/date/2031-03-12?status=Approved').data), [])
+        self.assertEqual(json.loads(self.app.get('/wfhRequests/date/2031-03-12?requester_ids=').data), [])
+        self.assertEqual(self.app.get('/wfhRequests/date/2031-03-12?status=Unknown').status_code, 400)
+
+    def test_single_request_endpoint(self):
+        data = self.assertQueryCount(f'/wfhRequests/{self.request_ids[0]}', 2)
+        self.assertEqual(len(data['data']['entries']), 2)
+
+    def test_date_range_endpoint(self):
+        data = self.assertQueryCount(
+            f'/wfhRequests/range?start=2031-03-01&end=2031-03-07&dept={self.department}&status=Approved', 1
+        )
+        self.assertEqual(len(data['data']), 7)
+        self.assertEqual(len(data['data']['2031-03-03']), 1)
+        self.assertEqual(data['data']['2031-03-03'][0]['requester_id'], self.staff_id)
+        self.assertEqual(data['data']['2031-03-07'], [])
+
+    def test_paginated_listing(self):
+        self.assertQueryCount('/wfhRequests?limit=3', 2)
+
+    def test_full_listing(self):
+        # One request query plus one entry query per batch of 500 requests
+        total = db.session.query(WFHRequest).count()
+        self.assertQueryCount('/wfhRequests', 1 + math.ceil(total / 500))
 
-        # Assert that the response status code is 200 (OK)
+
+class WFHOccupancyTest(unittest.TestCase):
+    department = "OccupancyTest"
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        wfh_request = WFHRequest(requester_id=990101, reporting_manager=990102, department=self.department)
+        for day in (1, 2):
+            wfh_request.entries.append(WFHRequestEntry(
+                entry_date=date(2031, 4, day), reason="Occupancy", duration="Full Day", action_reason=""
+            ))
+        db.session.add(wfh_request)
+        occupancy.record_status_changes(self.department, [(e.entry_date, None, Status.PENDING) for e in wfh_request.entries])
+        db.session.commit()
+        self.request_id = wfh_request.request_id
+        self.entry_ids = [e.entry_id for e in wfh_request.entries]
+
+    def tearDown(self):
+        db.session.query(AuditTrail).filter_by(request_id=self.request_id).delete()
+        wfh_request = db.session.get(WFHRequest, self.request_id)
+        if wfh_request:
+            db.session.delete(wfh_request)
+        db.session.query(WFHDailyOccupancy).filter_by(department=self.department).delete()
+        db.session.commit()
+        self.app_context.pop()
+
+    def heatmap(self):
+        response = self.app.get(f'/wfhRequests/occupancy?start=2031-04-01&end=2031-04-02&dept={self.department}')
         self.assertEqual(response.status_code, 200)
+        return json.loads(response.data)['data'].get(self.department)
 
-        # Parse the JSON response data
-        response_data = json.loads(response.data)
+    def test_transitions_update_counts(self):
+        self.assertEqual(self.heatmap()['2031-04-01'], {"approved": 0, "pending": 1})
 
-        # Assert that the entries were updated successfully
-        self.assertEqual(response_data["message"], "Entries updated successfully")
+        self.app.put('/wfhRequests/approve', json={"request_id": self.request_id, "entry_ids": [self.entry_ids[0]]})
+        self.assertEqual(self.heatmap()['2031-04-01'], {"approved": 1, "pending": 0})
+        self.assertEqual(self.heatmap()['2031-04-02'], {"approved": 0, "pending": 1})
 
-        # Assert that the mock query methods were called correctly
-        mock_wfh_request_entry.query.filter.assert_called_once()  # Ensure filter was called
-        mock_filter_query.all.assert_called_once()  # Ensure all() was called to get the entries
-        self.assertEqual(mock_db_session.commit.call_count, 2)  # Expect two commit() calls
+        self.app.put('/wfhRequests/withdraw', json={
+            "request_id": self.request_id, "entry_ids": [{"entry_id": self.entry_ids[0], "reason": "Back in office"}]
+        })
+        self.assertEqual(self.heatmap()['2031-04-01'], {"approved": 0, "pending": 0})
 
-        # Assert that the function updated the status of the WFHRequest
-        self.assertEqual(mock_request_record.overall_status, Status.WITHDRAWN)
-        self.assertEqual(mock_request_record.notification_status, NotificationStatus.ACKNOWLEDGED)
+        self.app.put('/wfhRequests/cancel', json={"request_id": self.request_id, "entry_ids": [self.entry_ids[1]]})
+        self.assertEqual(self.heatmap()['2031-04-02'], {"approved": 0, "pending": 0})
 
+    def test_rebuild_matches_incremental_counts(self):
+        self.app.put('/wfhRequests/approve', json={"request_id": self.request_id, "entry_ids": [self.entry_ids[1]]})
+        before = self.heatmap()
 
-    @patch('app.db.session')
-    @patch('app.WFHRequestEntry')
-    @patch('app.WFHRequest')
-    def test_auto_reject_requests(self, mock_wfh_request, mock_wfh_request_entry, mock_db_session):
-        # Mock the WFHRequestEntry records (these are the individual entries)
-        mock_wfh_request_entry_1 = MagicMock()
-        mock_wfh_request_entry_2 = MagicMock()
-
-        # Set initial statuses for the entries
-        mock_wfh_request_entry_1.status = Status.PENDING
-        mock_wfh_request_entry_2.status = Status.PENDING
-
-        # Mock the WFHRequest (the overall request)
-        mock_request_record = MagicMock()
-
-        # Set the mock to return a list of matching WFHRequestEntry objects
-        mock_filter_query = MagicMock()
-        mock_filter_query.filter.return_value = mock_filter_query  # Allow method chaining
-        mock_filter_query.all.return_value = [mock_wfh_request_entry_1, mock_wfh_request_entry_2]
-
-        # Mock the WFHRequestEntry query behavior
-        mock_wfh_request_entry.query.filter.return_value = mock_filter_query
-
-        # Mock getting the WFHRequest record for the request_id
-        mock_wfh_request.query.get.return_value = mock_request_record
-
-        # Simulate the PUT request to the /wfhRequests/autoReject endpoint
-        response = self.app.put(
-            '/wfhRequests/autoReject',
-            data=json.dumps({
-                'request_id': 1,
-                'entry_ids': [101, 102]  # Example entry IDs
-            }),
-            content_type='application/json'
+        with db.engine.begin() as conn:
+            occupancy.rebuild(conn)
+        self.assertEqual(self.heatmap(), before)
+
+
+class WFHNotificationCounterTest(unittest.TestCase):
+    requester_id = 990201
+    manager_id = 990202
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+
+        wfh_request = WFHRequest(requester_id=self.requester_id, reporting_manager=self.manager_id, department="CounterTest")
+        wfh_request.entries.append(WFHRequestEntry(entry_date=date(2031, 6, 2), reason="Counter", duration="Full Day", action_reason=""))
+        db.session.add(wfh_request)
+        notifications.record_notification_change(self.requester_id, self.manager_id, None, NotificationStatus.DELIVERED)
+        db.session.commit()
+        self.request_id = wfh_request.request_id
+        self.entry_id = wfh_request.entries[0].entry_id
+
+    def tearDown(self):
+        for wfh_request in db.session.query(WFHRequest).filter_by(department="CounterTest"):
+            db.session.query(AuditTrail).filter_by(request_id=wfh_request.request_id).delete()
+            db.session.delete(wfh_request)
+        db.session.query(NotificationCounter).filter(
+            NotificationCounter.staff_id.in_([self.requester_id, self.manager_id])
+        ).delete()
+        db.session.query(WFHDailyOccupancy).filter_by(department="CounterTest").delete()
+        db.session.commit()
+        self.app_context.pop()
+
+    def unread(self, staff_id):
+        response = self.app.get(f'/wfhRequests/getNotificationsLength/{staff_id}')
+        self.assertEqual(response.status_code, 200)
+        count = json.loads(response.data)['data']
+        # The counter always agrees with a direct count over wfhrequests
+        self.assertEqual(count, notifications.count_unread(staff_id))
+        return count
+
+    def test_counters_follow_transitions(self):
+        self.assertEqual(self.unread(self.manager_id), 1)
+        self.assertEqual(self.unread(self.requester_id), 0)
+
+        self.app.put('/wfhRequests/approve', json={"request_id": self.request_id, "entry_ids": [self.entry_id]})
+        self.assertEqual(self.unread(self.manager_id), 0)
+        self.assertEqual(self.unread(self.requester_id), 1)
+
+        # Opening the inbox marks the request seen
+        self.app.get(f'/wfhRequests/getAll/{self.requester_id}')
+        self.assertEqual(self.unread(self.requester_id), 0)
+
+    def test_unchanged_count_returns_not_modified(self):
+        response = self.app.get(f'/wfhRequests/getNotificationsLength/{self.manager_id}')
+        etag = response.headers['ETag']
+
+        response = self.app.get(f'/wfhRequests/getNotificationsLength/{self.manager_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.app.put('/wfhRequests/approve', json={"request_id": self.request_id, "entry_ids": [self.entry_id]})
+        response = self.app.get(f'/wfhRequests/getNotificationsLength/{self.manager_id}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_opening_inbox_only_marks_viewers_notifications(self):
+        self.app.put('/wfhRequests/approve', json={"request_id": self.request_id, "entry_ids": [self.entry_id]})
+
+        response = self.app.get(f'/wfhRequests/getAll/{self.manager_id}')
+        data = json.loads(response.data)
+        self.assertEqual([item['request_id'] for item in data['data']], [self.request_id])
+        # The approval is still unread for the requester
+        self.assertEqual(self.unread(self.requester_id), 1)
+
+        response = self.app.get(f'/wfhRequests/getAudit/{self.requester_id}')
+        self.assertEqual(json.loads(response.data)['data'][0]['notification_status'], NotificationStatus.EDITED.value)
+        self.assertEqual(self.unread(self.requester_id), 0)
+
+    def test_inbox_pages_with_cursor(self):
+        # Explicit timestamps keep the ordering deterministic on every backend
+        db.session.get(WFHRequest, self.request_id).modified_at = datetime(2031, 1, 2, tzinfo=timezone.utc)
+        extra_ids = []
+        for day in (3, 4, 5):
+            wfh_request = WFHRequest(requester_id=self.requester_id, reporting_manager=self.manager_id, department="CounterTest",
+                                     modified_at=datetime(2031, 1, day, tzinfo=timezone.utc))
+            wfh_request.entries.append(WFHRequestEntry(entry_date=date(2031, 6, day), reason="Counter", duration="Full Day", action_reason=""))
+            db.session.add(wfh_request)
+            notifications.record_notification_change(self.requester_id, self.manager_id, None, NotificationStatus.DELIVERED)
+            db.session.commit()
+            extra_ids.append(wfh_request.request_id)
+        self.assertEqual(self.unread(self.manager_id), 4)
+
+        seen_ids = []
+        response = self.app.get(f'/wfhRequests/getAll/{self.manager_id}?limit=3')
+        data = json.loads(response.data)
+        self.assertEqual(len(data['data']), 3)
+        seen_ids += [item['request_id'] for item in data['data']]
+        # The first page marks the whole inbox seen
+        self.assertEqual(self.unread(self.manager_id), 0)
+
+        response = self.app.get(f'/wfhRequests/getAll/{self.manager_id}?limit=3&cursor={data["next_cursor"]}')
+        data = json.loads(response.data)
+        seen_ids += [item['request_id'] for item in data['data']]
+        self.assertIsNone(data['next_cursor'])
+        self.assertEqual(sorted(seen_ids), sorted(extra_ids + [self.request_id]))
+
+    def test_transition_pushes_events_to_both_parties(self):
+        requester_events = events.subscribe(self.requester_id)
+        manager_events = events.subscribe(self.manager_id)
+        try:
+            # Dispatch in-process even when a broker is configured, so the events reach these queues
+            with patch('events._connection', None):
+                self.app.put('/wfhRequests/approve', json={"request_id": self.request_id, "entry_ids": [self.entry_id]})
+
+            requester_event = requester_events.get_nowait()
+            self.assertEqual(requester_event['delta'], 1)
+            self.assertEqual(requester_event['request']['request_id'], self.request_id)
+            self.assertEqual(requester_event['request']['notification_status'], NotificationStatus.EDITED.value)
+            self.assertEqual(manager_events.get_nowait()['delta'], -1)
+        finally:
+            events.unsubscribe(self.requester_id, requester_events)
+            events.unsubscribe(self.manager_id, manager_events)
+
+    def test_publish_leaves_the_broker_to_the_publisher_thread(self):
+        outgoing = queue.Queue(maxsize=1)
+        with patch('events._connection', MagicMock()), patch('events._outgoing', outgoing), \
+                patch('events._ensure_publisher'), patch('events.producers') as producers:
+            events.publish([{'staff_id': self.requester_id, 'delta': 1}])
+            # A full backlog drops the batch instead of blocking the request
+            events.publish([{'staff_id': self.manager_id, 'delta': 1}])
+
+        producers.__getitem__.assert_not_called()
+        self.assertEqual(outgoing.get_nowait(), [{'staff_id': self.requester_id, 'delta': 1}])
+        self.assertTrue(outgoing.empty())
+
+    def test_stream_starts_with_current_count(self):
+        response = self.app.get(f'/wfhRequests/notifications/stream/{self.manager_id}')
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        first_event = next(response.response).decode()
+        response.close()
+
+        self.assertIn('event: count', first_event)
+        self.assertIn('"unread_count": 1', first_event)
+
+
+@unittest.skipUnless((app.config["SQLALCHEMY_DATABASE_URI"] or "").startswith("postgresql"), "audittrail is only partitioned on PostgreSQL")
+class WFHAuditArchiveTest(unittest.TestCase):
+    department = "AuditArchiveTest"
+
+    def setUp(self):
+        self.app = app.test_client()
+        self.app_context = app.app_context()
+        self.app_context.push()
+        migrations.upgrade(db.engine)
+
+        wfh_request = WFHRequest(requester_id=990501, reporting_manager=990502, department=self.department)
+        db.session.add(wfh_request)
+        db.session.commit()
+        self.request_id = wfh_request.request_id
+
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.previous_archive_dir = app.config["AUDIT_ARCHIVE_DIR"]
+        app.config["AUDIT_ARCHIVE_DIR"] = self.archive_dir.name
+
+    def tearDown(self):
+        app.config["AUDIT_ARCHIVE_DIR"] = self.previous_archive_dir
+        self.archive_dir.cleanup()
+        db.session.rollback()
+        db.session.query(AuditTrail).filter_by(request_id=self.request_id).delete()
+        db.session.query(WFHRequest).filter_by(department=self.department).delete()
+        db.session.commit()
+        with db.engine.begin() as conn:
+            for month in (date(2019, 2, 1), date(2099, 5, 1)):
+                conn.execute(text(f"DROP TABLE IF EXISTS {audit_archive.partition_name(month)}"))
+        self.app_context.pop()
+
+    def add_audit(self, created_at, status=Status.PENDING):
+        audit_trail = AuditTrail(
+            request_id=self.request_id, requester_id=990501, reporting_manager=990502, department=self.department,
+            status=status, created_at=created_at
         )
+        db.session.add(audit_trail)
+        db.session.commit()
+        return audit_trail
+
+    def partition_of(self, audit_trail):
+        return db.session.execute(
+            text("SELECT tableoid::regclass::text FROM audittrail WHERE audit_id = :audit_id"),
+            {"audit_id": audit_trail.audit_id}
+        ).scalar()
+
+    def test_rows_land_in_their_month_partition(self):
+        audit_trail = self.add_audit(datetime.now(timezone.utc))
+
+        self.assertEqual(self.partition_of(audit_trail), audit_archive.partition_name(date.today()))
+
+    def test_create_partition_moves_rows_out_of_the_default_partition(self):
+        audit_trail = self.add_audit(datetime(2099, 5, 10, tzinfo=timezone.utc))
+        self.assertEqual(self.partition_of(audit_trail), audit_archive.DEFAULT_PARTITION)
+        db.session.commit()
+
+        with db.engine.begin() as conn:
+            self.assertTrue(audit_archive.create_partition(conn, date(2099, 5, 1)))
 
-        # Assert that the response status code is 200 (OK)
+        self.assertEqual(self.partition_of(audit_trail), "audittrail_2099_05")
+
+    def test_archive_moves_cold_months_to_files(self):
+        with db.engine.begin() as conn:
+            audit_archive.create_partition(conn, date(2019, 2, 1))
+        old_audits = [
+            self.add_audit(datetime(2019, 2, 10, tzinfo=timezone.utc)),
+            self.add_audit(datetime(2019, 2, 11, tzinfo=timezone.utc), Status.APPROVED),
+        ]
+        recent_audit = self.add_audit(datetime.now(timezone.utc))
+        expected = [serializers.dump_audit_trail(audit_trail) for audit_trail in old_audits]
+        # Detaching a partition waits for open transactions on audittrail, including this session's
+        db.session.commit()
+
+        archived = audit_archive.archive(db.engine, 3, self.archive_dir.name, today=date(2019, 6, 15))
+
+        self.assertEqual(archived, [date(2019, 2, 1)])
+        self.assertIsNone(db.session.execute(text("SELECT to_regclass('audittrail_2019_02')")).scalar())
+        entry, = audit_archive.load_manifest(self.archive_dir.name)["archives"]
+        self.assertEqual((entry["month"], entry["rows"]), ("2019-02", 2))
+        self.assertTrue(os.path.exists(os.path.join(self.archive_dir.name, entry["file"])))
+
+        # Live lookups keep the recent row only; the archive API serves the rest as they were
+        live = json.loads(self.app.get(f'/wfhRequests/getAuditTrail/{self.request_id}').data)["data"]
+        self.assertEqual([row["audit_id"] for row in live], [recent_audit.audit_id])
+        response = self.app.get(f'/wfhRequests/getAuditTrail/{self.request_id}/archive')
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data)["data"], json.loads(json.dumps(expected)))
 
-        # Parse the JSON response data
-        response_data = json.loads(response.data)
+        response = self.app.get(f'/wfhRequests/getAuditTrail/{self.request_id}/archive?from=2019-03')
+        self.assertEqual(json.loads(response.data)["data"], [])
+
+    def test_archive_rejects_malformed_months(self):
+        response = self.app.get(f'/wfhRequests/getAuditTrail/{self.request_id}/archive?from=2019-2-1')
+
+        self.assertEqual(response.status_code, 400)
 
-        # Assert that the entries were updated successfully
-        self.assertEqual(response_data["message"], "Entries updated successfully to AUTO_REJECTED")
 
-        # Assert that the mock query methods were called correctly
-        mock_wfh_request_entry.query.filter.assert_called_once()  # Ensure filter was called
-        mock_filter_query.all.assert_called_once()  # Ensure all() was called to get the entries
-        self.assertEqual(mock_db_session.commit.call_count, 2)  # Expect two commit() calls
+class ReplicaRoutingTest(unittest.TestCase):
+    """Reads go to the replica and writes to the primary, using two SQLite files."""
 
-        # Assert that the statuses of the WFHRequestEntry records were updated to AUTO_REJECTED
-        self.assertEqual(mock_wfh_request_entry_1.status, Status.AUTO_REJECTED)
-        self.assertEqual(mock_wfh_request_entry_2.status, Status.AUTO_REJECTED)
+    def setUp(self):
+        self.db_dir = tempfile.TemporaryDirectory()
+        self.replica_app = Flask(__name__)
+        self.replica_app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{self.db_dir.name}/primary.db"
+        replica.init_app(self.replica_app, f"sqlite:///{self.db_dir.name}/replica.db")
+        db.init_app(self.replica_app)
+
+        @self.replica_app.route("/occupancy", methods=["GET", "POST"])
+        def occupancy_rows():
+            if request.method == "POST":
+                db.session.add(WFHDailyOccupancy(department="Replica", entry_date=date(2031, 9, 1)))
+                db.session.commit()
+            return {"rows": db.session.query(WFHDailyOccupancy).count()}
+
+        @self.replica_app.route("/occupancy/primary", methods=["GET"])
+        @replica.primary
+        def primary_occupancy_rows():
+            return {"rows": db.session.query(WFHDailyOccupancy).count()}
+
+        with self.replica_app.app_context():
+            for engine in db.engines.values():
+                WFHDailyOccupancy.__table__.create(engine)
+        self.client = self.replica_app.test_client()
+
+    def tearDown(self):
+        with self.replica_app.app_context():
+            for engine in db.engines.values():
+                engine.dispose()
+        self.db_dir.cleanup()
 
-        # Assert that the function updated the overall status of the WFHRequest
-        self.assertEqual(mock_request_record.overall_status, Status.AUTO_REJECTED)
-        self.assertEqual(mock_request_record.notification_status, NotificationStatus.AUTO_REJECTED)
+    def rows(self, url="/occupancy"):
+        return json.loads(self.client.get(url).data)["rows"]
 
+    def test_reads_use_the_replica_until_the_client_writes(self):
+        with self.replica_app.app_context():
+            db.session.add(WFHDailyOccupancy(department="Replica", entry_date=date(2031, 9, 2)))
+            db.session.commit()
 
+        # Outside a request the primary is used, and the replica has not caught up
+        self.assertEqual(self.rows(), 0)
+        self.assertEqual(self.rows("/occupancy/primary"), 1)
 
+        response = self.client.post("/occupancy")
+        self.assertEqual(json.loads(response.data)["rows"], 2)
+        pin = response.headers[replica.PIN_HEADER]
+        # The client's next reads see its own write while it echoes the header
+        self.assertEqual(json.loads(self.client.get("/occupancy", headers={replica.PIN_HEADER: pin}).data)["rows"], 2)
+        self.assertEqual(self.rows(), 0)
+
+    def test_pin_header_is_exposed_to_cross_origin_clients(self):
+        response = app.test_client().put('/wfhRequests/approve', json={}, headers={"Origin": "http://localhost:3000"})
+        self.assertIn(replica.PIN_HEADER, response.headers.get("Access-Control-Expose-Headers", ""))
 
 
 if __name__ == '__main__':
     unittest.main()
+
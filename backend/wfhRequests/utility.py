@@ -1,25 +1,70 @@
-from datetime import datetime, timedelta
-import pytz
+from datetime import datetime, time, timedelta, timezone
+import base64
+from sqlalchemy.dialects import postgresql, sqlite
+import workcalendar
 
-sg_timezone = pytz.timezone('Asia/Singapore')
+sg_timezone = timezone(timedelta(hours=8))
 
-# Helper function to get the previous working day at 00:00
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Helper function to get the previous working day at 00:00, skipping weekends and public holidays
 def get_previous_working_day(date):
-    # Subtract a day from the date
-    previous_day = date - timedelta(days=1)
-    
-    # If the previous day is Saturday (5), skip to Friday
-    if previous_day.weekday() == 5:  # Saturday
-        previous_day -= timedelta(days=1)
-    # If the previous day is Sunday (6), skip to Friday
-    elif previous_day.weekday() == 6:  # Sunday
-        previous_day -= timedelta(days=2)
-    
-    # # Set time to 00:00 for the previous working day
-    previous_day = previous_day.replace(hour=0, minute=0, second=0, microsecond=0)
-    
-    # Localize to Singapore time
-    previous_day = sg_timezone.localize(previous_day)
-    
-    return previous_day
+    previous_day = workcalendar.default_calendar().previous_working_day(date.date() if isinstance(date, datetime) else date)
+    # Singapore has kept a fixed +08:00 offset since 1982, so there is nothing for pytz to look up
+    return datetime.combine(previous_day, time(), tzinfo=sg_timezone)
+
+
+# Keyset pagination cursors are an opaque encoding of the (modified_at, request_id)
+# pair of the last row on the previous page
+def encode_cursor(modified_at, request_id):
+    raw = f"{modified_at.isoformat()}|{request_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        modified_at, request_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(modified_at), int(request_id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def parse_page_size(value):
+    if value is None:
+        return DEFAULT_PAGE_SIZE
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_date_range(start, end, max_days):
+    try:
+        start_date = datetime.strptime(start or '', '%Y-%m-%d').date()
+        end_date = datetime.strptime(end or '', '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError("start and end are required in YYYY-MM-DD format")
+
+    if end_date < start_date:
+        raise ValueError("end must not be before start")
+    if (end_date - start_date).days >= max_days:
+        raise ValueError(f"Date range cannot exceed {max_days} days")
+    return start_date, end_date
+
+
+def upsert_increments(session, model, rows, keys, counters):
+    """Add the counter values in rows onto existing rows with the same keys, inserting missing ones.
 
+    Runs as a single INSERT ... ON CONFLICT DO UPDATE, so concurrent writers never lose increments.
+    """
+    if not rows:
+        return
+    insert = postgresql.insert if session.get_bind().dialect.name == 'postgresql' else sqlite.insert
+    stmt = insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={column: getattr(model, column) + getattr(stmt.excluded, column) for column in counters}
+    )
+    session.execute(stmt, rows)
@@ -0,0 +1,126 @@
+"""Working days in Singapore: weekdays that are not public holidays.
+
+A WorkCalendar covers whole years, from first_year to last_year. It is built
+once into arrays with one slot per day of that span, so every question below is
+answered with an array lookup or two:
+
+- working_before[i]: working days before day i, a prefix sum for range counts,
+- previous[i] and following[i]: the nearest working day before and after day i.
+
+Public holidays, including the days off in lieu of holidays that fall on a
+Sunday, are read from sg_public_holidays.csv. Years the file does not list yet
+only skip weekends, so the file needs extending as MOM gazettes each year.
+Days outside the span are answered the same way, from the weekday alone.
+"""
+import csv
+import functools
+import os
+from array import array
+from datetime import date, timedelta
+
+HOLIDAYS_FILE = os.getenv("WORK_CALENDAR_HOLIDAYS", os.path.join(os.path.dirname(__file__), "sg_public_holidays.csv"))
+FIRST_YEAR = int(os.getenv("WORK_CALENDAR_FIRST_YEAR", 2020))
+LAST_YEAR = int(os.getenv("WORK_CALENDAR_LAST_YEAR", 2040))
+
+
+def load_holidays(path=HOLIDAYS_FILE):
+    """Map each holiday in the CSV at path to its name."""
+    with open(path, newline="") as holidays_file:
+        return {date.fromisoformat(row["date"]): row["name"] for row in csv.DictReader(holidays_file)}
+
+
+class WorkCalendar:
+    def __init__(self, first_year, last_year, holidays=None):
+        self.first_day = date(first_year, 1, 1)
+        self.last_day = date(last_year, 12, 31)
+        self.holidays = dict(holidays or {})
+        size = (self.last_day - self.first_day).days + 1
+
+        # One extra slot so a range can end on last_day
+        self.working_before = array("i", [0]) * (size + 1)
+        # -1 and size stand for "outside the span"
+        self.previous = array("i", [-1]) * size
+        self.following = array("i", [size]) * size
+
+        last_working = -1
+        for offset in range(size):
+            day = self.first_day + timedelta(days=offset)
+            working = day.weekday() < 5 and day not in self.holidays
+            self.previous[offset] = last_working
+            self.working_before[offset + 1] = self.working_before[offset] + working
+            if working:
+                last_working = offset
+        next_working = size
+        for offset in range(size - 1, -1, -1):
+            self.following[offset] = next_working
+            if self.working_before[offset + 1] > self.working_before[offset]:
+                next_working = offset
+
+    def _offset(self, day):
+        return (day - self.first_day).days
+
+    def _covers(self, day):
+        return self.first_day <= day <= self.last_day
+
+    def is_working_day(self, day):
+        if not self._covers(day):
+            return day.weekday() < 5
+        offset = self._offset(day)
+        return self.working_before[offset + 1] > self.working_before[offset]
+
+    def previous_working_day(self, day):
+        """The last working day before day."""
+        if self._covers(day) and self.previous[self._offset(day)] >= 0:
+            return self.first_day + timedelta(days=self.previous[self._offset(day)])
+        # Outside the span, or no working day before it within the span
+        day -= timedelta(days=1)
+        while not self.is_working_day(day):
+            day -= timedelta(days=1)
+        return day
+
+    def next_working_day(self, day):
+        """The first working day after day."""
+        if self._covers(day) and self.following[self._offset(day)] < len(self.following):
+            return self.first_day + timedelta(days=self.following[self._offset(day)])
+        day += timedelta(days=1)
+        while not self.is_working_day(day):
+            day += timedelta(days=1)
+        return day
+
+    def working_days_between(self, start, end):
+        """Number of working days from start to end, both included."""
+        count = (_weekdays_between(start, min(end, self.first_day - timedelta(days=1)))
+                 + _weekdays_between(max(start, self.last_day + timedelta(days=1)), end))
+        start, end = max(start, self.first_day), min(end, self.last_day)
+        if start <= end:
+            count += self.working_before[self._offset(end) + 1] - self.working_before[self._offset(start)]
+        return count
+
+    def working_days(self, start, end):
+        """Working days from start to end, both included, in order."""
+        days = _weekdays(start, min(end, self.first_day - timedelta(days=1)))
+        offset, last = self._offset(max(start, self.first_day)), self._offset(min(end, self.last_day))
+        if offset <= last and not self.working_before[offset + 1] > self.working_before[offset]:
+            offset = self.following[offset]
+        while offset <= last:
+            days.append(self.first_day + timedelta(days=offset))
+            offset = self.following[offset]
+        days.extend(_weekdays(max(start, self.last_day + timedelta(days=1)), end))
+        return days
+
+
+def _weekdays_between(start, end):
+    """Number of weekdays from start to end, both included."""
+    if start > end:
+        return 0
+    weeks, extra_days = divmod((end - start).days + 1, 7)
+    return weeks * 5 + sum((start.weekday() + i) % 7 < 5 for i in range(extra_days))
+
+
+def _weekdays(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1) if (start + timedelta(days=i)).weekday() < 5]
+
+
+@functools.lru_cache(maxsize=None)
+def default_calendar():
+    return WorkCalendar(FIRST_YEAR, LAST_YEAR, load_holidays())
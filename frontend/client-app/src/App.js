@@ -39,45 +39,46 @@ function App() {
   const user = useSelector(selectUser);
   let userRole = "";
   let userPosition = "";
-  const [notificationsLength, setNotificationsLength] = useState(0);
+  const [wfhNotificationsLength, setWfhNotificationsLength] = useState(0);
+  const [delegateNotificationsLength, setDelegateNotificationsLength] = useState(0);
+  const notificationsLength = wfhNotificationsLength + delegateNotificationsLength;
 
+  // Both counts are kept current by the notification stream below; the delegation count
+  // is fetched once here because the stream's opening count covers WFH requests only
   const getNotifications = useCallback(async () => {
-    if (user?.staff_id) {
+    if (user?.staff_id && user?.role !== 2) {
       try {
-        // Fetch the first notifications
-        const firstResponse = await axios.get(
-          `https://scrumdaddybackend.studio/wfhRequests/getNotificationsLength/${user?.staff_id}`
+        const response = await axios.get(
+          `https://scrumdaddybackend.studio/employees/getDelegateNotiLength/${user?.staff_id}`
         );
-  
-        let totalNotificationsLength = 0;
-  
-        // Set the first notification length
-        if (firstResponse) {
-          totalNotificationsLength = firstResponse.data.data;
+        if (response) {
+          setDelegateNotificationsLength(response.data.data);
         }
-  
-        // Conditionally fetch the second notifications if user role is not 2
-        if (user?.role !== 2) {
-          const secondResponse = await axios.get(
-            `https://scrumdaddybackend.studio/employees/getDelegateNotiLength/${user?.staff_id}`
-          );
-  
-          // Add second response to the notifications length
-          if (secondResponse) {
-            totalNotificationsLength += secondResponse.data.data;
-          }
-        }
-  
-        // Set the total notifications length
-        setNotificationsLength(totalNotificationsLength);
       } catch (error) {
         console.error("Error fetching notifications:", error);
       }
     }
   }, [user?.staff_id, user?.role]);
-  
-  
-  
+
+  useEffect(() => {
+    if (!user?.staff_id) {
+      setWfhNotificationsLength(0);
+      return;
+    }
+    // Every (re)connect starts with the current count, then each change arrives as a delta
+    const stream = new EventSource(
+      `https://scrumdaddybackend.studio/wfhRequests/notifications/stream/${user.staff_id}`
+    );
+    stream.addEventListener("count", (event) => {
+      setWfhNotificationsLength(JSON.parse(event.data).unread_count);
+    });
+    stream.addEventListener("notification", (event) => {
+      const { type, delta } = JSON.parse(event.data);
+      const setLength = type === "delegate" ? setDelegateNotificationsLength : setWfhNotificationsLength;
+      setLength((length) => Math.max(length + delta, 0));
+    });
+    return () => stream.close();
+  }, [user?.staff_id]);
 
   if (user !== null) {
     userRole = user.role;
@@ -94,10 +95,7 @@ function App() {
     <>
       <Router>
         <div>
-          <NavBar
-            notificationsLength={notificationsLength}
-            getNotifications={getNotifications}
-          />
+          <NavBar notificationsLength={notificationsLength} />
           <Routes>
             <Route path="/" element={user ? <Home /> : <Login />} />
             <Route path="/login" element={user ? <Home /> : <Login />} />
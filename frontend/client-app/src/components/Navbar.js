@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from "react";
-import { Link, useNavigate, useLocation } from "react-router-dom";
+import React, { useState } from "react";
+import { Link, useNavigate } from "react-router-dom";
 import { useSelector, useDispatch } from "react-redux";
 import { selectUser, logout } from "../redux/userSlice";
 import IconButton from "@mui/material/IconButton";
@@ -10,7 +10,7 @@ import MenuItem from '@mui/material/MenuItem';
 import Fade from '@mui/material/Fade';
 import Button from '@mui/material/Button';
 
-const NavBar = ({ notificationsLength, getNotifications }) => {
+const NavBar = ({ notificationsLength }) => {
   const [isOpen, setIsOpen] = useState(false);
   const dispatch = useDispatch();
   const user = useSelector(selectUser);
@@ -20,7 +20,6 @@ const NavBar = ({ notificationsLength, getNotifications }) => {
   const [anchorEl1, setAnchorEl1] = React.useState(null);
   const open = Boolean(anchorEl);
   const open1 = Boolean(anchorEl1);
-  const location = useLocation(); // Track route changes
 
   const handleOpenClick = (events) => {
     setAnchorEl1(events.currentTarget);
@@ -46,11 +45,6 @@ const NavBar = ({ notificationsLength, getNotifications }) => {
     navigate("/login");
   };
 
-  useEffect(() => {
-    if (user) {
-      getNotifications(); // Only call once
-    }
-  }, [user, location, getNotifications]); // Combine user and location as dependencies
 
   return (
     <nav className="bg-black text-white fixed z-50 top-0 w-full">
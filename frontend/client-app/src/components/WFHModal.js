@@ -220,27 +220,21 @@ const WFHModal = ({open, onClose}) => {
 
   const checkExistingRequests = async () => {
     try {
+      const dates = formData.entries.map((entry) => entry.entry_date).sort();
       const response = await axios.get(
-        `https://scrumdaddybackend.studio/wfhRequests/staff/${user.staff_id}`
+        `https://scrumdaddybackend.studio/wfhRequests/requester/${user.staff_id}/dates`,
+        { params: { start: dates[0], end: dates[dates.length - 1] } }
       );
-      const existingRequests = response.data.data;
-
-      for (let entry of formData.entries) {
-        const matchedRequest = existingRequests.find((request) =>
-          request.entries.some(
-            (r) =>
-              r.entry_date === entry.entry_date &&
-              (r.status === "Pending" || r.status === "Approved")
-          )
+      const occupiedDates = new Set(response.data.data);
+
+      const takenDate = dates.find((date) => occupiedDates.has(date));
+      if (takenDate) {
+        setSnackbarMessage(
+          `You already have a pending or approved request for this date: ${takenDate}`
         );
-        if (matchedRequest) {
-          setSnackbarMessage(
-            `You already have a pending or approved request for this date: ${entry.entry_date}`
-          );
-          setSnackbarSeverity("error");
-          setOpenSnackbar(true);
-          return false; // If match is found, stop submission.
-        }
+        setSnackbarSeverity("error");
+        setOpenSnackbar(true);
+        return false; // If match is found, stop submission.
       }
       return true; // If no matches found, allow submission.
     } catch (error) {
@@ -288,7 +282,13 @@ const WFHModal = ({open, onClose}) => {
         
       } catch (error) {
         console.error("Error submitting WFH request:", error);
-        setSnackbarMessage("Error submitting request, please try again.");
+        // The server refuses repeated dates and dates held by another pending or approved request
+        const data = error.response?.data;
+        setSnackbarMessage(
+          data?.dates
+            ? `${data.error}: ${data.dates.join(", ")}`
+            : "Error submitting request, please try again."
+        );
         setSnackbarSeverity("error");
         setOpenSnackbar(true);
       }
@@ -1,5 +1,6 @@
 import React from "react";
 import ReactDOM from "react-dom/client";
+import axios from "axios";
 import "./index.css";
 import { Provider } from "react-redux"; // Import the Provider
 import App from "./App";
@@ -8,6 +9,24 @@ import { PersistGate } from 'redux-persist/integration/react';
 import reportWebVitals from "./reportWebVitals";
 import ErrorBoundary from "./components/ErrorBoundary";
 
+// After a write the backend returns Read-Primary-Until; echoing it keeps this client's
+// reads on the primary database until then, so it sees its own changes despite replica lag
+const READ_PRIMARY_HEADER = "read-primary-until";
+let readPrimaryUntil = 0;
+axios.interceptors.response.use((response) => {
+  const until = Number(response.headers[READ_PRIMARY_HEADER]);
+  if (until > readPrimaryUntil) {
+    readPrimaryUntil = until;
+  }
+  return response;
+});
+axios.interceptors.request.use((config) => {
+  if (readPrimaryUntil > Date.now() / 1000) {
+    config.headers[READ_PRIMARY_HEADER] = String(readPrimaryUntil);
+  }
+  return config;
+});
+
 const root = ReactDOM.createRoot(document.getElementById("root"));
 root.render(
   <React.StrictMode>
@@ -35,43 +35,59 @@ dayjs.extend(isToday);
 
 const AttendanceCalendar = () => {
   const [employees, setEmployees] = useState([]);
-  const [transformedData, setTransformedData] = useState({}); // Bind transformedData to state
+  const [transformedData, setTransformedData] = useState({}); // Attendance records keyed by date
   const [selectedDate, setSelectedDate] = useState(dayjs());
   const selectedDateString = selectedDate.format('YYYY-MM-DD'); 
   console.log(selectedDateString);
 
-   // Fetch data whenever the selectedDate changes
+  // Whole weeks around the selected month, so the monthly, weekly and daily views need no further calls
+  const rangeStart = selectedDate.startOf('month').startOf('week').format('YYYY-MM-DD');
+  const rangeEnd = selectedDate.endOf('month').endOf('week').format('YYYY-MM-DD');
+
+   // Fetch the whole range in one call whenever it changes
    useEffect(() => {
     const fetchData = async () => {
       try {
-        const response = await axios.get(`https://scrumdaddybackend.studio/attendance/`, {
+        const response = await axios.get(`https://scrumdaddybackend.studio/attendance/range`, {
           params: {
-            date: selectedDateString, 
+            start: rangeStart,
+            end: rangeEnd,
           },
         });
-        const employees = response.data.data;
-        setEmployees(employees);
-        console.log(employees);
+        const { employees: directory, days } = response.data.data;
+
+        // Expand each day's rosters into the same records /attendance/ returns for a single date
+        const transformed = {};
+        Object.entries(days).forEach(([date, roster]) => {
+          transformed[date] = [
+            ...roster.wfh.map((record) => ({
+              ...record,
+              date,
+              employee_name: directory[record.requester_id]?.name,
+              dept: directory[record.requester_id]?.dept,
+              workingFromHome: true,
+            })),
+            ...roster.office.map((staffId) => ({
+              request_id: null,
+              requester_id: staffId,
+              duration: null,
+              reason: null,
+              date: null,
+              employee_name: directory[staffId]?.name,
+              dept: directory[staffId]?.dept,
+              workingFromHome: false,
+            })),
+          ];
+        });
+        setEmployees(Object.values(directory));
+        setTransformedData(transformed);
+        console.log('Transformed Data:', transformed);
       } catch (error) {
         console.error('Error fetching attendance data:', error);
       }
     };
     fetchData();
-  }, [selectedDateString]);
-
-  // Transform employees data into a structured object (by date) whenever employees change
-  useEffect(() => {
-    const transformed = employees.reduce((acc, employee) => {
-      const { date } = employee;
-      if (!acc[date]) {
-        acc[date] = [];
-      }
-      acc[date].push(employee);
-      return acc;
-    }, {});
-    setTransformedData(transformed); // Update the transformedData state
-    console.log('Transformed Data:', transformed);
-  }, [employees]);
+  }, [rangeStart, rangeEnd]);
 
   console.log('Transformed Data:', transformedData);
 
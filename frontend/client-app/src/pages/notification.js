@@ -21,6 +21,9 @@ import PersonAddAltOutlinedIcon from "@mui/icons-material/PersonAddAltOutlined";
 const Notification = ({ getNotifications }) => {
   const [employeeDetails, setEmployeeDetails] = useState({});
   const [allNotifications, setAllNotifications] = useState();
+  // Set while the inbox has older notifications than those loaded so far
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [deleNotifications, setDeleNotifications] = useState();
   const [loading, setLoading] = useState(true); // Loading state
   const user = useSelector(selectUser);
@@ -49,14 +52,19 @@ const Notification = ({ getNotifications }) => {
     return null; // Return null if no data
   };
 
-  const getAllNotifications = useCallback(async () => {
+  // Without a cursor this loads the newest page; with one it appends the next older page
+  const getAllNotifications = useCallback(async (cursor) => {
     try {
       const response = await axios.get(
-        `https://scrumdaddybackend.studio/wfhRequests/getAll/${user?.staff_id}`
+        `https://scrumdaddybackend.studio/wfhRequests/getAll/${user?.staff_id}`,
+        { params: cursor ? { cursor } : {} }
       );
       if (response) {
         const notifications = response.data.data;
-        setAllNotifications(notifications);
+        setAllNotifications((previous) =>
+          cursor ? [...previous, ...notifications] : notifications
+        );
+        setNextCursor(response.data.next_cursor);
 
         const employeePromises = [];
         const staffIds = new Set();
@@ -191,6 +199,12 @@ const Notification = ({ getNotifications }) => {
     }
   }, [user?.staff_id, getNotifications, employeeDetails]);
 
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    await getAllNotifications(nextCursor);
+    setLoadingMore(false);
+  };
+
   const handleChangePage = (event, newPage) => {
     setPage(newPage);
   };
@@ -258,7 +272,8 @@ const Notification = ({ getNotifications }) => {
                     <TableRow className="bg-gray-200">
                       <TableCell>
                         <span className="font-bold">
-                          Total: ({allNotifications.length})
+                          Total: ({allNotifications.length}
+                          {nextCursor ? "+" : ""})
                         </span>
                       </TableCell>
                     </TableRow>
@@ -360,6 +375,13 @@ const Notification = ({ getNotifications }) => {
                 onPageChange={handleChangePage}
                 onRowsPerPageChange={handleChangeRowsPerPage}
               />
+              {nextCursor && (
+                <Box sx={{ display: "flex", justifyContent: "center" }}>
+                  <Button onClick={handleLoadMore} disabled={loadingMore}>
+                    {loadingMore ? "Loading..." : "Load older notifications"}
+                  </Button>
+                </Box>
+              )}
             </div>
           )}
           {tabValue === 1 && (
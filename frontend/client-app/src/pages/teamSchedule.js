@@ -28,16 +28,15 @@ useEffect(() => {
 
     const fetchData = async () => {
       try {
+        // Staff and managers only see their own department, which the server filters for them
+        const departmentOnly = user.userInfo.role === 3 || user.userInfo.role === 2;
         const response = await axios.get(`https://scrumdaddybackend.studio/attendance/`, {
           params: {
             date: selectedDateString,
+            ...(departmentOnly && { dept: user.userInfo.dept }),
           },
         });
-        let employees = response.data.data;
-        // Filter employees based on role
-        if (user.userInfo.role === 3 || user.userInfo.role === 2) {
-          employees = employees.filter(emp => emp.dept === user.userInfo.dept);
-        }
+        const employees = response.data.data;
         setEmployees(employees);
         console.log(employees);
       } catch (error) {